@@ -0,0 +1,88 @@
+from typing import Any, List, Tuple
+
+import telebot.types as types
+from psycopg import AsyncCursor
+
+from admin_db_tools import DEF_LANG
+from tools.async_cursor_tool import cursor as async_cursor_decorator
+from tools.lang_cache import lang_cache
+from tools.logger_tool import logger, logger_decorator
+
+
+class AsyncInterface:
+    """Interface of the asyncio runtime, see tools.async_runtime. Its
+    methods are coroutines doing what the Interface methods of the same
+    names do.
+    """
+
+    def __init__(self, data_to_read: types.Message | types.CallbackQuery):
+        self.data_to_read = data_to_read
+        logger.info(f"AsyncInterface instance initialized with {type(self.data_to_read)}.")
+
+    @async_cursor_decorator
+    @logger_decorator
+    async def is_admin(self, curs: AsyncCursor) -> str:
+        """Check if user is Admin.
+
+        Args:
+            curs: Cursor object from psycopg.
+
+        Returns:
+            Admin Telegram username if the user is Admin, empty string
+            otherwise.
+
+        """
+        await curs.execute(
+            "SELECT admin_username FROM admins WHERE admin_id = %s",
+            (self.data_to_read.from_user.id,)
+        )
+        if admin := await curs.fetchone():
+            return admin[0]
+        return ""
+
+    async def get_admin_lang(self) -> str:
+        """Get code of Admins's chosen language, from the language cache
+        if it has one.
+
+        Returns:
+            Code of Admins's chosen language if Admin has chosen
+            one, otherwise default language code, set in .env.
+
+        """
+        admin_id = self.data_to_read.from_user.id
+        if (lang := lang_cache.get("admin", admin_id)) is None:
+            lang = await self._read_admin_lang()
+            lang_cache.set("admin", admin_id, lang)
+        return lang
+
+    @async_cursor_decorator
+    @logger_decorator
+    async def _read_admin_lang(self, curs: AsyncCursor) -> str:
+        await curs.execute(
+            "SELECT lang_code FROM admins WHERE admin_id = %s",
+            (self.data_to_read.from_user.id,)
+        )
+        lang = DEF_LANG
+        if adm_lang := await curs.fetchone():
+            lang = adm_lang[0] or lang
+        return lang
+
+    @staticmethod
+    @async_cursor_decorator
+    @logger_decorator
+    async def get_couriers(curs: AsyncCursor) -> List[Tuple[Any, ...]]:
+        """Get payment info about couriers from database.
+
+        Args:
+            curs: Cursor object from psycopg.
+
+        Returns:
+            Array containing couriers Telegram IDs, Names, current
+            balance, PayPal IDs and language codes.
+
+        """
+        await curs.execute(
+            "SELECT courier_id, courier_username, courier_legal_name, account_balance, paypal_id, "
+            "lang_code FROM couriers WHERE account_balance > 0.00"
+        )
+        return await curs.fetchall()
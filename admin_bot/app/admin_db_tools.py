@@ -5,6 +5,7 @@ from environs import Env
 from psycopg2.extensions import cursor
 
 from tools.cursor_tool import cursor as cursor_decorator
+from tools.lang_cache import lang_cache
 from tools.logger_tool import logger, logger_decorator
 
 env = Env()
@@ -39,6 +40,7 @@ class Interface:
             return admin[0]
         return admin
 
+    @lang_cache.cached("admin", lambda interface: interface.data_to_read.from_user.id)
     @cursor_decorator
     @logger_decorator
     def get_admin_lang(self, curs: cursor) -> str:
@@ -77,7 +79,7 @@ class Interface:
         """
         curs.execute(
             "SELECT courier_id, courier_username, courier_legal_name, account_balance, paypal_id, "
-            "lang_code FROM couriers WHERE account_balance != 0.00"
+            "lang_code FROM couriers WHERE account_balance > 0.00"
         )
         couriers = curs.fetchall()
         return couriers
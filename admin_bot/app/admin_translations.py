@@ -15,7 +15,13 @@ texts = {
                      f"Courier: {courier[2]}\n" \
                      f"Telegram Username: `@{courier[1]}`\n" \
                      f"Telegram ID: {courier[0]}\n" \
-                     f"Amount: €{courier[3]}"
+                     f"Amount: €{courier[3]}",
+        "PAYOUT_PENDING_MSG": lambda
+            courier, batch_id: f"Payment still pending, check it in PayPal:\n" \
+                               f"Payout batch ID: `{batch_id}`\n" \
+                               f"Courier: {courier[2]}\n" \
+                               f"Telegram ID: {courier[0]}\n" \
+                               f"Amount: €{courier[3]}"
     },
     "de_DE": {
         "WELCOME_MSG": "Willkommen zurück!",
@@ -33,7 +39,13 @@ texts = {
                      f"Kurier: {courier[2]}\n" \
                      f"Telegram-Benutzername: `@{courier[1]}`\n" \
                      f"Telegram-ID: {courier[0]}\n" \
-                     f"Betrag: €{courier[3]}"
+                     f"Betrag: €{courier[3]}",
+        "PAYOUT_PENDING_MSG": lambda
+            courier, batch_id: f"Zahlung noch ausstehend, bitte in PayPal prüfen:\n" \
+                               f"Auszahlungs-ID: `{batch_id}`\n" \
+                               f"Kurier: {courier[2]}\n" \
+                               f"Telegram-ID: {courier[0]}\n" \
+                               f"Betrag: €{courier[3]}"
     },
     "ru_RU": {
         "WELCOME_MSG": "С возвращением!",
@@ -51,5 +63,11 @@ texts = {
                      f"Курьер: {courier[2]}\n" \
                      f"Имя пользователя Telegram: `@{courier[1]}`\n" \
                      f"Telegram ID: {courier[0]}\n" \
-                     f"Сумма: €{courier[3]}"}
+                     f"Сумма: €{courier[3]}",
+        "PAYOUT_PENDING_MSG": lambda
+            courier, batch_id: f"Оплата всё ещё в обработке, проверьте её в PayPal:\n" \
+                               f"ID выплаты: `{batch_id}`\n" \
+                               f"Курьер: {courier[2]}\n" \
+                               f"Telegram ID: {courier[0]}\n" \
+                               f"Сумма: €{courier[3]}"}
 }
\ No newline at end of file
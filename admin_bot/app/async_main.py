@@ -0,0 +1,82 @@
+import telebot.types as types
+
+import tools.async_pp_tools as async_paypal
+from admin_translations import texts as texts
+from admin_async_db_tools import AsyncInterface as DBInterface
+from payroll_worker import payroll_worker
+from tools import async_runtime, metrics
+from tools.async_cursor_tool import unit_of_work
+from tools.logger_tool import logger, logger_decorator_msg
+
+adm_bot = async_runtime.create_bot("ADMIN_BOT_TOKEN")
+sender = async_runtime.sender
+
+
+@adm_bot.message_handler(commands=["start"])
+@unit_of_work()
+@logger_decorator_msg
+async def start_command(message: types.Message) -> None:
+    """Process /start command.
+
+    Args:
+        message: /start command message.
+
+    """
+    msg = DBInterface(message)
+    if not await msg.is_admin():
+        await adm_bot.send_message(
+            msg.data_to_read.from_user.id,
+            texts[await msg.get_admin_lang()]["NOT_REG_MSG"]
+        )
+        return None
+    await adm_bot.send_message(
+        msg.data_to_read.from_user.id,
+        texts[await msg.get_admin_lang()]["WELCOME_MSG"]
+    )
+
+
+# No unit of work here: balances are deducted and committed before each
+# payout batch is sent to PayPal, so no transaction may stay open around it.
+@adm_bot.message_handler(commands=["pay_salaries"])
+@logger_decorator_msg
+async def pay_salaries_command(message: types.Message) -> None:
+    """Process /pay_salaries command. Pay all Couriers with PayPal
+    payout batches, which are followed by the payroll worker.
+
+    Args:
+        message: /pay_salaries command message.
+
+    """
+    msg = DBInterface(message)
+    admin_id = msg.data_to_read.from_user.id
+    admin_lang = await msg.get_admin_lang()
+    if not await msg.is_admin():
+        await adm_bot.send_message(admin_id, texts[admin_lang]["NOT_REG_MSG"])
+        return None
+    couriers = await msg.get_couriers()
+    if not couriers:
+        await adm_bot.send_message(admin_id, texts[admin_lang]["NO_COURIERS_MSG"])
+        return None
+    _, rejected, unknown = await async_paypal.pp_couriers_payout(couriers, admin_id)
+    for courier in rejected:
+        await sender.send(
+            adm_bot.send_message,
+            admin_id,
+            texts[admin_lang]["PAYMENT_FAILED_MSG"](courier)
+        )
+    for sender_batch_id, batch_couriers in unknown.items():
+        for courier in batch_couriers:
+            await sender.send(
+                adm_bot.send_message,
+                admin_id,
+                texts[admin_lang]["PAYOUT_PENDING_MSG"](courier, sender_batch_id)
+            )
+
+
+def main():
+    logger.info("Bot is running on asyncio runtime")
+    metrics.start_reporter()
+    # Payroll runs are followed on a thread, as by the threaded runtime.
+    payroll_worker.start()
+    async_runtime.on_stop(async_paypal.paypal_client.close)
+    async_runtime.run({"admin": adm_bot})
@@ -3,11 +3,17 @@ import telebot.types as types
 import tools.pp_tools as paypal
 from admin_translations import texts as texts
 from admin_db_tools import Interface as DBInterface
+from payroll_worker import payroll_worker
+from tools import bot_runner, metrics
+from tools.cursor_tool import unit_of_work
 from tools.logger_tool import logger, logger_decorator_msg
-from tools.bots_initialization import adm_bot, courier_bot
+from tools.bots_initialization import adm_bot, send_queue
+
+bot_runner.on_start(payroll_worker.start)
 
 
 @adm_bot.message_handler(commands=["start"])
+@unit_of_work()
 @logger_decorator_msg
 def start_command(message: types.Message) -> None:
     """Process /start command.
@@ -29,10 +35,13 @@ def start_command(message: types.Message) -> None:
     )
 
 
+# No unit of work here: balances are deducted and committed before each
+# payout batch is sent to PayPal, so no transaction may stay open around it.
 @adm_bot.message_handler(commands=["pay_salaries"])
 @logger_decorator_msg
 def pay_salaries_command(message: types.Message) -> None:
-    """Process /pay_salaries command.
+    """Process /pay_salaries command. Pay all Couriers with PayPal
+    payout batches, which are followed by the payroll worker.
 
     Args:
         message: /pay_salaries command message.
@@ -51,26 +60,34 @@ def pay_salaries_command(message: types.Message) -> None:
             msg.data_to_read.from_user.id,
             texts[msg.get_admin_lang()]["NO_COURIERS_MSG"]
         )
-    for courier in couriers:
-        if paypal.pp_courier_payout(courier) == 201:
-            adm_bot.send_message(
-                msg.data_to_read.from_user.id,
-                texts[msg.get_admin_lang()]["SALARY_PAID_MSG"](courier)
-            )
-            courier_bot.send_message(
-                courier[0],
-                texts[courier[5]]["COUR_SALARY_PAID_MSG"](courier)
-            )
-        else:
-            adm_bot.send_message(
+        return None
+    _, rejected, unknown = paypal.pp_couriers_payout(
+        couriers,
+        msg.data_to_read.from_user.id
+    )
+    for courier in rejected:
+        send_queue.send(
+            adm_bot.send_message,
+            msg.data_to_read.from_user.id,
+            texts[msg.get_admin_lang()]["PAYMENT_FAILED_MSG"](courier)
+        )
+    for sender_batch_id, batch_couriers in unknown.items():
+        for courier in batch_couriers:
+            send_queue.send(
+                adm_bot.send_message,
                 msg.data_to_read.from_user.id,
-                texts[msg.get_admin_lang()]["PAYMENT_FAILED_MSG"](courier)
+                texts[msg.get_admin_lang()]["PAYOUT_PENDING_MSG"](courier, sender_batch_id)
             )
 
 
 def main():
+    if bot_runner.BOT_RUNTIME == "async":
+        # Imported only here, so the threaded runtime does not load it.
+        import async_main
+        return async_main.main()
     logger.info("Bot is running")
-    adm_bot.infinity_polling()
+    metrics.start_reporter()
+    bot_runner.run({"admin": adm_bot})
 
 
 if __name__ == '__main__':
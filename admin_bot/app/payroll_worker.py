@@ -0,0 +1,272 @@
+import time
+import threading
+from typing import Any, Dict, List, Sequence, Tuple
+
+import psycopg2
+import requests
+from psycopg2.extensions import cursor
+
+import tools.pp_tools as paypal
+from admin_db_tools import DEF_LANG
+from admin_translations import texts
+from tools import metrics
+from tools.bots_initialization import adm_bot, courier_bot, send_queue
+from tools.cursor_tool import cursor as cursor_decorator, unit_of_work
+from tools.logger_tool import logger
+
+# Payroll runs whose outcome is still open.
+OPEN_STATUSES = ("pending", "sent", "unknown")
+
+
+class PayrollWorker:
+    """Background worker following payroll runs stored in the database
+    to their end, whichever process started them and whether it is still
+    running. Batches PayPal may not have received are sent again with
+    the same sender batch ID, results of accepted ones are polled, and
+    amounts of failed payments are given back to the Couriers. Any
+    number of workers in any processes may run at once, each run is
+    claimed by one of them.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._started = False
+        self._lock = threading.Lock()
+        self._paid = 0
+        self._failed = 0
+        self._resent = 0
+
+    def start(self) -> None:
+        """Start background thread following payroll runs every
+        interval.
+        """
+        with self._lock:
+            if self._started:
+                return None
+            self._started = True
+        metrics.register("payroll_worker", self.stats)
+        threading.Thread(target=self._loop, name="payroll-worker", daemon=True).start()
+
+    def run_pending(self) -> int:
+        """Follow all payroll runs that are due now, one by one.
+
+        Returns:
+            Number of payroll runs followed.
+
+        """
+        followed = 0
+        while run := self._claim():
+            self._execute(*run)
+            followed += 1
+        return followed
+
+    def stats(self) -> Dict[str, Any]:
+        """Get worker metrics.
+
+        Returns:
+            Counters of Couriers paid and not paid, and of batches sent
+            again.
+
+        """
+        with self._lock:
+            return {"paid": self._paid, "failed": self._failed, "resent": self._resent}
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.run_pending()
+            except (psycopg2.Error, OSError) as error:
+                logger.error(f"Payroll worker failed: {error}")
+            time.sleep(self.interval)
+
+    @staticmethod
+    @cursor_decorator
+    def _claim(curs: cursor) -> Tuple[str, str, str, int, float] | None:
+        curs.execute(
+            "UPDATE payroll_runs SET run_after = now() + make_interval(secs => %s) "
+            "WHERE sender_batch_id = ("
+            "SELECT sender_batch_id FROM payroll_runs "
+            "WHERE run_status IN %s AND run_after <= now() "
+            "ORDER BY run_after LIMIT 1 FOR UPDATE SKIP LOCKED"
+            ") RETURNING sender_batch_id, run_status, payout_batch_id, admin_id, "
+            "EXTRACT(EPOCH FROM now() - created_date)::FLOAT",
+            (paypal.PAYROLL_RUN_LEASE, OPEN_STATUSES)
+        )
+        return curs.fetchone()
+
+    def _execute(
+            self,
+            sender_batch_id: str,
+            status: str,
+            batch_id: str,
+            admin_id: int,
+            age: float
+    ) -> None:
+        couriers = self._get_couriers(sender_batch_id)
+        if not couriers:
+            return self._settle(sender_batch_id, "done", admin_id)
+        if age > paypal.PAYOUT_POLL_TIMEOUT:
+            logger.warning(f"Payroll run {sender_batch_id} still pending, giving up on it.")
+            return self._settle(sender_batch_id, "expired", admin_id, pending=couriers)
+        if status == "sent":
+            return self._follow(sender_batch_id, batch_id, admin_id, couriers)
+        self._resend(sender_batch_id, admin_id, couriers)
+
+    def _resend(
+            self,
+            sender_batch_id: str,
+            admin_id: int,
+            couriers: List[Tuple[Any, ...]]
+    ) -> None:
+        # PayPal answers a repeated request ID with the original result,
+        # and refuses a repeated sender batch ID, so nobody is paid twice.
+        with self._lock:
+            self._resent += 1
+        data = paypal.pp_couriers_payout_data(couriers, sender_batch_id)
+        try:
+            response = paypal.paypal_client.post("/v1/payments/payouts", data, sender_batch_id)
+            if (status := paypal.pp_payout_batch_outcome(response)) == "sent":
+                batch_id = response.json()["batch_header"]["payout_batch_id"]
+        except (requests.RequestException, LookupError, TypeError, ValueError) as error:
+            logger.warning(f"Failed to send payroll run {sender_batch_id} again: {error}")
+            return self._reschedule(sender_batch_id)
+        if status == "sent":
+            logger.info(f"Payroll run {sender_batch_id} accepted as payout batch {batch_id}.")
+            return self._set_batch(sender_batch_id, batch_id)
+        if paypal.pp_is_duplicate_batch(response):
+            logger.error(f"Payroll run {sender_batch_id} was sent before, check it in PayPal.")
+            return self._settle(sender_batch_id, "unresolved", admin_id, pending=couriers)
+        if status == "unknown":
+            logger.warning(f"Payroll run {sender_batch_id} not accepted yet: {response.text}")
+            return self._reschedule(sender_batch_id)
+        logger.error(f"Payroll run {sender_batch_id} rejected: {response.text}")
+        self._settle(sender_batch_id, "rejected", admin_id, failed=couriers)
+
+    def _follow(
+            self,
+            sender_batch_id: str,
+            batch_id: str,
+            admin_id: int,
+            couriers: List[Tuple[Any, ...]]
+    ) -> None:
+        try:
+            batch_status, items = paypal.pp_payout_batch_status(batch_id)
+        except (requests.RequestException, KeyError, ValueError) as error:
+            logger.error(f"Failed to get status of payout batch {batch_id}: {error}")
+            return self._reschedule(sender_batch_id)
+        paid = [courier for courier in couriers if items.get(str(courier[0])) == "SUCCESS"]
+        failed = [
+            courier for courier in couriers
+            if items.get(str(courier[0])) in paypal.PAYOUT_ITEM_FAILED_STATUSES
+            or (batch_status in paypal.PAYOUT_BATCH_FAILED_STATUSES and courier not in paid)
+        ]
+        if not paid and not failed:
+            return self._reschedule(sender_batch_id)
+        status = "sent" if len(paid) + len(failed) < len(couriers) else "done"
+        self._settle(sender_batch_id, status, admin_id, paid=paid, failed=failed)
+
+    def _settle(
+            self,
+            sender_batch_id: str,
+            status: str,
+            admin_id: int,
+            paid: Sequence[Tuple[Any, ...]] = (),
+            failed: Sequence[Tuple[Any, ...]] = (),
+            pending: Sequence[Tuple[Any, ...]] = ()
+    ) -> None:
+        # Notifications are sent once the results are committed, and
+        # Couriers settled are not looked at again.
+        with unit_of_work():
+            admin_lang = self._get_admin_lang(admin_id)
+            if failed:
+                paypal.pp_restore_courier_balances(failed)
+            self._set_result(
+                sender_batch_id,
+                status,
+                [courier[0] for courier in [*paid, *failed]]
+            )
+            for courier in paid:
+                send_queue.send(
+                    adm_bot.send_message,
+                    admin_id,
+                    texts[admin_lang]["SALARY_PAID_MSG"](courier)
+                )
+                send_queue.send(
+                    courier_bot.send_message,
+                    courier[0],
+                    texts[courier[5]]["COUR_SALARY_PAID_MSG"](courier)
+                )
+            for courier in failed:
+                send_queue.send(
+                    adm_bot.send_message,
+                    admin_id,
+                    texts[admin_lang]["PAYMENT_FAILED_MSG"](courier)
+                )
+            for courier in pending:
+                send_queue.send(
+                    adm_bot.send_message,
+                    admin_id,
+                    texts[admin_lang]["PAYOUT_PENDING_MSG"](courier, sender_batch_id)
+                )
+        with self._lock:
+            self._paid += len(paid)
+            self._failed += len(failed)
+
+    @staticmethod
+    @cursor_decorator
+    def _get_couriers(sender_batch_id: str, curs: cursor) -> List[Tuple[Any, ...]]:
+        curs.execute(
+            "SELECT couriers.courier_id, couriers.courier_username, couriers.courier_legal_name, "
+            "run.amount, couriers.paypal_id, couriers.lang_code "
+            "FROM payroll_runs "
+            "CROSS JOIN LATERAL unnest(payroll_runs.courier_ids, payroll_runs.amounts) "
+            "AS run(courier_id, amount) "
+            "JOIN couriers ON couriers.courier_id = run.courier_id "
+            "WHERE payroll_runs.sender_batch_id = %s "
+            "AND NOT run.courier_id = ANY(payroll_runs.settled_ids)",
+            (sender_batch_id,)
+        )
+        return curs.fetchall()
+
+    @staticmethod
+    @cursor_decorator
+    def _get_admin_lang(admin_id: int, curs: cursor) -> str:
+        curs.execute("SELECT lang_code FROM admins WHERE admin_id = %s", (admin_id,))
+        lang = DEF_LANG
+        if adm_lang := curs.fetchone():
+            lang = adm_lang[0] or lang
+        return lang
+
+    @staticmethod
+    @cursor_decorator
+    def _reschedule(sender_batch_id: str, curs: cursor) -> None:
+        curs.execute(
+            "UPDATE payroll_runs SET run_after = now() + make_interval(secs => %s) "
+            "WHERE sender_batch_id = %s",
+            (paypal.PAYOUT_POLL_INTERVAL, sender_batch_id)
+        )
+
+    @staticmethod
+    @cursor_decorator
+    def _set_batch(sender_batch_id: str, batch_id: str, curs: cursor) -> None:
+        curs.execute(
+            paypal.FINISH_PAYROLL_RUN_QUERY,
+            ("sent", batch_id, paypal.PAYOUT_POLL_INTERVAL, sender_batch_id)
+        )
+
+    @staticmethod
+    @cursor_decorator
+    def _set_result(
+            sender_batch_id: str,
+            status: str,
+            settled_ids: List[int],
+            curs: cursor
+    ) -> None:
+        curs.execute(
+            "UPDATE payroll_runs SET run_status = %s, settled_ids = settled_ids || %s::BIGINT[], "
+            "run_after = now() + make_interval(secs => %s) WHERE sender_batch_id = %s",
+            (status, settled_ids, paypal.PAYOUT_POLL_INTERVAL, sender_batch_id)
+        )
+
+
+payroll_worker = PayrollWorker(paypal.PAYOUT_POLL_INTERVAL)
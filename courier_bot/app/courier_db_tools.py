@@ -7,6 +7,7 @@ from psycopg2.extensions import cursor
 
 from tools.logger_tool import logger, logger_decorator
 from tools.cursor_tool import cursor as cursor_decorator
+from tools.lang_cache import lang_cache
 
 env = Env()
 env.read_env()
@@ -20,6 +21,7 @@ class Interface:
         self.courier_id = data_to_read.from_user.id
         logger.info(f"Interface instance initialized with {type(self.data_to_read)}.")
 
+    @lang_cache.cached("courier", lambda interface: interface.courier_id)
     @cursor_decorator
     @logger_decorator
     def get_courier_lang(self, curs: cursor) -> str:
@@ -85,6 +87,7 @@ class Interface:
             "UPDATE couriers SET lang_code = %s WHERE courier_id = %s",
             (self.data_to_read.data, self.courier_id)
         )
+        lang_cache.invalidate("courier", self.courier_id)
 
     @cursor_decorator
     @logger_decorator
@@ -116,7 +119,7 @@ class Interface:
         """
         curs.execute(
             "UPDATE couriers SET courier_type = %s WHERE courier_id = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1], self.courier_id)
+            (self.data_to_read.data, self.courier_id)
         )
 
     @cursor_decorator
@@ -184,11 +187,11 @@ class Interface:
         curs.execute(
             "UPDATE orders SET courier_id = %s, courier_name = %s, order_status = '4' "
             "WHERE order_uuid = %s AND courier_id = -1",
-            (self.courier_id, courier_name, self.data_to_read.data.split(maxsplit=1)[-1])
+            (self.courier_id, courier_name, self.data_to_read.data)
         )
         curs.execute(
             "SELECT courier_id FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
         courier_id_db = curs.fetchone()[0]
         if self.courier_id == courier_id_db:
@@ -212,7 +215,7 @@ class Interface:
         """
         curs.execute(
             "SELECT customer_id FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
         customer_id = curs.fetchone()[0]
         curs.execute("SELECT lang_code FROM customers WHERE customer_id = %s", (customer_id,))
@@ -254,7 +257,7 @@ class Interface:
         """
         curs.execute(
             "SELECT restaurant_id FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
         restaurant_id = curs.fetchone()[0]
         curs.execute(
@@ -275,7 +278,7 @@ class Interface:
         """
         curs.execute(
             "UPDATE orders SET order_status = '6' WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
 
     @cursor_decorator
@@ -289,5 +292,5 @@ class Interface:
         """
         curs.execute(
             "UPDATE orders SET order_status = '7' WHERE order_uuid = %s ",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
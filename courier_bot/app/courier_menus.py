@@ -1,6 +1,7 @@
 import telebot.types as types
 
 from courier_translations import texts
+from tools.callback_data import encode_callback
 
 
 # Language selection menu.
@@ -45,11 +46,11 @@ def transport_menu(lang_code: str) -> types.InlineKeyboardMarkup:
     menu = types.InlineKeyboardMarkup(row_width=1)
     feet_button = types.InlineKeyboardButton(
         text=texts[lang_code]["FEET_BTN"],
-        callback_data="type 0"
+        callback_data=encode_callback("type", "0")
     )
     bicycle_button = types.InlineKeyboardButton(
         text=texts[lang_code]["BICYCLE_BTN"],
-        callback_data="type 1"
+        callback_data=encode_callback("type", "1")
     )
     menu.add(feet_button, bicycle_button)
     return menu
@@ -70,7 +71,7 @@ def rest_order_ready_menu(rest_lang: str, order_uuid: str) -> types.InlineKeyboa
     menu = types.InlineKeyboardMarkup(row_width=1)
     ready_button = types.InlineKeyboardButton(
         text=texts[rest_lang]["REST_READY_BTN"],
-        callback_data=f"ready {order_uuid}"
+        callback_data=encode_callback("ready", order_uuid)
     )
     menu.add(ready_button)
     return menu
@@ -92,7 +93,7 @@ def order_in_delivery_menu(courier_lang: str, order_uuid: str) -> types.InlineKe
     menu = types.InlineKeyboardMarkup(row_width=1)
     delivered_button = types.InlineKeyboardButton(
         text=texts[courier_lang]["DELIVERED_BTN"],
-        callback_data=f"delivered {order_uuid}"
+        callback_data=encode_callback("delivered", order_uuid)
     )
     menu.add(delivered_button)
     return menu
@@ -113,7 +114,7 @@ def cus_delivered_menu(customer_lang: str, order_uuid: str) -> types.InlineKeybo
     menu = types.InlineKeyboardMarkup(row_width=1)
     order_closed_button = types.InlineKeyboardButton(
         text=texts[customer_lang]["ORDER_CLOSED_BTN"],
-        callback_data=f"order_closed {order_uuid}"
+        callback_data=encode_callback("order_closed", order_uuid)
     )
     menu.add(order_closed_button)
     return menu
@@ -3,11 +3,18 @@ import telebot.types as types
 import courier_menus
 from courier_translations import texts
 from courier_db_tools import Interface as DBInterface
-from tools.bots_initialization import adm_bot, courier_bot, cus_bot, rest_bot
+from tools import bot_runner, metrics
+from tools.bots_initialization import adm_bot, courier_bot, cus_bot, rest_bot, send_queue
+from tools.callback_data import CallbackRouter
+from tools.cursor_tool import on_commit, unit_of_work
 from tools.logger_tool import logger, logger_decorator_callback, logger_decorator_msg
 
+callback_router = CallbackRouter(texts)
+callback_router.register(courier_bot)
+
 
 @courier_bot.message_handler(commands=["start"])
+@unit_of_work()
 @logger_decorator_msg
 def start(message: types.Message) -> None:
     """Start interaction with bot; ask to send registration request to
@@ -33,6 +40,7 @@ def start(message: types.Message) -> None:
                          and message.reply_to_message.text \
                          in [lang["ASK_REG_MSG"] for lang in texts.values()]
 )
+@unit_of_work()
 @logger_decorator_msg
 def ask_registration(message: types.Message) -> None:
     """Process Courier registration request to Admin.
@@ -43,7 +51,8 @@ def ask_registration(message: types.Message) -> None:
     """
     msg = DBInterface(message)
     admin = msg.get_support()
-    adm_bot.send_message(
+    send_queue.send(
+        adm_bot.send_message,
         admin[0],
         texts[admin[1]]["REG_REQ_MSG"](
             msg.data_to_read.from_user.username,
@@ -55,6 +64,7 @@ def ask_registration(message: types.Message) -> None:
 
 
 @courier_bot.message_handler(commands=["select_language"])
+@unit_of_work()
 @logger_decorator_msg
 def change_lang_menu(message: types.Message) -> None:
     """Open language select menu.
@@ -75,10 +85,8 @@ def change_lang_menu(message: types.Message) -> None:
     )
 
 
-@courier_bot.callback_query_handler(
-    func= lambda call: call.message.text \
-                       in [lang["CHANGE_LANG_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("CHANGE_LANG_MSG")
+@unit_of_work()
 @logger_decorator_callback
 def lang_set(call: types.CallbackQuery) -> None:
     """Change bot interface language.
@@ -104,6 +112,7 @@ def lang_set(call: types.CallbackQuery) -> None:
 
 
 @courier_bot.message_handler(commands=["balance"])
+@unit_of_work()
 @logger_decorator_msg
 def balance_command(message: types.Message) -> None:
     """Display Courier's salary balance.
@@ -120,6 +129,7 @@ def balance_command(message: types.Message) -> None:
 
 
 @courier_bot.message_handler(commands=["change_transport"])
+@unit_of_work()
 @logger_decorator_msg
 def select_transport_command(message: types.Message) -> None:
     """Display transport choice menu.
@@ -136,7 +146,8 @@ def select_transport_command(message: types.Message) -> None:
     )
 
 
-@courier_bot.callback_query_handler(func=lambda call: "type" in call.data)
+@callback_router.action("type")
+@unit_of_work()
 @logger_decorator_callback
 def change_transport(call: types.CallbackQuery) -> None:
     """Process Courier transport choice menu input.
@@ -155,6 +166,7 @@ def change_transport(call: types.CallbackQuery) -> None:
 
 
 @courier_bot.message_handler(commands=["open_shift"])
+@unit_of_work()
 @logger_decorator_msg
 def open_shift_command(message: types.Message) -> None:
     """Process request to open shift.
@@ -169,6 +181,7 @@ def open_shift_command(message: types.Message) -> None:
 
 
 @courier_bot.message_handler(commands=["close_shift"])
+@unit_of_work()
 @logger_decorator_msg
 def close_shift_command(message: types.Message) -> None:
     """Process request to close shift.
@@ -189,6 +202,7 @@ def close_shift_command(message: types.Message) -> None:
 
 
 @courier_bot.message_handler(commands=["support"])
+@unit_of_work()
 @logger_decorator_msg
 def contact_support(message: types.Message) -> None:
     """Start support request sequence.
@@ -211,6 +225,7 @@ def contact_support(message: types.Message) -> None:
                          and message.reply_to_message.text \
                          in [lang["COURIER_SUPPORT_MSG"] for lang in texts.values()]
 )
+@unit_of_work()
 @logger_decorator_msg
 def message_to_support(message: types.Message) -> None:
     """Forward message from Courier to Support.
@@ -221,7 +236,8 @@ def message_to_support(message: types.Message) -> None:
     """
     msg = DBInterface(message)
     support = msg.get_support()
-    adm_bot.send_message(
+    send_queue.send(
+        adm_bot.send_message,
         support[0],
         texts[support[1]]["SUPPORT_FR_CUS_MSG"](
             msg.data_to_read.from_user.username,
@@ -235,7 +251,8 @@ def message_to_support(message: types.Message) -> None:
     )
 
 
-@courier_bot.callback_query_handler(func=lambda call: "accept" in call.data)
+@callback_router.action("accept")
+@unit_of_work()
 @logger_decorator_callback
 def accept_order(call: types.CallbackQuery) -> None:
     """Process request to accept order.
@@ -250,42 +267,46 @@ def accept_order(call: types.CallbackQuery) -> None:
         callback.data_to_read.message.id
     )
     if callback.cur_accept_order():
-        courier_bot.edit_message_text(
+        on_commit(
+            courier_bot.edit_message_text,
             texts[callback.get_courier_lang()]["COUR_ORDER_ACCEPTED_MSG"](
-                callback.data_to_read.data.split(maxsplit=1)[-1]
+                callback.data_to_read.data
             ),
             callback.data_to_read.from_user.id,
             callback.data_to_read.message.id
         )
         customer_info = callback.get_customer_info()
         courier_info = callback.get_courier_info()
-        cus_bot.send_message(
+        send_queue.send(
+            cus_bot.send_message,
             customer_info[0],
             texts[customer_info[1]]["COURIER_FOUND_MSG"](
-                callback.data_to_read.data.split(maxsplit=1)[-1],
+                callback.data_to_read.data,
                 courier_info[0],
                 courier_info[1],
                 courier_info[2]
             )
         )
         rest_info = callback.get_rest_info()
-        rest_bot.send_message(
+        send_queue.send(
+            rest_bot.send_message,
             rest_info[0],
             texts[rest_info[1]]["COURIER_FOUND_MSG"](
-                callback.data_to_read.data.split(maxsplit=1)[-1],
+                callback.data_to_read.data,
                 courier_info[0],
                 courier_info[1],
                 courier_info[2]
             )
         )
-        rest_bot.send_message(
+        send_queue.send(
+            rest_bot.send_message,
             rest_info[0],
             texts[rest_info[1]]["REST_ORDER_READY_MSG"](
-                callback.data_to_read.data.split(maxsplit=1)[-1]
+                callback.data_to_read.data
             ),
             reply_markup=courier_menus.rest_order_ready_menu(
                 rest_info[1],
-                callback.data_to_read.data.split(maxsplit=1)[-1]
+                callback.data_to_read.data
             )
         )
     else:
@@ -296,7 +317,8 @@ def accept_order(call: types.CallbackQuery) -> None:
         )
 
 
-@courier_bot.callback_query_handler(func=lambda call: "in_delivery" in call.data)
+@callback_router.action("in_delivery")
+@unit_of_work()
 @logger_decorator_callback
 def in_delivery(call: types.CallbackQuery) -> None:
     """Process confirmation from Courier that order has been received
@@ -309,26 +331,33 @@ def in_delivery(call: types.CallbackQuery) -> None:
     callback = DBInterface(call)
     customer_info = callback.get_customer_info()
     callback.order_in_delivery()
-    courier_bot.edit_message_reply_markup(callback.courier_id, callback.data_to_read.message.id)
-    courier_bot.send_message(
+    on_commit(
+        courier_bot.edit_message_reply_markup,
+        callback.courier_id,
+        callback.data_to_read.message.id
+    )
+    on_commit(
+        courier_bot.send_message,
         callback.courier_id,
         texts[callback.get_courier_lang()]["COUR_IN_DELIVERY_MSG"](
-            callback.data_to_read.data.split(maxsplit=1)[-1]
+            callback.data_to_read.data
         ),
         reply_markup=courier_menus.order_in_delivery_menu(
             callback.get_courier_lang(),
-            callback.data_to_read.data.split(maxsplit=1)[-1]
+            callback.data_to_read.data
         )
     )
-    cus_bot.send_message(
+    send_queue.send(
+        cus_bot.send_message,
         customer_info[0],
         texts[customer_info[1]]["CUS_IN_DELIVERY_MSG"](
-            callback.data_to_read.data.split(maxsplit=1)[-1]
+            callback.data_to_read.data
         )
     )
 
 
-@courier_bot.callback_query_handler(func=lambda call: "delivered" in call.data)
+@callback_router.action("delivered")
+@unit_of_work()
 @logger_decorator_callback
 def delivered(call: types.CallbackQuery) -> None:
     """Process confirmation from Courier that order has been delivered.
@@ -340,28 +369,35 @@ def delivered(call: types.CallbackQuery) -> None:
     callback = DBInterface(call)
     customer_info = callback.get_customer_info()
     callback.order_delivered()
-    courier_bot.edit_message_reply_markup(callback.courier_id, callback.data_to_read.message.id)
-    courier_bot.send_message(
+    on_commit(
+        courier_bot.edit_message_reply_markup,
+        callback.courier_id,
+        callback.data_to_read.message.id
+    )
+    on_commit(
+        courier_bot.send_message,
         callback.courier_id,
         texts[callback.get_courier_lang()]["COUR_DELIVERED_MSG"](
-            callback.data_to_read.data.split(maxsplit=1)[-1]
+            callback.data_to_read.data
         )
     )
-    cus_bot.send_message(
+    send_queue.send(
+        cus_bot.send_message,
         customer_info[0],
         texts[customer_info[1]]["CUS_DELIVERED_MSG"](
-            callback.data_to_read.data.split(maxsplit=1)[-1]
+            callback.data_to_read.data
         ),
         reply_markup=courier_menus.cus_delivered_menu(
             customer_info[1],
-            callback.data_to_read.data.split(maxsplit=1)[-1]
+            callback.data_to_read.data
         )
     )
 
 
 def main():
     logger.info("Bot is running")
-    courier_bot.infinity_polling()
+    metrics.start_reporter()
+    bot_runner.run({"courier": courier_bot})
 
 
 if __name__ == '__main__':
@@ -1,14 +1,17 @@
 import uuid
 import random
 import datetime
+import dataclasses
+from decimal import Decimal
 from typing import Any, Dict, List, Tuple
 
 import telebot.types as types
 from environs import Env
-from geopy.distance import geodesic
 from psycopg2.extensions import cursor
 
-from tools.cursor_tool import cursor as cursor_decorator
+from tools.catalog_cache import catalog_cache
+from tools.cursor_tool import cursor as cursor_decorator, scope_cache
+from tools.lang_cache import lang_cache
 from tools.logger_tool import logger, logger_decorator
 
 env = Env()
@@ -17,6 +20,50 @@ env.read_env()
 DEF_LANG = env.str("DEF_LANG", default="en_US")
 
 
+@dataclasses.dataclass(slots=True)
+class Cart:
+    customer_id: int
+    restaurant_type: str | None
+    restaurant_uuid: str | None
+    dishes_uuids: List[str] | None
+    subtotal: Decimal
+    service_fee: Decimal
+    courier_fee: Decimal
+    total: Decimal
+    order_comment: str | None
+
+
+CART_COLUMNS = tuple(field.name for field in dataclasses.fields(Cart))
+
+
+@dataclasses.dataclass(slots=True)
+class Order:
+    order_uuid: str
+    restaurant_uuid: str
+    restaurant_id: int
+    restaurant_name: str
+    courier_id: int | None
+    courier_name: str | None
+    customer_id: int
+    customer_name: str | None
+    delivery_location: List[Decimal]
+    delivery_distance: Decimal | None
+    dishes: List[str]
+    dishes_subtotal: Decimal
+    courier_fee: Decimal
+    service_fee: Decimal
+    total: Decimal
+    order_comment: str | None
+    order_open_date: datetime.datetime
+    order_close_date: datetime.datetime | None
+    order_status: str
+    paypal_order_id: str | None
+    restaurant_lang: str
+
+
+ORDER_COLUMNS = tuple(field.name for field in dataclasses.fields(Order))[:-1]
+
+
 class Interface:
     def __init__(self, data_to_read: types.Message | types.CallbackQuery):
         self.data_to_read = data_to_read
@@ -61,6 +108,7 @@ class Interface:
             "INSERT INTO customers (customer_id, customer_username) VALUES (%s, %s)",
             (self.data_to_read.from_user.id, self.data_to_read.from_user.username)
         )
+        lang_cache.invalidate("customer", self.data_to_read.from_user.id)
 
     @cursor_decorator
     @logger_decorator
@@ -122,6 +170,7 @@ class Interface:
             "DELETE FROM customers WHERE customer_id = %s",
             (self.data_to_read.from_user.id,)
         )
+        lang_cache.invalidate("customer", self.data_to_read.from_user.id)
 
     @cursor_decorator
     @logger_decorator
@@ -144,6 +193,7 @@ class Interface:
         return orders
 
     @staticmethod
+    @catalog_cache.cached("restaurant_types")
     @cursor_decorator
     @logger_decorator
     def show_restaurant_types(curs: cursor) -> List[Tuple[Any, ...]]:
@@ -164,6 +214,7 @@ class Interface:
         restaurant_types = [] or curs.fetchall()
         return restaurant_types
 
+    @catalog_cache.cached("restaurants", lambda interface: interface.data_to_read.data)
     @cursor_decorator
     @logger_decorator
     def show_restaurants(self, curs: cursor) -> List[Tuple[Any, ...]]:
@@ -184,6 +235,7 @@ class Interface:
         restaurants = [] or curs.fetchall()
         return restaurants
 
+    @catalog_cache.cached("dish_categories", lambda interface: interface.data_to_read.data)
     @cursor_decorator
     @logger_decorator
     def show_dish_categories(self, curs: cursor) -> List[Tuple[Any, ...]]:
@@ -205,6 +257,10 @@ class Interface:
         categories = [] or curs.fetchall()
         return categories
 
+    @catalog_cache.cached(
+        "dishes",
+        lambda interface: (interface.get_cart().restaurant_uuid, interface.data_to_read.data)
+    )
     @cursor_decorator
     @logger_decorator
     def show_dishes(self, curs: cursor) -> List[Tuple[Any, ...]]:
@@ -221,7 +277,7 @@ class Interface:
         curs.execute(
             "SELECT dish_name, dish_uuid FROM dishes "
             "WHERE restaurant_uuid = %s AND dish_is_available = TRUE AND category = %s",
-            (self.get_from_cart("restaurant_uuid"), self.data_to_read.data)
+            (self.get_cart().restaurant_uuid, self.data_to_read.data)
         )
         dishes = [] or curs.fetchall()
         return dishes
@@ -245,6 +301,7 @@ class Interface:
         rest_name = curs.fetchone()
         return rest_name[0] if rest_name[0] else ""
 
+    @catalog_cache.cached("dish", lambda interface: interface.data_to_read.data)
     @cursor_decorator
     @logger_decorator
     def get_dish(self, curs: cursor) -> Tuple[Any, ...]:
@@ -265,6 +322,35 @@ class Interface:
         dish = tuple() or curs.fetchone()
         return dish
 
+    @staticmethod
+    @cursor_decorator
+    @logger_decorator
+    def get_dishes_by_uuids(
+            dishes_uuids: List[str],
+            curs: cursor
+    ) -> List[Tuple[str, str, Decimal]]:
+        """Get names and prices of several dishes with a single query.
+
+        Args:
+            dishes_uuids: Dish UUIDs, duplicates allowed.
+            curs: Cursor object from psycopg2 module.
+
+        Returns:
+            Array of dish UUID, name and price for every given UUID
+            in the same order, duplicates included. UUIDs of dishes
+            missing from the DB are skipped.
+
+        """
+        if not dishes_uuids:
+            return []
+        curs.execute(
+            "SELECT dish_uuid, dish_name, dish_price FROM dishes "
+            "WHERE dish_uuid = ANY(%s::uuid[])",
+            (list(dishes_uuids),)
+        )
+        dishes = {str(dish[0]): dish for dish in curs.fetchall()}
+        return [dishes[dish_uuid] for dish_uuid in dishes_uuids if dish_uuid in dishes]
+
     @staticmethod
     @cursor_decorator
     @logger_decorator
@@ -297,6 +383,7 @@ class Interface:
         curs.execute(
             "INSERT INTO cart (customer_id) VALUES (%s)", (self.data_to_read.from_user.id,)
         )
+        self.forget_cart()
 
     @cursor_decorator
     @logger_decorator
@@ -312,26 +399,54 @@ class Interface:
             "UPDATE cart SET " + column_name + " = %s WHERE customer_id = %s",
             (self.data_to_read.data, self.data_to_read.from_user.id)
         )
+        self.forget_cart()
 
     @cursor_decorator
     @logger_decorator
-    def get_from_cart(self, column_name: str, curs: cursor) -> float | int | str | List[Any]:
-        """Get required info from cart.
+    def update_cart(self, curs: cursor, **columns: Any) -> None:
+        """Write several cart fields with a single UPDATE.
 
         Args:
-            column_name: Name of column containing required info.
             curs: Cursor object from psycopg2 module.
-
-        Returns:
-            Required info.
+            **columns: Cart column names and their new values.
 
         """
+        if unknown := set(columns) - set(CART_COLUMNS):
+            raise ValueError(f"Unknown cart columns: {', '.join(sorted(unknown))}.")
         curs.execute(
-            "SELECT " + column_name + " FROM cart WHERE customer_id = %s",
-            (self.data_to_read.from_user.id,)
+            "UPDATE cart SET " + ", ".join(f"{column} = %s" for column in columns)
+            + " WHERE customer_id = %s",
+            (*columns.values(), self.data_to_read.from_user.id)
         )
-        value = "" or curs.fetchone()
-        return value[0]
+        self.forget_cart()
+
+    @cursor_decorator
+    @logger_decorator
+    def get_cart(self, curs: cursor) -> Cart | None:
+        """Get snapshot of Customer's cart. The snapshot is loaded once
+        and reused until the end of the current unit of work or the next
+        cart change.
+
+        Args:
+            curs: Cursor object from psycopg2 module.
+
+        Returns:
+            Customer's cart if one exists, None otherwise.
+
+        """
+        cache = scope_cache()
+        key = ("cart", self.data_to_read.from_user.id)
+        if key not in cache:
+            curs.execute(
+                "SELECT " + ", ".join(CART_COLUMNS) + " FROM cart WHERE customer_id = %s",
+                (self.data_to_read.from_user.id,)
+            )
+            cache[key] = Cart(*cart) if (cart := curs.fetchone()) else None
+        return cache[key]
+
+    def forget_cart(self) -> None:
+        """Drop cached snapshot of Customer's cart."""
+        scope_cache().pop(("cart", self.data_to_read.from_user.id), None)
 
     @cursor_decorator
     @logger_decorator
@@ -345,17 +460,17 @@ class Interface:
             Delivery distance in kilometers with two digits precision.
 
         """
+        from geopy.distance import geodesic  # Costly to import, needed only here.
+
         customer_location_dict = self.check_if_location()
         customer_location = (
             float(customer_location_dict["lat"]),
             float(customer_location_dict["lon"])
         )
         curs.execute(
-            "SELECT restaurant_uuid FROM cart WHERE customer_id = %s",
-            (self.data_to_read.from_user.id,)
+            "SELECT location FROM restaurants WHERE restaurant_uuid = %s",
+            (self.get_cart().restaurant_uuid,)
         )
-        rest_uuid = curs.fetchone()
-        curs.execute("SELECT location FROM restaurants WHERE restaurant_uuid = %s", (rest_uuid,))
         rest_location_list = curs.fetchone()[0]
         rest_location = (float(rest_location_list[0]), float(rest_location_list[1]))
         delivery_distance = round(float(geodesic(rest_location, customer_location).km), 2)
@@ -375,6 +490,7 @@ class Interface:
             "UPDATE cart SET " + column_name + " = null WHERE customer_id = %s",
             (self.data_to_read.from_user.id,)
         )
+        self.forget_cart()
 
     @cursor_decorator
     @logger_decorator
@@ -386,6 +502,7 @@ class Interface:
 
         """
         curs.execute("DELETE FROM cart WHERE customer_id = %s", (self.data_to_read.from_user.id,))
+        self.forget_cart()
 
     @cursor_decorator
     @logger_decorator
@@ -407,6 +524,7 @@ class Interface:
             return {"lat": latlon[0], "lon": latlon[1]}
         return {}
 
+    @lang_cache.cached("customer", lambda interface: interface.data_to_read.from_user.id)
     @cursor_decorator
     @logger_decorator
     def get_customer_lang(self, curs: cursor) -> str:
@@ -442,98 +560,57 @@ class Interface:
             "UPDATE customers SET lang_code = %s WHERE customer_id = %s",
             (self.data_to_read.data, self.data_to_read.from_user.id)
         )
-
-    @staticmethod
-    @cursor_decorator
-    @logger_decorator
-    def get_restaurant_lang(rest_uuid: str, curs: cursor) -> str:
-        """Get language code of Restaurant.
-
-        Args:
-            rest_uuid: Restaurant UUID.
-            curs: Cursor object from psycopg2 module.
-
-        Returns:
-            Restaurant language code, if Restaurant has chosen one,
-            otherwise default language code, set in .env.
-
-        """
-        curs.execute("SELECT lang_code FROM restaurants WHERE restaurant_uuid = %s", (rest_uuid,))
-        lang = DEF_LANG
-        if restaurant_lang := curs.fetchone():
-            lang = restaurant_lang[0] or lang
-        return lang
+        lang_cache.invalidate("customer", self.data_to_read.from_user.id)
 
     @cursor_decorator
     @logger_decorator
     def order_creation(self, curs: cursor) -> List[Any]:
         """Create order in database, transferring data from Customer's
-        cart.
+        cart, with a single INSERT ... SELECT statement. Dish names are
+        resolved inside the same statement, delivery distance is the one
+        courier fee was calculated with.
 
         Args:
             curs: Cursor object from psycopg2 module.
 
         Returns:
-            Array containing order information.
+            Array containing order information, empty if Customer's cart,
+            restaurant or Customer's profile were not found.
 
         """
-        curs.execute(
-            "SELECT restaurant_uuid, dishes_uuids, subtotal, service_fee, courier_fee, total, "
-            "order_comment FROM cart WHERE customer_id = %s",
-            (self.data_to_read.from_user.id,)
-        )
-        order_data = curs.fetchone()
-        curs.execute(
-            "SELECT restaurant_tg_id FROM restaurants WHERE restaurant_uuid = %s", (order_data[0],)
-        )
-        rest_id = curs.fetchone()[0]
-        curs.execute(
-            "SELECT restaurant_name FROM restaurants WHERE restaurant_uuid = %s", (order_data[0],)
-        )
-        rest_name = curs.fetchone()[0]
-        curs.execute(
-            "SELECT customer_name, customer_location FROM customers WHERE customer_id = %s",
-            (self.data_to_read.from_user.id,)
-        )
-        customer_info = curs.fetchone()
-        dishes = []
-        for dish_uuid in order_data[1]:
-            curs.execute(
-                "SELECT dish_name FROM dishes WHERE dish_uuid = %s",
-                (dish_uuid,)
-            )
-            current_dish = curs.fetchone()[0]
-            dishes += [current_dish]
-        order_uuid = str(uuid.uuid4())
-        order_creation_datetime = datetime.datetime.now()
+        if self.get_cart() is None or not self.check_if_location():
+            return []
         curs.execute(
             "INSERT INTO orders (order_uuid, restaurant_uuid, restaurant_id, restaurant_name, "
             "customer_id, customer_name, delivery_location, dishes, dishes_subtotal, courier_fee, "
             "service_fee, total, order_open_date, order_status, order_comment, delivery_distance) "
-            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
-            (order_uuid,
-                order_data[0],
-                rest_id,
-                rest_name,
-                self.data_to_read.from_user.id,
-                customer_info[0],
-                customer_info[1],
-                dishes,
-                order_data[2],
-                order_data[4],
-                order_data[3],
-                order_data[5],
-                order_creation_datetime,
-                "1",
-                order_data[6],
-                self.get_delivery_distance()
+            "SELECT %s, cart.restaurant_uuid, restaurants.restaurant_tg_id, "
+            "restaurants.restaurant_name, cart.customer_id, customers.customer_name, "
+            "customers.customer_location, "
+            "ARRAY("
+            "SELECT dishes.dish_name "
+            "FROM unnest(cart.dishes_uuids) WITH ORDINALITY AS item(dish_uuid, position) "
+            "JOIN dishes ON dishes.dish_uuid = item.dish_uuid::uuid "
+            "ORDER BY item.position"
+            "), "
+            "cart.subtotal, cart.courier_fee, cart.service_fee, cart.total, %s, '1', "
+            "cart.order_comment, %s "
+            "FROM cart "
+            "JOIN restaurants ON restaurants.restaurant_uuid = cart.restaurant_uuid "
+            "JOIN customers ON customers.customer_id = cart.customer_id "
+            "WHERE cart.customer_id = %s "
+            "RETURNING order_uuid, restaurant_uuid, restaurant_id, restaurant_name, customer_id, "
+            "customer_name, delivery_location, dishes, dishes_subtotal, courier_fee, service_fee, "
+            "total, order_open_date, order_status, order_comment",
+            (
+                str(uuid.uuid4()),
+                datetime.datetime.now(),
+                self.get_delivery_distance(),
+                self.data_to_read.from_user.id
             )
         )
-        return [
-            order_uuid, order_data[0], rest_id, rest_name, self.data_to_read.from_user.id,
-            customer_info[0], customer_info[1], dishes, order_data[2], order_data[4],
-            order_data[3], order_data[5], order_creation_datetime, "1", order_data[6]
-        ]
+        order = curs.fetchone()
+        return list(order) if order else []
 
     @staticmethod
     @cursor_decorator
@@ -578,22 +655,68 @@ class Interface:
     @staticmethod
     @cursor_decorator
     @logger_decorator
-    def get_order_info(order_uuid: str, column: str, curs: cursor) -> str | int:
-        """Get required order information from database.
+    def get_order(order_uuid: str, curs: cursor) -> Order | None:
+        """Get snapshot of order together with language code of its
+        Restaurant in one query.
 
         Args:
             order_uuid: Order UUID.
-            column: Required column name.
             curs: Cursor object from psycopg2 module.
 
         Returns:
-            Required order information.
+            Order if one exists, None otherwise.
 
         """
         curs.execute(
-            "SELECT " + column + " FROM orders WHERE order_uuid = %s",  (order_uuid,)
+            "SELECT " + ", ".join(f"orders.{column}" for column in ORDER_COLUMNS) + ", "
+            "COALESCE(NULLIF(restaurants.lang_code, ''), %s) "
+            "FROM orders "
+            "LEFT JOIN restaurants ON restaurants.restaurant_uuid = orders.restaurant_uuid "
+            "WHERE orders.order_uuid = %s",
+            (DEF_LANG, order_uuid)
         )
-        return curs.fetchone()[0]
+        return Order(*order) if (order := curs.fetchone()) else None
+
+    @staticmethod
+    @cursor_decorator
+    @logger_decorator
+    def get_order_uuid(paypal_order_id: str, curs: cursor) -> str | None:
+        """Find order by ID of its PayPal order.
+
+        Args:
+            paypal_order_id: PayPal order ID.
+            curs: Cursor object from psycopg2 module.
+
+        Returns:
+            Order UUID if order exists, None otherwise.
+
+        """
+        curs.execute(
+            "SELECT order_uuid FROM orders WHERE paypal_order_id = %s", (paypal_order_id,)
+        )
+        return str(order[0]) if (order := curs.fetchone()) else None
+
+    @staticmethod
+    @cursor_decorator
+    @logger_decorator
+    def lock_order(order_uuid: str, curs: cursor) -> str | None:
+        """Lock order till the end of the unit of work, so its status is
+        changed by one handler at a time. Must be used in short units of
+        work only, without calls to PayPal or Telegram, as other
+        handlers wait for the lock.
+
+        Args:
+            order_uuid: Order UUID.
+            curs: Cursor object from psycopg2 module.
+
+        Returns:
+            Status of the locked order, None if order does not exist.
+
+        """
+        curs.execute(
+            "SELECT order_status FROM orders WHERE order_uuid = %s FOR UPDATE", (order_uuid,)
+        )
+        return order[0] if (order := curs.fetchone()) else None
 
     @cursor_decorator
     @logger_decorator
@@ -606,11 +729,11 @@ class Interface:
         """
         curs.execute(
             "UPDATE orders SET order_status = '0', order_close_date = %s WHERE order_uuid = %s",
-            (datetime.datetime.now(), self.data_to_read.data.split(maxsplit=1)[-1])
+            (datetime.datetime.now(), self.data_to_read.data)
         )
         curs.execute(
             "SELECT courier_id FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
         courier_id = curs.fetchone()[0]
         curs.execute(
@@ -619,7 +742,7 @@ class Interface:
         current_balance = curs.fetchone()[0]
         curs.execute(
             "SELECT courier_fee FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
         curs.execute(
             "UPDATE couriers SET account_balance = %s, is_occupied = false WHERE courier_id = %s",
@@ -2,6 +2,7 @@ import telebot.types as types
 
 from customer_translations import texts
 from customer_db_tools import Interface as DBInterface
+from tools.callback_data import encode_callback
 
 # Some common buttons here.
 main_menu_button = lambda lang_code: types.KeyboardButton(text=texts[lang_code]["MAIN_MENU_BTN"])
@@ -388,11 +389,8 @@ def item_deletion_menu(lang_code: str, callback: DBInterface) -> types.InlineKey
 
     """
     menu = types.InlineKeyboardMarkup(row_width=1)
-    if dishes_uuids := callback.get_from_cart("dishes_uuids"):
-        dishes_uuids = sorted(dishes_uuids)
-        for dish_uuid in dishes_uuids:
-            callback.data_to_read.data = dish_uuid
-            dish_name = callback.get_dish()[0]
+    if dishes_uuids := callback.get_cart().dishes_uuids:
+        for dish_uuid, dish_name, _ in callback.get_dishes_by_uuids(sorted(dishes_uuids)):
             menu.add(types.InlineKeyboardButton(text=dish_name, callback_data=dish_uuid))
     menu.add(cart_button(lang_code))
     return menu
@@ -441,11 +439,11 @@ def payment_menu(lang_code: str, order_uuid: str) -> types.InlineKeyboardMarkup:
     menu = types.InlineKeyboardMarkup(row_width=1)
     paid_button = types.InlineKeyboardButton(
         text=texts[lang_code]["PAID_BTN"],
-        callback_data=f"paid {order_uuid}"
+        callback_data=encode_callback("paid", order_uuid)
     )
     cancel_button = types.InlineKeyboardButton(
         text=texts[lang_code]["CANCEL_ORDER_BTN"],
-        callback_data=f"cancel {order_uuid}"
+        callback_data=encode_callback("cancel", order_uuid)
     )
     menu.add(paid_button, cancel_button)
     return menu
@@ -467,7 +465,7 @@ def rest_accept_order_menu(lang_code: str, order_uuid: str) -> types.InlineKeybo
     menu = types.InlineKeyboardMarkup(row_width=1)
     accept_button = types.InlineKeyboardButton(
         text=texts[lang_code]["REST_ACCEPT_ORDER_BTN"],
-        callback_data=f"accepted {order_uuid}"
+        callback_data=encode_callback("accepted", order_uuid)
     )
     menu.add(accept_button)
     return menu
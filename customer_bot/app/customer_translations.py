@@ -163,6 +163,10 @@ texts = {
         "WAIT_FOR_CONFIRMATION_MSG": lambda
             order_uuid: f"Payment confirmation from the Service has not been obtained\n" \
                         f"Order №\n`{order_uuid}`.",
+        "PAYMENT_PROCESSING_MSG": lambda
+            order_uuid: f"Payment for order\n" \
+                        f"`{order_uuid}`\n" \
+                        f"is being processed, please wait",
         "ORDER_CLOSED_MSG": lambda order_uuid: f"Order closed:\n`{order_uuid}`",
         "CANCEL_MSG": lambda order_uuid: f"Order cancelled\n`{order_uuid}`",
         "REST_NEW_ORDER_MSG": lambda
@@ -312,6 +316,7 @@ texts = {
         "CUS_PAYMENT_CONFIRMED_MSG": lambda order_uuid: f"Zahlung für Bestellung\n`{order_uuid}`\nbestätigt",
         "REST_ACCEPT_ORDER_BTN": "✅ Bestellung akzeptieren",
         "WAIT_FOR_CONFIRMATION_MSG": lambda order_uuid: f"Zahlungsbestätigung vom Service wurde nicht erhalten\nBestellung №\n`{order_uuid}`.",
+        "PAYMENT_PROCESSING_MSG": lambda order_uuid: f"Zahlung für Bestellung\n`{order_uuid}`\nwird bearbeitet, bitte warten Sie",
         "ORDER_CLOSED_MSG": lambda order_uuid: f"Bestellung geschlossen:\n`{order_uuid}`",
         "CANCEL_MSG": lambda order_uuid: f"Bestellung storniert\n`{order_uuid}`",
         "REST_NEW_ORDER_MSG": lambda
@@ -478,6 +483,10 @@ texts = {
         "WAIT_FOR_CONFIRMATION_MSG": lambda
             order_uuid: f"Подтверждение оплаты не получено\n" \
                         f"Заказ №\n`{order_uuid}`.",
+        "PAYMENT_PROCESSING_MSG": lambda
+            order_uuid: f"Оплата заказа\n" \
+                        f"`{order_uuid}`\n" \
+                        f"обрабатывается, пожалуйста, подождите",
         "ORDER_CLOSED_MSG": lambda order_uuid: f"Закрыт заказ:\n`{order_uuid}`",
         "CANCEL_MSG": lambda order_uuid: f"Заказ отменен\n`{order_uuid}`",
         "REST_NEW_ORDER_MSG": lambda
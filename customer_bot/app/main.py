@@ -1,13 +1,27 @@
+from typing import Any, Dict
+
 import telebot.types as types
 from environs import Env
-from telebot.apihelper import ApiTelegramException
 
 import customer_menus
 import tools.pp_tools as paypal
 from customer_translations import texts
 from customer_db_tools import Interface as DBInterface
-from tools.bots_initialization import adm_bot, cus_bot, rest_bot
-from tools.logger_tool import logger, logger_decorator_callback, logger_decorator_msg
+from tools import bot_runner, metrics
+from tools.bots_initialization import adm_bot, cus_bot, rest_bot, send_queue
+from tools.callback_data import CallbackRouter
+from tools.cursor_tool import on_commit, unit_of_work
+from tools.deferred_callbacks import DeferredCallbacks
+from tools.logger_tool import (
+    logger,
+    logger_decorator,
+    logger_decorator_callback,
+    logger_decorator_msg
+)
+from tools.message_effects import MessageEffects
+from tools.payout_worker import enqueue_rest_payout, payout_worker
+from tools.paypal_webhook import PayPalWebhook
+from tools.text_router import TextRouter
 
 env = Env()
 env.read_env()
@@ -19,6 +33,16 @@ SERVICE_FEE_BASE = env.float("SERVICE_FEE_BASE", default=1.75)
 SERVICE_FEE_RATE = env.float("SERVICE_FEE_RATE", default=0.05)
 MAX_PHONE_LENGTH = 11
 
+text_router = TextRouter(texts)
+text_router.register(cus_bot)
+callback_router = CallbackRouter(texts)
+callback_router.register(cus_bot)
+effects = MessageEffects(cus_bot, "customer")
+deferred_callbacks = DeferredCallbacks(cus_bot, "customer")
+paypal_webhook = PayPalWebhook()
+paypal_webhook.install()
+bot_runner.on_start(payout_worker.start)
+
 
 # Auxiliary functions.
 @logger_decorator_msg
@@ -78,6 +102,29 @@ def callback_to_msg(call: types.CallbackQuery) -> types.Message:
     return call.message
 
 
+def customer_msg(customer_id: int) -> types.Message:
+    """Compose message object standing for Customer, to reuse message
+    handlers for events that do not come from Telegram, e.g. PayPal
+    webhook events.
+
+    Args:
+        customer_id: Customer's Telegram ID.
+
+    Returns:
+        Empty message from Customer.
+
+    """
+    return types.Message(
+        0,
+        types.User(customer_id, False, ""),
+        0,
+        types.Chat(customer_id, "private"),
+        "text",
+        {},
+        ""
+    )
+
+
 @logger_decorator_callback
 def clear_cart(call: types.CallbackQuery) -> None:
     """Clear Customer's cart on receiving corresponding callback query.
@@ -92,7 +139,7 @@ def clear_cart(call: types.CallbackQuery) -> None:
         texts[callback.get_customer_lang()]["DELETING_CART_ALERT"],
         show_alert=True
     )
-    cus_bot.delete_message(callback.data_to_read.from_user.id, callback.data_to_read.message.id)
+    effects.delete(callback.data_to_read.from_user.id, callback.data_to_read.message.id)
     callback.delete_cart()
     show_main_menu(callback_to_msg(callback.data_to_read))
 
@@ -107,12 +154,9 @@ def prices_calc(call: types.CallbackQuery) -> None:
 
     """
     callback = DBInterface(call)
-    subtotal = 0
-    for dish in callback.get_from_cart("dishes_uuids"):
-        callback.data_to_read.data = dish
-        subtotal += callback.get_dish()[2]
-    callback.data_to_read.data = subtotal
-    callback.add_to_cart("subtotal")
+    subtotal = sum(
+        dish[2] for dish in callback.get_dishes_by_uuids(callback.get_cart().dishes_uuids)
+    )
     if subtotal > 0:
         courier_fee = round(
             (
@@ -126,16 +170,18 @@ def prices_calc(call: types.CallbackQuery) -> None:
     else:
         courier_fee = round(0, 2)
         service_fee = round(0, 2)
-    callback.data_to_read.data = courier_fee
-    callback.add_to_cart("courier_fee")
-    callback.data_to_read.data = service_fee
-    callback.add_to_cart("service_fee")
-    callback.data_to_read.data = round((float(subtotal) + courier_fee + service_fee), 2)
-    callback.add_to_cart("total")
+    callback.update_cart(
+        subtotal=subtotal,
+        courier_fee=courier_fee,
+        service_fee=service_fee,
+        total=round((float(subtotal) + courier_fee + service_fee), 2)
+    )
 
 
 # Sing in/sign up block.
 @cus_bot.message_handler(commands=["start"])
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def start(message: types.Message) -> None:
     """Commence interaction between Customer and the bot. Check if
@@ -165,9 +211,9 @@ def start(message: types.Message) -> None:
         )
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["SHOW_AGREEMENT_BTN"] for lang in texts.values()]
-)
+@text_router.text("SHOW_AGREEMENT_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def show_agreement(message: types.Message) -> None:
     """Show Customer agreement.
@@ -183,9 +229,9 @@ def show_agreement(message: types.Message) -> None:
     )
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["ACCEPT_AGREEMENT_BTN"] for lang in texts.values()]
-)
+@text_router.text("ACCEPT_AGREEMENT_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def agreement_accepted(message: types.Message) -> None:
     """Commence Customer sign up sequence. Add new Customer to the DB.
@@ -210,11 +256,9 @@ def agreement_accepted(message: types.Message) -> None:
     )
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.reply_to_message \
-                         and message.reply_to_message.text \
-                         in [lang["REG_NAME_MSG"] for lang in texts.values()]
-)
+@text_router.reply("REG_NAME_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def reg_name(message: types.Message) -> None:
     """Add Customer's name to the DB. Ask Customer to choose phone
@@ -238,9 +282,9 @@ def reg_name(message: types.Message) -> None:
 
 
 @cus_bot.message_handler(content_types=["contact"])
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["REG_PHONE_METHOD_MSG"] for lang in texts.values()]
-)
+@text_router.text("REG_PHONE_METHOD_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def contact(message: types.Message) -> None:
     """Add Customer's phone number imported via Telegram contact info
@@ -266,9 +310,9 @@ def contact(message: types.Message) -> None:
     )
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["REG_PHONE_MAN_BTN"] for lang in texts.values()]
-)
+@text_router.text("REG_PHONE_MAN_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def reg_phone_str(message: types.Message) -> None:
     """Ask Customer to input phone number manually.
@@ -287,11 +331,9 @@ def reg_phone_str(message: types.Message) -> None:
     )
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.reply_to_message \
-                         and message.reply_to_message.text \
-                         in [lang["REG_PHONE_MSG"] for lang in texts.values()]
-)
+@text_router.reply("REG_PHONE_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def reg_phone(message: types.Message) -> None:
     """Check if phone number was added to the DB if manual input was
@@ -328,9 +370,9 @@ def reg_phone(message: types.Message) -> None:
 
 
 @cus_bot.message_handler(content_types=["location"])
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["REG_LOCATION_BTN"] for lang in texts.values()]
-)
+@text_router.text("REG_LOCATION_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def reg_location(message: types.Message) -> None:
     """Add location to the DB. Proceed to main menu.
@@ -354,9 +396,9 @@ def reg_location(message: types.Message) -> None:
 
 
 # Main menu block.
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["OPTIONS_BTN"] for lang in texts.values()]
-)
+@text_router.text("OPTIONS_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def options(message: types.Message) -> None:
     """Show options menu.
@@ -366,7 +408,7 @@ def options(message: types.Message) -> None:
 
     """
     msg = DBInterface(message)
-    cus_bot.delete_message(msg.data_to_read.from_user.id, msg.data_to_read.id)
+    effects.delete(msg.data_to_read.from_user.id, msg.data_to_read.id)
     cus_bot.send_message(
         msg.data_to_read.from_user.id,
         texts[msg.get_customer_lang()]["OPTIONS_MSG"],
@@ -374,9 +416,9 @@ def options(message: types.Message) -> None:
     )
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["MY_ORDERS_BTN"] for lang in texts.values()]
-)
+@text_router.text("MY_ORDERS_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def my_orders(message: types.Message) -> None:
     """Send Customer their order history.
@@ -405,9 +447,9 @@ def my_orders(message: types.Message) -> None:
         show_main_menu(msg.data_to_read)
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["NEW_ORDER_BTN"] for lang in texts.values()]
-)
+@text_router.text("NEW_ORDER_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def new_order(message: types.Message) -> None:
     """Commence order creation sequence. Check if User location is
@@ -418,7 +460,7 @@ def new_order(message: types.Message) -> None:
 
     """
     msg = DBInterface(message)
-    cus_bot.delete_message(msg.data_to_read.from_user.id, msg.data_to_read.id)
+    effects.delete(msg.data_to_read.from_user.id, msg.data_to_read.id)
     if not msg.check_couriers():
         cus_bot.send_message(
             msg.data_to_read.from_user.id,
@@ -447,9 +489,9 @@ def new_order(message: types.Message) -> None:
 
 
 # Options menu block.
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["MAIN_MENU_BTN"] for lang in texts.values()]
-)
+@text_router.text("MAIN_MENU_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def main_menu(message: types.Message) -> None:
     """Get back to main menu.
@@ -458,13 +500,13 @@ def main_menu(message: types.Message) -> None:
         message: Main menu request from Customer.
 
     """
-    cus_bot.delete_message(message.from_user.id, message.id)
+    effects.delete(message.from_user.id, message.id)
     show_main_menu(message)
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["CONTACT_SUPPORT_BTN"] for lang in texts.values()]
-)
+@text_router.text("CONTACT_SUPPORT_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def contact_support(message: types.Message) -> None:
     """Start support request sequence.
@@ -474,7 +516,7 @@ def contact_support(message: types.Message) -> None:
 
     """
     msg = DBInterface(message)
-    cus_bot.delete_message(msg.data_to_read.from_user.id, msg.data_to_read.id)
+    effects.delete(msg.data_to_read.from_user.id, msg.data_to_read.id)
     cus_bot.send_message(
         msg.data_to_read.from_user.id,
         texts[msg.get_customer_lang()]["CUS_SUPPORT_MSG"],
@@ -482,11 +524,9 @@ def contact_support(message: types.Message) -> None:
     )
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.reply_to_message \
-                         and message.reply_to_message.text \
-                         in [lang["CUS_SUPPORT_MSG"] for lang in texts.values()]
-)
+@text_router.reply("CUS_SUPPORT_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def message_to_support(message: types.Message) -> None:
     """Forward message from Customer to Support.
@@ -497,7 +537,8 @@ def message_to_support(message: types.Message) -> None:
     """
     msg = DBInterface(message)
     support = msg.get_support()
-    adm_bot.send_message(
+    send_queue.send(
+        adm_bot.send_message,
         support[0],
         texts[support[1]]["SUPPORT_FR_CUS_MSG"](
             msg.data_to_read.from_user.username,
@@ -512,10 +553,9 @@ def message_to_support(message: types.Message) -> None:
     show_main_menu(msg.data_to_read)
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.text \
-                         in [lang["RESET_CONTACT_INFO_BTN"] for lang in texts.values()]
-)
+@text_router.text("RESET_CONTACT_INFO_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def reset_contact_info(message: types.Message) -> None:
     """Ask Customer for contact info reset confirmation.
@@ -532,9 +572,9 @@ def reset_contact_info(message: types.Message) -> None:
     )
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["DELETE_PROFILE_BTN"] for lang in texts.values()]
-)
+@text_router.text("DELETE_PROFILE_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def delete_profile(message: types.Message) -> None:
     """Ask Customer for profile deletion confirmation.
@@ -552,9 +592,9 @@ def delete_profile(message: types.Message) -> None:
 
 
 # Language change menu.
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["CHANGE_LANG_BTN"] for lang in texts.values()]
-)
+@text_router.text("CHANGE_LANG_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def change_lang_menu(message: types.Message) -> None:
     """Open language select menu.
@@ -564,7 +604,7 @@ def change_lang_menu(message: types.Message) -> None:
 
     """
     msg = DBInterface(message)
-    cus_bot.delete_message(msg.data_to_read.from_user.id, msg.data_to_read.id)
+    effects.delete(msg.data_to_read.from_user.id, msg.data_to_read.id)
     cus_bot.send_message(
         msg.data_to_read.from_user.id,
         texts[msg.get_customer_lang()]["LANG_SEL_MENU"],
@@ -577,9 +617,9 @@ def change_lang_menu(message: types.Message) -> None:
     )
 
 
-@cus_bot.callback_query_handler(
-    func=lambda call: call.message.text in [lang["CHANGE_LANG_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("CHANGE_LANG_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def lang_set(call: types.CallbackQuery) -> None:
     """Change bot interface language.
@@ -590,18 +630,18 @@ def lang_set(call: types.CallbackQuery) -> None:
     """
     callback = DBInterface(call)
     callback.set_customer_lang()
-    cus_bot.delete_message(
+    effects.delete(
         callback.data_to_read.from_user.id,
         (callback.data_to_read.message.id - 1)
     )
-    cus_bot.delete_message(callback.data_to_read.from_user.id, callback.data_to_read.message.id)
+    effects.delete(callback.data_to_read.from_user.id, callback.data_to_read.message.id)
     show_main_menu(callback_to_msg(callback.data_to_read))
 
 
 # Contact Info reset block.
-@cus_bot.message_handler(
-    func=lambda message: message.text in [lang["CONFIRM_RESET_BTN"] for lang in texts.values()]
-)
+@text_router.text("CONFIRM_RESET_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def confirm_reset(message: types.Message) -> None:
     """Commence contact info reset sequence.
@@ -620,10 +660,9 @@ def confirm_reset(message: types.Message) -> None:
 
 
 # Profile deletion block.
-@cus_bot.message_handler(
-    func=lambda message: message.text \
-                         in [lang["CONFIRM_DELETE_PROFILE_BTN"] for lang in texts.values()]
-)
+@text_router.text("CONFIRM_DELETE_PROFILE_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def confirm_delete(message: types.Message) -> None:
     """Delete Customer's profile from DB.
@@ -643,6 +682,8 @@ def confirm_delete(message: types.Message) -> None:
 
 # Creating order sequence block.
 @cus_bot.callback_query_handler(func=lambda call: call.message.location)
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def check_location_confirmation(call: types.CallbackQuery) -> None:
     """Process Customer's response to location confirmation request.
@@ -655,8 +696,8 @@ def check_location_confirmation(call: types.CallbackQuery) -> None:
 
     """
     callback = DBInterface(call)
-    cus_bot.delete_message(callback.data_to_read.from_user.id, callback.data_to_read.message.id)
-    cus_bot.delete_message(
+    effects.delete(callback.data_to_read.from_user.id, callback.data_to_read.message.id)
+    effects.delete(
         callback.data_to_read.from_user.id,
         (callback.data_to_read.message.id - 1)
     )
@@ -675,10 +716,9 @@ def check_location_confirmation(call: types.CallbackQuery) -> None:
         )
 
 
-@cus_bot.callback_query_handler(
-    func=lambda call: call.message.text \
-                      in [lang["CHOOSE_REST_TYPE_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("CHOOSE_REST_TYPE_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def rest_type_chosen(call: types.CallbackQuery) -> None:
     """Process Customer's response to restaurant type selection. Show
@@ -699,7 +739,7 @@ def rest_type_chosen(call: types.CallbackQuery) -> None:
             callback.data_to_read.id,
             texts[callback.get_customer_lang()]["EXITING_ORDER_MENU_MSG"]
         )
-        cus_bot.delete_message(
+        effects.delete(
             callback.data_to_read.from_user.id,
             callback.data_to_read.message.id
         )
@@ -707,7 +747,7 @@ def rest_type_chosen(call: types.CallbackQuery) -> None:
         show_main_menu(callback_to_msg(callback.data_to_read))
     else:
         callback.add_to_cart("restaurant_type")
-        cus_bot.edit_message_text(
+        effects.edit_text(
             texts[callback.get_customer_lang()]["REST_TYPE_SELECTED_MSG"](
                 callback.data_to_read.data
             ),
@@ -721,9 +761,9 @@ def rest_type_chosen(call: types.CallbackQuery) -> None:
         )
 
 
-@cus_bot.callback_query_handler(
-    func=lambda call: call.message.text in [lang["CHOOSE_REST_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("CHOOSE_REST_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def restaurant_chosen(call: types.CallbackQuery) -> None:
     """Process Customer's response to restaurant selection. Show
@@ -737,13 +777,10 @@ def restaurant_chosen(call: types.CallbackQuery) -> None:
 
     """
     callback = DBInterface(call)
-    try:
-        cus_bot.delete_message(
-            callback.data_to_read.from_user.id,
-            (callback.data_to_read.message.id - 1)
-        )
-    except ApiTelegramException:
-        pass
+    effects.delete(
+        callback.data_to_read.from_user.id,
+        (callback.data_to_read.message.id - 1)
+    )
     if callback.data_to_read.data == customer_menus.back_button(
             callback.get_customer_lang()
     ).callback_data:
@@ -752,7 +789,7 @@ def restaurant_chosen(call: types.CallbackQuery) -> None:
             texts[callback.get_customer_lang()]["DELETING_CART_ALERT"],
             show_alert=True
         )
-        cus_bot.delete_message(
+        effects.delete(
             callback.data_to_read.from_user.id,
             callback.data_to_read.message.id
         )
@@ -760,7 +797,7 @@ def restaurant_chosen(call: types.CallbackQuery) -> None:
         show_main_menu(callback_to_msg(callback.data_to_read))
     else:
         callback.add_to_cart("restaurant_uuid")
-        cus_bot.edit_message_text(
+        effects.edit_text(
             texts[callback.get_customer_lang()]["REST_SELECTED_MSG"](callback.rest_name_by_uuid()),
             callback.data_to_read.from_user.id,
             callback.data_to_read.message.id
@@ -775,10 +812,9 @@ def restaurant_chosen(call: types.CallbackQuery) -> None:
         )
 
 
-@cus_bot.callback_query_handler(
-    func=lambda call: call.message.text \
-                      in [lang["CHOOSE_DISH_CATEGORY_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("CHOOSE_DISH_CATEGORY_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def dish_category_chosen(call: types.CallbackQuery) -> None:
     """Process Customer's response to dish category selection. Show
@@ -793,18 +829,15 @@ def dish_category_chosen(call: types.CallbackQuery) -> None:
 
     """
     callback = DBInterface(call)
-    try:
-        cus_bot.delete_message(
-            callback.data_to_read.from_user.id,
-            (callback.data_to_read.message.id - 1)
-        )
-    except ApiTelegramException:
-        pass
+    effects.delete(
+        callback.data_to_read.from_user.id,
+        (callback.data_to_read.message.id - 1)
+    )
     if callback.data_to_read.data == customer_menus.back_button(
             callback.get_customer_lang()
     ).callback_data:
         callback.delete_from_cart("restaurant_uuid")
-        callback.data_to_read.data = callback.get_from_cart("restaurant_type")
+        callback.data_to_read.data = callback.get_cart().restaurant_type
         rest_type_chosen(callback.data_to_read)
     elif callback.data_to_read.data == customer_menus.cancel_order_button(
             callback.get_customer_lang()
@@ -815,7 +848,7 @@ def dish_category_chosen(call: types.CallbackQuery) -> None:
     ).callback_data:
         is_dish_added(callback.data_to_read)
     else:
-        cus_bot.edit_message_text(
+        effects.edit_text(
             texts[callback.get_customer_lang()]["DISH_CAT_SELECTED_MSG"](
                 callback.data_to_read.data
             ),
@@ -829,9 +862,9 @@ def dish_category_chosen(call: types.CallbackQuery) -> None:
         )
 
 
-@cus_bot.callback_query_handler(
-    func=lambda call: call.message.text in [lang["CHOOSE_DISH_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("CHOOSE_DISH_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def dish_chosen(call: types.CallbackQuery) -> None:
     """Process Customer's response to dish selection. Show Customer dish
@@ -846,17 +879,14 @@ def dish_chosen(call: types.CallbackQuery) -> None:
 
     """
     callback = DBInterface(call)
-    try:
-        cus_bot.delete_message(
-            callback.data_to_read.from_user.id,
-            (callback.data_to_read.message.id - 1)
-        )
-    except ApiTelegramException:
-        pass
+    effects.delete(
+        callback.data_to_read.from_user.id,
+        (callback.data_to_read.message.id - 1)
+    )
     if callback.data_to_read.data == customer_menus.back_button(
             callback.get_customer_lang()
     ).callback_data:
-        callback.data_to_read.data = callback.get_from_cart("restaurant_uuid")
+        callback.data_to_read.data = callback.get_cart().restaurant_uuid
         restaurant_chosen(callback.data_to_read)
     elif callback.data_to_read.data == customer_menus.cancel_order_button(
             callback.get_customer_lang()
@@ -867,7 +897,7 @@ def dish_chosen(call: types.CallbackQuery) -> None:
     ).callback_data:
         is_dish_added(callback.data_to_read)
     else:
-        cus_bot.edit_message_text(
+        effects.edit_text(
             texts[callback.get_customer_lang()]["DISH_SELECTED_MSG"](callback.get_dish()),
             callback.data_to_read.from_user.id,
             callback.data_to_read.message.id
@@ -879,9 +909,9 @@ def dish_chosen(call: types.CallbackQuery) -> None:
         )
 
 
-@cus_bot.callback_query_handler(
-    func=lambda call: call.message.text in [lang["ADD_DISH_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("ADD_DISH_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def is_dish_added(call: types.CallbackQuery) -> None:
     """Process Customer's response to selected dish confirmation. Show
@@ -894,43 +924,32 @@ def is_dish_added(call: types.CallbackQuery) -> None:
 
     """
     callback = DBInterface(call)
-    try:
-        cus_bot.delete_message(
-            callback.data_to_read.from_user.id,
-            (callback.data_to_read.message.id - 1)
-        )
-    except ApiTelegramException:
-        pass
+    effects.delete(
+        callback.data_to_read.from_user.id,
+        (callback.data_to_read.message.id - 1)
+    )
     if callback.data_to_read.data == customer_menus.back_button(
             callback.get_customer_lang()
     ).callback_data:
-        callback.data_to_read.data = callback.get_from_cart("restaurant_uuid")
+        callback.data_to_read.data = callback.get_cart().restaurant_uuid
         restaurant_chosen(callback.data_to_read)
     else:
         if callback.data_to_read.data != customer_menus.cart_button(
                 callback.get_customer_lang()
         ).callback_data:
-            new_callback = DBInterface(call)
-            dishes_uuids = callback.get_from_cart("dishes_uuids")
-            if not dishes_uuids:
-                dishes_uuids = []
+            dishes_uuids = list(callback.get_cart().dishes_uuids or [])
             dishes_uuids.append(callback.data_to_read.data)
-            new_callback.data_to_read.data = dishes_uuids
-            new_callback.add_to_cart("dishes_uuids")
-            prices_calc(new_callback.data_to_read)
-        callback.data_to_read.data = callback.get_from_cart("dishes_uuids")
-        dishes = []
-        if callback.data_to_read.data:
-            for dish in callback.data_to_read.data:
-                callback.data_to_read.data = dish
-                dishes.append(callback.get_dish()[0])
-        cus_bot.edit_message_text(
+            callback.update_cart(dishes_uuids=dishes_uuids)
+            prices_calc(callback.data_to_read)
+        cart = callback.get_cart()
+        dishes = [dish[1] for dish in callback.get_dishes_by_uuids(cart.dishes_uuids)]
+        effects.edit_text(
             texts[callback.get_customer_lang()]["YOUR_CART_MSG"](
                 "\n".join(sorted(dishes)),
-                callback.get_from_cart("subtotal"),
-                callback.get_from_cart("courier_fee"),
-                callback.get_from_cart("service_fee"),
-                callback.get_from_cart("total")
+                cart.subtotal,
+                cart.courier_fee,
+                cart.service_fee,
+                cart.total
             ),
             callback.data_to_read.from_user.id,
             callback.data_to_read.message.id
@@ -942,17 +961,15 @@ def is_dish_added(call: types.CallbackQuery) -> None:
         )
 
 
-@cus_bot.callback_query_handler(
-    func=lambda call: call.message.text in [lang["CART_ACTIONS_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("CART_ACTIONS_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def cart_actions(call: types.CallbackQuery) -> None:
     """Process Customer's input from cart actions menu. Clear cart if
     corresponding button is clicked. Call item deletion menu on request.
-    Return Customer to dish category selection menu on request. Generate
-    payment URL and proceed to payment menu on request if payment URL
-    has been generated successfully otherwise send "payment URL
-    generation failed" message to Customer.
+    Return Customer to dish category selection menu on request. Make
+    order on request.
 
     Args:
         call: Callback query with Customer's input from cart actions
@@ -960,7 +977,7 @@ def cart_actions(call: types.CallbackQuery) -> None:
 
     """
     callback = DBInterface(call)
-    cus_bot.delete_message(
+    effects.delete(
         callback.data_to_read.from_user.id,
         (callback.data_to_read.message.id - 1)
     )
@@ -969,18 +986,18 @@ def cart_actions(call: types.CallbackQuery) -> None:
     ).callback_data:
         clear_cart(callback.data_to_read)
     elif callback.data_to_read.data == texts[callback.get_customer_lang()]["DELETE_ITEM_BTN"]:
-        cus_bot.edit_message_text(
+        effects.edit_text(
             texts[callback.get_customer_lang()]["DELETE_ITEM_MSG"],
             callback.data_to_read.from_user.id,
             callback.data_to_read.message.id,
             reply_markup=customer_menus.item_deletion_menu(callback.get_customer_lang(), callback)
         )
     elif callback.data_to_read.data == texts[callback.get_customer_lang()]["ADD_MORE_BTN"]:
-        callback.data_to_read.data = callback.get_from_cart("restaurant_uuid")
+        callback.data_to_read.data = callback.get_cart().restaurant_uuid
         callback.data_to_read.message.text = texts[callback.get_customer_lang()]["ADD_MORE_BTN"]
         restaurant_chosen(callback.data_to_read)
     elif callback.data_to_read.data == texts[callback.get_customer_lang()]["ADD_COMMENT_BTN"]:
-        cus_bot.delete_message(
+        effects.delete(
             callback.data_to_read.from_user.id,
             callback.data_to_read.message.id
         )
@@ -990,36 +1007,64 @@ def cart_actions(call: types.CallbackQuery) -> None:
             reply_markup=types.ForceReply()
         )
     elif callback.data_to_read.data == texts[callback.get_customer_lang()]["MAKE_ORDER_BTN"]:
+        # Made after the commit, still before the next update of the chat.
+        on_commit(make_order, callback.data_to_read)
+
+
+# No unit of work around the handler: PayPal is called between the
+# short transactions creating the order and storing its PayPal order.
+@effects.batch()
+@logger_decorator_callback
+def make_order(call: types.CallbackQuery) -> None:
+    """Create order from Customer's cart and its PayPal order. Show
+    Customer payment menu, clear the cart and show main menu if payment
+    URL has been generated successfully, otherwise cancel the order and
+    send "payment URL generation failed" message.
+
+    Args:
+        call: Callback query from "make order" button of cart actions
+            menu.
+
+    """
+    callback = DBInterface(call)
+    cus_bot.answer_callback_query(callback.data_to_read.id)
+    with unit_of_work():
         order_info = callback.order_creation()
-        if paypal_order_info := paypal.pp_order_creation(order_info[0]):
-            payment_url = paypal_order_info["URL"]
-            pp_order_id = paypal_order_info["order_id"]
+    if order_info and (paypal_order_info := paypal.pp_order_creation(order_info[0])):
+        payment_url = paypal_order_info["URL"]
+        pp_order_id = paypal_order_info["order_id"]
+        # The cart is cleared here once, so payment handlers running in
+        # background never have to touch it.
+        with unit_of_work():
             callback.update_order(order_info[0], "paypal_order_id", pp_order_id)
-            cus_bot.edit_message_text(
-                texts[callback.get_customer_lang()]["ORDER_CREATED_MSG"](order_info),
-                callback.data_to_read.from_user.id,
-                callback.data_to_read.message.id
-            )
-            cus_bot.send_message(
-                callback.data_to_read.from_user.id,
-                texts[callback.get_customer_lang()]["PAYMENT_MENU_MSG"](payment_url),
-                reply_markup=customer_menus.payment_menu(
-                    callback.get_customer_lang(),
-                    order_info[0]
-                )
-            )
-        else:
-            cus_bot.send_message(
-                callback.data_to_read.from_user.id,
-                texts[callback.get_customer_lang()]["PAYPAL_ORDER_CREATION_FAIL_MSG"]
+            callback.delete_cart()
+        effects.edit_text(
+            texts[callback.get_customer_lang()]["ORDER_CREATED_MSG"](order_info),
+            callback.data_to_read.from_user.id,
+            callback.data_to_read.message.id
+        )
+        cus_bot.send_message(
+            callback.data_to_read.from_user.id,
+            texts[callback.get_customer_lang()]["PAYMENT_MENU_MSG"](payment_url),
+            reply_markup=customer_menus.payment_menu(
+                callback.get_customer_lang(),
+                order_info[0]
             )
+        )
+        show_main_menu(callback_to_msg(callback.data_to_read))
+    else:
+        if order_info:
+            with unit_of_work():
+                callback.update_order(order_info[0], "order_status", "-1")
+        cus_bot.send_message(
+            callback.data_to_read.from_user.id,
+            texts[callback.get_customer_lang()]["PAYPAL_ORDER_CREATION_FAIL_MSG"]
+        )
 
 
-@cus_bot.message_handler(
-    func=lambda message: message.reply_to_message \
-                         and message.reply_to_message.text \
-                         in [lang["ADD_COMMENT_MSG"] for lang in texts.values()]
-)
+@text_router.reply("ADD_COMMENT_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_msg
 def add_comment_menu(message: types.Message) -> None:
     """Add comment for order.
@@ -1031,8 +1076,8 @@ def add_comment_menu(message: types.Message) -> None:
     msg = DBInterface(message)
     msg.data_to_read.data = msg.data_to_read.text
     msg.add_to_cart("order_comment")
-    cus_bot.delete_message(msg.data_to_read.from_user.id, msg.data_to_read.id)
-    cus_bot.delete_message(msg.data_to_read.from_user.id, msg.data_to_read.reply_to_message.id)
+    effects.delete(msg.data_to_read.from_user.id, msg.data_to_read.id)
+    effects.delete(msg.data_to_read.from_user.id, msg.data_to_read.reply_to_message.id)
     cus_bot.send_message(
         msg.data_to_read.from_user.id,
         texts[msg.get_customer_lang()]["COMMENT_ADDED_MSG"]
@@ -1044,9 +1089,9 @@ def add_comment_menu(message: types.Message) -> None:
     )
 
 
-@cus_bot.callback_query_handler(
-    func=lambda call: call.data in [lang["CART_BTN"] for lang in texts.values()]
-)
+@callback_router.data("CART_BTN")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def return_to_cart_after_comment(call: types.CallbackQuery) -> None:
     """Return Customer to cart menu after comment addition.
@@ -1058,9 +1103,9 @@ def return_to_cart_after_comment(call: types.CallbackQuery) -> None:
     dish_chosen(call)
 
 
-@cus_bot.callback_query_handler(
-    func=lambda call: call.message.text in [lang["DELETE_ITEM_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("DELETE_ITEM_MSG")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def item_deletion(call: types.CallbackQuery) -> None:
     """Delete selected item from Customer's cart. Call cart menu.
@@ -1074,10 +1119,9 @@ def item_deletion(call: types.CallbackQuery) -> None:
     if callback.data_to_read.data != customer_menus.cart_button(
             callback.get_customer_lang()
     ).callback_data:
-        if dishes_uuids := callback.get_from_cart("dishes_uuids"):
+        if dishes_uuids := list(callback.get_cart().dishes_uuids or []):
             dishes_uuids.remove(callback.data_to_read.data)
-            callback.data_to_read.data = dishes_uuids
-            callback.add_to_cart("dishes_uuids")
+            callback.update_cart(dishes_uuids=dishes_uuids)
         prices_calc(callback.data_to_read)
     callback.data_to_read.data = customer_menus.cart_button(
         callback.get_customer_lang()
@@ -1086,73 +1130,151 @@ def item_deletion(call: types.CallbackQuery) -> None:
 
 
 # Payment block.
-@cus_bot.callback_query_handler(func=lambda call: "paid" in call.data)
+# No unit of work around the handlers: status of a captured payment and
+# the payout job must stay committed even if sending notifications
+# afterwards fails.
+@logger_decorator
+def settle_payment(order_uuid: str, captured: bool = False) -> bool | None:
+    """Capture payment of the order unless PayPal reported it captured,
+    mark order paid, queue payout to the Restaurant and send it the
+    order. Whichever of "paid" button and PayPal webhook comes first
+    settles the payment, orders not awaiting payment are skipped.
+
+    Args:
+        order_uuid: Order UUID.
+        captured: PayPal reported the payment captured already.
+
+    Returns:
+        True if payment has been settled now, False if it could not be
+        captured, None if order was skipped.
+
+    """
+    # No transaction is open while PayPal captures the payment: capture
+    # requests of one order carry the same request ID, so PayPal captures
+    # it once however many taps and events come in meanwhile. The status
+    # is then changed by whichever handler locks the order first.
+    if not captured:
+        if (order := DBInterface.get_order(order_uuid)) is None or order.order_status != "1":
+            return None
+        if not paypal.pp_capture_order(order_uuid):
+            return False
+    with unit_of_work():
+        if (status := DBInterface.lock_order(order_uuid)) == "-1":
+            logger.error(f"Payment of cancelled order {order_uuid} was captured, refund it.")
+        if status != "1":
+            return None
+        DBInterface.update_order(order_uuid, "order_status", "2")
+        enqueue_rest_payout(order_uuid)
+    order = DBInterface.get_order(order_uuid)
+    send_queue.send(
+        rest_bot.send_message,
+        order.restaurant_id,
+        texts[order.restaurant_lang]["REST_NEW_ORDER_MSG"](
+            order_uuid,
+            order.dishes,
+            order.dishes_subtotal,
+            order.order_comment
+        ),
+        reply_markup=customer_menus.rest_accept_order_menu(order.restaurant_lang, order_uuid)
+    )
+    return True
+
+
+# Runs in background, outside of the chat's order of updates, so it only
+# sends and edits messages and leaves cart and menus state alone.
+@callback_router.action("paid")
+@deferred_callbacks.deferred()
+@effects.batch()
 @logger_decorator_callback
 def order_paid(call: types.CallbackQuery) -> None:
-    """Process "paid" button, Send payment capture request to PayPal and
-    send order to the Restaurant if payment was captured.
+    """Process "paid" button, settle payment of the order and replace
+    payment menu with the confirmation if payment was captured. If the
+    payment is being settled on PayPal webhook event meanwhile, Customer
+    is asked to wait, if it has been settled already, the payment menu
+    is replaced with the confirmation.
 
     Args:
         call: Callback query from "paid" button with order UUID in it.
 
     """
     callback = DBInterface(call)
-    if paypal.pp_capture_order(callback.data_to_read.data.split(maxsplit=1)[1]):
-        callback.update_order(callback.data_to_read.data.split(maxsplit=1)[1], "order_status", "2")
-        rest_bot.send_message(
-            callback.get_order_info(
-                callback.data_to_read.data.split(maxsplit=1)[1],
-                "restaurant_id"
-            ),
-            texts[
-                callback.get_restaurant_lang(
-                    callback.get_order_info(
-                        callback.data_to_read.data.split(maxsplit=1)[1],
-                        "restaurant_uuid"
-                    )
-                )
-            ]["REST_NEW_ORDER_MSG"](
-                callback.data_to_read.data.split(maxsplit=1)[1],
-                callback.get_order_info(callback.data_to_read.data.split(maxsplit=1)[1], "dishes"),
-                callback.get_order_info(
-                    callback.data_to_read.data.split(maxsplit=1)[1],
-                    "dishes_subtotal"
-                ),
-                callback.get_order_info(
-                    callback.data_to_read.data.split(maxsplit=1)[1],
-                    "order_comment"
-                )
-            ),
-            reply_markup=customer_menus.rest_accept_order_menu(
-                callback.get_restaurant_lang(
-                    callback.get_order_info(
-                        callback.data_to_read.data.split(maxsplit=1)[1],
-                        "restaurant_uuid"
-                    )
-                ),
-                callback.data_to_read.data.split(maxsplit=1)[1]
-            )
-        )
-        cus_bot.edit_message_text(
-            texts[callback.get_customer_lang()]["CUS_PAYMENT_CONFIRMED_MSG"](
-                callback.data_to_read.data.split(maxsplit=1)[1]
-            ),
+    order_uuid = callback.data_to_read.data
+    if (settled := settle_payment(order_uuid)) is True:
+        effects.edit_text(
+            texts[callback.get_customer_lang()]["CUS_PAYMENT_CONFIRMED_MSG"](order_uuid),
             callback.data_to_read.from_user.id,
             callback.data_to_read.message.id
         )
-        paypal.pp_rest_payout(callback.data_to_read.data.split(maxsplit=1)[1])
-        callback.delete_cart()
-        show_main_menu(callback_to_msg(callback.data_to_read))
-    else:
+    elif settled is False:
         cus_bot.send_message(
             callback.data_to_read.from_user.id,
-            texts[callback.get_customer_lang()]["WAIT_FOR_CONFIRMATION_MSG"](
-                callback.data_to_read.data.split(maxsplit=1)[1]
-            )
+            texts[callback.get_customer_lang()]["WAIT_FOR_CONFIRMATION_MSG"](order_uuid)
         )
+    elif (order := callback.get_order(order_uuid)) and order.order_status == "1":
+        cus_bot.send_message(
+            callback.data_to_read.from_user.id,
+            texts[callback.get_customer_lang()]["PAYMENT_PROCESSING_MSG"](order_uuid)
+        )
+    elif order and order.order_status != "-1":
+        effects.edit_text(
+            texts[callback.get_customer_lang()]["CUS_PAYMENT_CONFIRMED_MSG"](order_uuid),
+            callback.data_to_read.from_user.id,
+            callback.data_to_read.message.id
+        )
+
+
+# Runs in background of the webhook, outside of the chat's order of
+# updates, so it only sends messages and leaves the cart alone.
+@logger_decorator
+def settle_paypal_order(paypal_order_id: str, captured: bool = False) -> None:
+    """Settle payment of order approved or paid by Customer in PayPal
+    and let Customer know.
+
+    Args:
+        paypal_order_id: PayPal order ID.
+        captured: PayPal reported the payment captured already.
+
+    """
+    if (order_uuid := DBInterface.get_order_uuid(paypal_order_id)) is None:
+        logger.info(f"No order found for PayPal order {paypal_order_id}.")
+        return None
+    if settle_payment(order_uuid, captured) is not True:
+        return None
+    msg = DBInterface(customer_msg(DBInterface.get_order(order_uuid).customer_id))
+    cus_bot.send_message(
+        msg.data_to_read.from_user.id,
+        texts[msg.get_customer_lang()]["CUS_PAYMENT_CONFIRMED_MSG"](order_uuid)
+    )
 
 
-@cus_bot.callback_query_handler(func=lambda call: "order_closed" in call.data)
+@paypal_webhook.on("CHECKOUT.ORDER.APPROVED")
+def paypal_order_approved(event: Dict[str, Any]) -> None:
+    """Capture payment of order approved by Customer in PayPal.
+
+    Args:
+        event: PayPal webhook event with PayPal order in it.
+
+    """
+    settle_paypal_order(event["resource"]["id"])
+
+
+@paypal_webhook.on("PAYMENT.CAPTURE.COMPLETED")
+def paypal_capture_completed(event: Dict[str, Any]) -> None:
+    """Settle payment of order captured in PayPal.
+
+    Args:
+        event: PayPal webhook event with PayPal capture in it.
+
+    """
+    settle_paypal_order(
+        event["resource"]["supplementary_data"]["related_ids"]["order_id"],
+        captured=True
+    )
+
+
+@callback_router.action("order_closed")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def order_closed(call: types.CallbackQuery) -> None:
     """Process confirmation of order receiving from Customer.
@@ -1164,19 +1286,22 @@ def order_closed(call: types.CallbackQuery) -> None:
     """
     callback = DBInterface(call)
     callback.close_order()
-    cus_bot.edit_message_reply_markup(
+    effects.edit_reply_markup(
         callback.data_to_read.from_user.id,
         callback.data_to_read.message.id
     )
-    cus_bot.send_message(
+    on_commit(
+        cus_bot.send_message,
         callback.data_to_read.from_user.id,
         texts[callback.get_customer_lang()]["ORDER_CLOSED_MSG"](
-            callback.data_to_read.data.split(maxsplit=1)[-1]
+            callback.data_to_read.data
         )
     )
 
 
-@cus_bot.callback_query_handler(func=lambda call: "cancel" in call.data)
+@callback_router.action("cancel")
+@effects.batch()
+@unit_of_work()
 @logger_decorator_callback
 def cancel(call: types.CallbackQuery) -> None:
     """Process order cancellation button after order is already created.
@@ -1187,11 +1312,18 @@ def cancel(call: types.CallbackQuery) -> None:
 
     """
     callback = DBInterface(call)
+    if DBInterface.lock_order(callback.data_to_read.data) != "1":
+        # Paid on PayPal webhook event meanwhile, the menu is stale.
+        effects.edit_reply_markup(
+            callback.data_to_read.from_user.id,
+            callback.data_to_read.message.id
+        )
+        return None
     callback.delete_cart()
-    callback.update_order(callback.data_to_read.data.split(maxsplit=1)[-1], "order_status", "-1")
-    cus_bot.edit_message_text(
+    callback.update_order(callback.data_to_read.data, "order_status", "-1")
+    effects.edit_text(
         texts[callback.get_customer_lang()]["CANCEL_MSG"](
-            callback.data_to_read.data.split(maxsplit=1)[-1]
+            callback.data_to_read.data
         ),
         callback.data_to_read.from_user.id,
         callback.data_to_read.message.id
@@ -1201,7 +1333,8 @@ def cancel(call: types.CallbackQuery) -> None:
 
 def main():
     logger.info("The bot is running.")
-    cus_bot.infinity_polling()
+    metrics.start_reporter()
+    bot_runner.run({"customer": cus_bot})
 
 
 if __name__ == "__main__":
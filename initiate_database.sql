@@ -83,6 +83,8 @@ CREATE TABLE orders
     paypal_order_id   VARCHAR         NOT NULL
 );
 
+CREATE INDEX orders_paypal_order_id_idx ON orders (paypal_order_id);
+
 
 CREATE TABLE cart
 (
@@ -98,4 +100,34 @@ CREATE TABLE cart
 );
 
 
+CREATE TABLE payout_jobs
+(
+    order_uuid      uuid      NOT NULL PRIMARY KEY,
+    job_status      VARCHAR   NOT NULL DEFAULT 'pending',
+    attempts        INTEGER   NOT NULL DEFAULT 0,
+    run_after       TIMESTAMP NOT NULL DEFAULT now(),
+    payout_batch_id VARCHAR   NOT NULL DEFAULT '',
+    last_error      VARCHAR   NOT NULL DEFAULT '',
+    created_date    TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX payout_jobs_pending_idx ON payout_jobs (run_after) WHERE job_status = 'pending';
+
+
+CREATE TABLE payroll_runs
+(
+    sender_batch_id VARCHAR          NOT NULL PRIMARY KEY,
+    run_status      VARCHAR          NOT NULL DEFAULT 'pending',
+    admin_id        BIGINT           NOT NULL,
+    courier_ids     BIGINT[]         NOT NULL,
+    amounts         NUMERIC(10, 2)[] NOT NULL,
+    settled_ids     BIGINT[]         NOT NULL DEFAULT '{}',
+    payout_batch_id VARCHAR          NOT NULL DEFAULT '',
+    run_after       TIMESTAMP        NOT NULL DEFAULT now(),
+    created_date    TIMESTAMP        NOT NULL DEFAULT now()
+);
+
+CREATE INDEX payroll_runs_open_idx ON payroll_runs (run_after) WHERE run_status IN ('pending', 'sent', 'unknown');
+
+
 CREATE EXTENSION "pgcrypto";
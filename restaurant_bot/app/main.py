@@ -3,11 +3,18 @@ import telebot.types as types
 import restaurant_menus
 from restaurant_translations import texts
 from restaurant_db_tools import Interface as DBInterface
-from tools.bots_initialization import adm_bot, courier_bot, cus_bot, rest_bot
+from tools import bot_runner, metrics
+from tools.bots_initialization import adm_bot, courier_bot, cus_bot, rest_bot, send_queue
+from tools.callback_data import CallbackRouter
+from tools.cursor_tool import on_commit, unit_of_work
 from tools.logger_tool import logger, logger_decorator_msg, logger_decorator_callback
 
+callback_router = CallbackRouter(texts)
+callback_router.register(rest_bot)
+
 
 @rest_bot.message_handler(commands=["start"])
+@unit_of_work()
 @logger_decorator_msg
 def start(message: types.Message) -> None:
     """Process /start command from the User.
@@ -32,6 +39,7 @@ def start(message: types.Message) -> None:
                          and message.reply_to_message.text \
                          in [lang["ASK_REGISTRATION_MSG"] for lang in texts.values()]
 )
+@unit_of_work()
 @logger_decorator_msg
 def ask_registration(message: types.Message) -> None:
     """Send registration request to an Admin.
@@ -42,7 +50,8 @@ def ask_registration(message: types.Message) -> None:
     """
     msg = DBInterface(message)
     support = msg.get_support()
-    adm_bot.send_message(
+    send_queue.send(
+        adm_bot.send_message,
         support[0],
         texts[support[1]]["REG_REQUEST_MSG"](
             msg.data_to_read.from_user.username,
@@ -54,6 +63,7 @@ def ask_registration(message: types.Message) -> None:
 
 
 @rest_bot.message_handler(commands=["select_language"])
+@unit_of_work()
 @logger_decorator_msg
 def change_lang_menu(message: types.Message) -> None:
     """Open language select menu.
@@ -71,9 +81,8 @@ def change_lang_menu(message: types.Message) -> None:
     )
 
 
-@rest_bot.callback_query_handler(
-    func= lambda call: call.message.text in [lang["CHANGE_LANG_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("CHANGE_LANG_MSG")
+@unit_of_work()
 @logger_decorator_callback
 def lang_set(call: types.CallbackQuery) -> None:
     """Change bot interface language.
@@ -96,6 +105,7 @@ def lang_set(call: types.CallbackQuery) -> None:
 
 
 @rest_bot.message_handler(commands=["item_available"])
+@unit_of_work()
 @logger_decorator_msg
 def dish_available_command(message: types.Message) -> None:
     """Process /item_available command from User.
@@ -112,10 +122,8 @@ def dish_available_command(message: types.Message) -> None:
     )
 
 
-@rest_bot.callback_query_handler(
-    func=lambda call: call.message.text \
-                      in [lang["DISH_AVAILABLE_SELECT_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("DISH_AVAILABLE_SELECT_MSG")
+@unit_of_work()
 @logger_decorator_callback
 def dish_available_select(call: types.CallbackQuery) -> None:
     """Process User input from "dish available" menu.
@@ -134,6 +142,7 @@ def dish_available_select(call: types.CallbackQuery) -> None:
 
 
 @rest_bot.message_handler(commands=["item_unavailable"])
+@unit_of_work()
 @logger_decorator_msg
 def dish_unavailable_command(message: types.Message) -> None:
     """Process /item_unavailable command from User.
@@ -150,10 +159,8 @@ def dish_unavailable_command(message: types.Message) -> None:
     )
 
 
-@rest_bot.callback_query_handler(
-    func=lambda call: call.message.text \
-                      in [lang["DISH_UNAVAILABLE_SELECT_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("DISH_UNAVAILABLE_SELECT_MSG")
+@unit_of_work()
 @logger_decorator_callback
 def dish_unavailable_select(call: types.CallbackQuery) -> None:
     """Process User input from "dish unavailable" menu.
@@ -172,6 +179,7 @@ def dish_unavailable_select(call: types.CallbackQuery) -> None:
 
 
 @rest_bot.message_handler(commands=["add_item"])
+@unit_of_work()
 @logger_decorator_msg
 def add_dish_command(message: types.Message) -> None:
     """Process /add_item command from User.
@@ -194,6 +202,7 @@ def add_dish_command(message: types.Message) -> None:
 
 
 @rest_bot.message_handler(commands=["edit_item"])
+@unit_of_work()
 @logger_decorator_msg
 def edit_dish_command(message: types.Message) -> None:
     """Process /edit_item command from User.
@@ -210,9 +219,8 @@ def edit_dish_command(message: types.Message) -> None:
     )
 
 
-@rest_bot.callback_query_handler(
-    func=lambda call: call.message.text in [lang["EDIT_DISH_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("EDIT_DISH_MSG")
+@unit_of_work()
 @logger_decorator_callback
 def edit_dish_param(call: types.CallbackQuery) -> None:
     """Process User input from "edit_dish" menu.
@@ -239,9 +247,8 @@ def edit_dish_param(call: types.CallbackQuery) -> None:
         )
 
 
-@rest_bot.callback_query_handler(
-    func=lambda call: call.message.text in [lang["EDIT_DISH_PARAM_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("EDIT_DISH_PARAM_MSG")
+@unit_of_work()
 @logger_decorator_callback
 def req_new_dish_param(call: types.CallbackQuery) -> None:
     """Process User input from "parameter_selection" menu.
@@ -286,6 +293,7 @@ def req_new_dish_param(call: types.CallbackQuery) -> None:
                                  for lang in texts.values()
                          ]
 )
+@unit_of_work()
 @logger_decorator_msg
 def set_new_category(message: types.Message) -> None:
     """Set new category for selected dish.
@@ -308,6 +316,7 @@ def set_new_category(message: types.Message) -> None:
                              ) for lang in texts.values()
                          ]
 )
+@unit_of_work()
 @logger_decorator_msg
 def set_new_description(message: types.Message) -> None:
     """Set new description for selected dish.
@@ -329,6 +338,7 @@ def set_new_description(message: types.Message) -> None:
                                  for lang in texts.values()
                          ]
 )
+@unit_of_work()
 @logger_decorator_msg
 def set_new_price(message: types.Message) -> None:
     """Set new price for selected dish.
@@ -344,6 +354,7 @@ def set_new_price(message: types.Message) -> None:
 
 
 @rest_bot.message_handler(commands=["delete_item"])
+@unit_of_work()
 @logger_decorator_msg
 def delete_dish_command(message: types.Message) -> None:
     """Process /delete_item command.
@@ -360,10 +371,8 @@ def delete_dish_command(message: types.Message) -> None:
     )
 
 
-@rest_bot.callback_query_handler(
-    func=lambda call: call.message.text \
-                      in [lang["DELETE_DISH_SELECT_MSG"] for lang in texts.values()]
-)
+@callback_router.prompt("DELETE_DISH_SELECT_MSG")
+@unit_of_work()
 @logger_decorator_callback
 def dish_deletion_select(call: types.CallbackQuery) -> None:
     """Process User input from "delete_dish" menu.
@@ -379,6 +388,7 @@ def dish_deletion_select(call: types.CallbackQuery) -> None:
 
 
 @rest_bot.message_handler(commands=["close_shift"])
+@unit_of_work()
 @logger_decorator_msg
 def close_shift_command(message: types.Message) -> None:
     """Mark Restaurant in the database as currently not working.
@@ -393,6 +403,7 @@ def close_shift_command(message: types.Message) -> None:
 
 
 @rest_bot.message_handler(commands=["open_shift"])
+@unit_of_work()
 @logger_decorator_msg
 def open_shift_command(message: types.Message) -> None:
     """Mark Restaurant in the database as currently working.
@@ -407,6 +418,7 @@ def open_shift_command(message: types.Message) -> None:
 
 
 @rest_bot.message_handler(commands=["support"])
+@unit_of_work()
 @logger_decorator_msg
 def contact_support(message: types.Message) -> None:
     """Start support request sequence.
@@ -429,6 +441,7 @@ def contact_support(message: types.Message) -> None:
                          and message.reply_to_message.text \
                          in [lang["REST_SUPPORT_MSG"] for lang in texts.values()]
 )
+@unit_of_work()
 @logger_decorator_msg
 def message_to_support(message: types.Message) -> None:
     """Forward message from Restaurant to Support.
@@ -439,7 +452,8 @@ def message_to_support(message: types.Message) -> None:
     """
     msg = DBInterface(message)
     support = msg.get_support()
-    adm_bot.send_message(
+    send_queue.send(
+        adm_bot.send_message,
         support[0],
         texts[support[1]]["SUPPORT_FR_REST_MSG"](
             msg.data_to_read.from_user.username,
@@ -453,7 +467,8 @@ def message_to_support(message: types.Message) -> None:
     )
 
 
-@rest_bot.callback_query_handler(func=lambda call: "accepted" in call.data)
+@callback_router.action("accepted")
+@unit_of_work()
 @logger_decorator_callback
 def order_accepted(call: types.CallbackQuery) -> None:
     """Accept incoming order and send request to available Couriers.
@@ -464,52 +479,75 @@ def order_accepted(call: types.CallbackQuery) -> None:
     """
     callback = DBInterface(call)
     customer = callback.get_customer()
-    customer_info = callback.get_customer_info()
     callback.order_accepted()
-    rest_location = callback.get_rest_location()
-    delivery_location = callback.get_delivery_location()
-    rest_bot.edit_message_reply_markup(callback.user_id, callback.data_to_read.message.id)
-    rest_bot.send_message(
+    offer = callback.get_courier_offer()
+    on_commit(
+        rest_bot.edit_message_reply_markup,
         callback.user_id,
-        texts[callback.get_rest_lang()]["REST_ORDER_ACCEPTED_MSG"](
-            callback.data_to_read.data.split(maxsplit=1)[-1]
-        )
+        callback.data_to_read.message.id
+    )
+    on_commit(
+        rest_bot.send_message,
+        callback.user_id,
+        texts[callback.get_rest_lang()]["REST_ORDER_ACCEPTED_MSG"](offer.order_uuid)
     )
-    cus_bot.send_message(
+    send_queue.send(
+        cus_bot.send_message,
         customer[0],
-        texts[customer[1]]["CUST_ORDER_ACCEPTED_MSG"](
-            callback.data_to_read.data.split(maxsplit=1)[-1]
-        )
+        texts[customer[1]]["CUST_ORDER_ACCEPTED_MSG"](offer.order_uuid)
     )
-    for courier in callback.get_available_couriers():
-        courier_bot.send_message(
-            courier[0],
-            texts[courier[1]]["LOOKING_FOR_COURIER_MSG"](
-                callback.data_to_read.data.split(maxsplit=1)[-1],
-                callback.get_courier_fee(),
-                customer_info[0],
-                customer_info[1],
-                customer_info[2],
-                customer_info[3],
-                callback.get_rest_name(),
-                callback.get_order_items(),
-                rest_location[0]
-            )
-        )
-        courier_bot.send_location(courier[0], rest_location[1][0], rest_location[1][1])
-        courier_bot.send_message(courier[0], texts[courier[1]]["COURIER_DELIVERY_LOC_MSG"])
-        courier_bot.send_location(courier[0], delivery_location[0][0], delivery_location[0][1])
-        courier_bot.send_message(
-            courier[0],
-            texts[courier[1]]["COURIER_ACCEPT_ORDER_MSG"],
-            reply_markup=restaurant_menus.courier_accept_menu(
-                callback.data_to_read.data.split(maxsplit=1)[-1],
-                courier[1]
-            )
+    # One chain per Courier, so nobody gets an offer missing a part.
+    offer_calls = [
+        send_queue.send_chain(
+            courier_id,
+            [
+                (
+                    courier_bot.send_message,
+                    (
+                        texts[courier_lang]["LOOKING_FOR_COURIER_MSG"](
+                            offer.order_uuid,
+                            offer.courier_fee,
+                            offer.customer_name,
+                            offer.customer_username,
+                            offer.customer_phone,
+                            offer.comment,
+                            offer.rest_name,
+                            offer.dishes,
+                            offer.rest_address
+                        ),
+                    ),
+                    {}
+                ),
+                (
+                    courier_bot.send_location,
+                    (offer.rest_location[0], offer.rest_location[1]),
+                    {}
+                ),
+                (courier_bot.send_message, (texts[courier_lang]["COURIER_DELIVERY_LOC_MSG"],), {}),
+                (
+                    courier_bot.send_location,
+                    (offer.delivery_location[0], offer.delivery_location[1]),
+                    {}
+                ),
+                (
+                    courier_bot.send_message,
+                    (texts[courier_lang]["COURIER_ACCEPT_ORDER_MSG"],),
+                    {
+                        "reply_markup": restaurant_menus.courier_accept_menu(
+                            offer.order_uuid,
+                            courier_lang
+                        )
+                    }
+                )
+            ]
         )
+        for courier_id, courier_lang, _ in callback.get_available_couriers()
+    ]
+    send_queue.report(f"Courier offer of order {offer.order_uuid}", offer_calls)
 
 
-@rest_bot.callback_query_handler(func=lambda call: "ready" in call.data)
+@callback_router.action("ready")
+@unit_of_work()
 @logger_decorator_callback
 def order_ready(call: types.CallbackQuery) -> None:
     """Mark order as ready and handled to a Courier.
@@ -524,34 +562,38 @@ def order_ready(call: types.CallbackQuery) -> None:
     courier = callback.get_courier()
     customer = callback.get_customer()
     callback.order_ready()
-    rest_bot.edit_message_text(
+    on_commit(
+        rest_bot.edit_message_text,
         texts[callback.get_rest_lang()]["ORDER_READY_MSG"](
-            callback.data_to_read.data.split(maxsplit=1)[-1]
+            callback.data_to_read.data
         ),
         callback.user_id,
         callback.data_to_read.message.id
     )
-    courier_bot.send_message(
+    send_queue.send(
+        courier_bot.send_message,
         courier[0],
         texts[courier[1]]["COUR_ORDER_IN_DELIVERY_MSG"](
-            callback.data_to_read.data.split(maxsplit=1)[-1]
+            callback.data_to_read.data
         ),
         reply_markup=restaurant_menus.courier_in_delivery_menu(
-            callback.data_to_read.data.split(maxsplit=1)[-1],
+            callback.data_to_read.data,
             courier[1]
         )
     )
-    cus_bot.send_message(
+    send_queue.send(
+        cus_bot.send_message,
         customer[0],
         texts[customer[1]]["CUST_ORDER_IN_DELIVERY_MSG"](
-            callback.data_to_read.data.split(maxsplit=1)[-1]
+            callback.data_to_read.data
         )
     )
 
 
 def main():
     logger.info("The bot is running.")
-    rest_bot.infinity_polling()
+    metrics.start_reporter()
+    bot_runner.run({"restaurant": rest_bot})
 
 
 if __name__ == "__main__":
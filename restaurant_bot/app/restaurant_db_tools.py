@@ -1,12 +1,16 @@
 import uuid
 import random
+import dataclasses
+from decimal import Decimal
 from typing import List, Tuple, Any
 
 import telebot.types as types
 from environs import Env
 from psycopg2.extensions import cursor
 
+from tools.catalog_cache import notify_catalog_changed
 from tools.cursor_tool import cursor as cursor_decorator
+from tools.lang_cache import lang_cache
 from tools.logger_tool import logger, logger_decorator
 
 env = Env()
@@ -15,12 +19,28 @@ env.read_env()
 DEF_LANG = env.str("DEF_LANG", default="en_US")
 
 
+@dataclasses.dataclass(slots=True)
+class CourierOffer:
+    order_uuid: str
+    courier_fee: Decimal
+    customer_name: str | None
+    customer_username: str | None
+    customer_phone: str | None
+    comment: str | None
+    rest_name: str
+    dishes: List[str]
+    rest_address: str | None
+    rest_location: List[Decimal]
+    delivery_location: List[Decimal]
+
+
 class Interface:
     def __init__(self, data_to_read: types.Message | types.CallbackQuery):
         self.data_to_read = data_to_read
         self.user_id = data_to_read.from_user.id
         logger.info(f"Interface instance initialized with {type(self.data_to_read)}.")
 
+    @lang_cache.cached("restaurant", lambda interface: interface.user_id)
     @cursor_decorator
     @logger_decorator
     def get_rest_lang(self, curs: cursor) -> str:
@@ -104,6 +124,7 @@ class Interface:
             "UPDATE restaurants SET lang_code = %s WHERE restaurant_uuid = %s",
             (self.data_to_read.data, self.get_rest_uuid())
         )
+        lang_cache.invalidate("restaurant", self.user_id)
 
     @cursor_decorator
     @logger_decorator
@@ -118,6 +139,7 @@ class Interface:
             "UPDATE restaurants SET restaurant_is_open = true WHERE restaurant_tg_id = %s",
             (self.user_id,)
         )
+        notify_catalog_changed(curs)
 
     @cursor_decorator
     @logger_decorator
@@ -132,6 +154,7 @@ class Interface:
             "UPDATE restaurants SET restaurant_is_open = false WHERE restaurant_tg_id = %s",
             (self.user_id,)
         )
+        notify_catalog_changed(curs)
 
     @cursor_decorator
     @logger_decorator
@@ -146,6 +169,7 @@ class Interface:
             "UPDATE dishes SET dish_is_available = true WHERE dish_uuid = %s",
             (self.data_to_read.data,)
         )
+        notify_catalog_changed(curs)
 
     @cursor_decorator
     @logger_decorator
@@ -160,6 +184,7 @@ class Interface:
             "UPDATE dishes SET dish_is_available = false WHERE dish_uuid = %s",
             (self.data_to_read.data,)
         )
+        notify_catalog_changed(curs)
 
     @cursor_decorator
     @logger_decorator
@@ -171,6 +196,7 @@ class Interface:
 
         """
         curs.execute("DELETE FROM dishes WHERE dish_uuid = %s", (self.data_to_read.data,))
+        notify_catalog_changed(curs)
 
     @cursor_decorator
     @logger_decorator
@@ -222,6 +248,7 @@ class Interface:
             "INSERT INTO dishes(restaurant_uuid, dish_uuid, dish_name) VALUES (%s, %s, %s)",
             (self.get_rest_uuid(), str(uuid.uuid4()), dish_name)
         )
+        notify_catalog_changed(curs)
 
     @cursor_decorator
     @logger_decorator
@@ -238,6 +265,7 @@ class Interface:
             "UPDATE dishes SET " + param + " = %s WHERE dish_uuid = %s",
             (self.data_to_read.text, dish_uuid)
         )
+        notify_catalog_changed(curs)
 
     @cursor_decorator
     @logger_decorator
@@ -250,7 +278,7 @@ class Interface:
         """
         curs.execute(
             "UPDATE orders SET order_status = '3' WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
 
     @cursor_decorator
@@ -274,7 +302,7 @@ class Interface:
         couriers = curs.fetchall()
         curs.execute(
             "SELECT delivery_distance FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
         delivery_distance = float(curs.fetchone()[0])
         if delivery_distance <= 1.00:
@@ -303,7 +331,7 @@ class Interface:
         """
         curs.execute(
             "SELECT customer_id FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
         customer_id = curs.fetchone()[0]
         curs.execute("SELECT lang_code FROM customers WHERE customer_id = %s", (customer_id,))
@@ -312,124 +340,29 @@ class Interface:
 
     @cursor_decorator
     @logger_decorator
-    def get_rest_location(self, curs: cursor) -> Tuple[str, List[int]]:
-        """Get info about restaurant location from database.
-
-        Args:
-            curs: Cursor object from psycopg2.
-
-        Returns:
-            Array containing restaurant address, and coordinates.
-
-        """
-        curs.execute(
-            "SELECT address, location FROM restaurants WHERE restaurant_tg_id = %s",
-            (self.user_id,)
-        )
-        return curs.fetchone()
-
-    @cursor_decorator
-    @logger_decorator
-    def get_delivery_location(self, curs: cursor) -> Tuple[List[int], ...]:
-        """Get delivery location from database.
-
-        Args:
-            curs: Cursor object from psycopg2.
-
-        Returns:
-            Array containing customer's latitude and longitude.
-
-        """
-        curs.execute(
-            "SELECT delivery_location FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
-        )
-        return curs.fetchone()
-
-    @cursor_decorator
-    @logger_decorator
-    def get_order_items(self, curs: cursor) -> List[str]:
-        """Get order items names from database.
+    def get_courier_offer(self, curs: cursor) -> CourierOffer:
+        """Get everything Couriers are shown about current order with a
+        single query.
 
         Args:
             curs: Cursor object from psycopg2.
 
         Returns:
-            Array containing order items names.
+            Courier offer of the order.
 
         """
         curs.execute(
-            "SELECT dishes FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
-        )
-        return curs.fetchone()[0]
-
-    @cursor_decorator
-    @logger_decorator
-    def get_rest_name(self, curs: cursor) -> str:
-        """Get restaurant name from database by its Telegram ID.
-
-        Args:
-            curs: Cursor object from psycopg2.
-
-        Returns:
-            Restaurant name.
-
-        """
-        curs.execute(
-            "SELECT restaurant_name FROM restaurants WHERE restaurant_tg_id = %s", (self.user_id,)
-        )
-        return curs.fetchone()[0]
-
-    @cursor_decorator
-    @logger_decorator
-    def get_courier_fee(self, curs: cursor) -> float:
-        """Get courier fee for current order from database.
-
-        Args:
-            curs: Cursor object from psycopg2.
-
-        Returns:
-            Courier fee.
-
-        """
-        curs.execute(
-            "SELECT courier_fee FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
-        )
-        return curs.fetchone()[0]
-
-    @cursor_decorator
-    @logger_decorator
-    def get_customer_info(self, curs: cursor) -> Tuple[str, ...]:
-        """Get info about customer that created current order from
-        database.
-
-        Args:
-            curs: Cursor object from psycopg2.
-
-        Returns:
-            Array containing customer name, Telegram username, phone
-            number and order comment.
-
-        """
-        curs.execute(
-            "SELECT customer_name, customer_id, order_comment FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
-        )
-        customer_info = curs.fetchone()
-        curs.execute(
-            "SELECT customer_username, customer_phone_num FROM customers WHERE customer_id = %s",
-            (customer_info[1],)
-        )
-        customer_information = curs.fetchone()
-        customer_info = (
-            customer_info[0],
-            customer_information[0],
-            customer_information[1],
-            customer_info[2]
+            "SELECT orders.order_uuid, orders.courier_fee, orders.customer_name, "
+            "customers.customer_username, customers.customer_phone_num, orders.order_comment, "
+            "restaurants.restaurant_name, orders.dishes, restaurants.address, "
+            "restaurants.location, orders.delivery_location "
+            "FROM orders "
+            "JOIN restaurants ON restaurants.restaurant_uuid = orders.restaurant_uuid "
+            "LEFT JOIN customers ON customers.customer_id = orders.customer_id "
+            "WHERE orders.order_uuid = %s",
+            (self.data_to_read.data,)
         )
-        return customer_info
+        return CourierOffer(*curs.fetchone())
 
     @cursor_decorator
     @logger_decorator
@@ -445,7 +378,7 @@ class Interface:
         """
         curs.execute(
             "SELECT courier_id FROM orders WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
         courier_id = curs.fetchone()[0]
         curs.execute("SELECT lang_code FROM couriers WHERE courier_id = %s", (courier_id,))
@@ -464,5 +397,5 @@ class Interface:
         """
         curs.execute(
             "UPDATE orders SET order_status = '5' WHERE order_uuid = %s",
-            (self.data_to_read.data.split(maxsplit=1)[-1],)
+            (self.data_to_read.data,)
         )
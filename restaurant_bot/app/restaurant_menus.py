@@ -2,6 +2,7 @@ import telebot.types as types
 
 from restaurant_translations import texts
 from restaurant_db_tools import Interface as DBInterface
+from tools.callback_data import encode_callback
 
 back_button = lambda lang_code: types.InlineKeyboardButton(
     text=texts[lang_code]["GO_BACK_BTN"],
@@ -99,7 +100,7 @@ def courier_accept_menu(order_uuid: str, lang_code: str) -> types.InlineKeyboard
     menu = types.InlineKeyboardMarkup(row_width=1)
     accept_button = types.InlineKeyboardButton(
         text=texts[lang_code]["COURIER_ACCEPT_BTN"],
-        callback_data=f"accept {order_uuid}"
+        callback_data=encode_callback("accept", order_uuid)
     )
     menu.add(accept_button)
     return menu
@@ -120,7 +121,7 @@ def courier_in_delivery_menu(order_uuid: str, courier_lang: str) -> types.Inline
     menu = types.InlineKeyboardMarkup(row_width=1)
     order_handled_button = types.InlineKeyboardButton(
         text=texts[courier_lang]["COUR_ORDER_IN_DELIVERY_BTN"],
-        callback_data=f"in_delivery {order_uuid}"
+        callback_data=encode_callback("in_delivery", order_uuid)
     )
     menu.add(order_handled_button)
     return menu
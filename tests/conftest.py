@@ -0,0 +1,14 @@
+import os
+import sys
+from pathlib import Path
+
+# Modules of tools read their settings from environment when imported.
+for variable, value in {
+    "DB_USER": "test",
+    "DB_PASSWORD": "test",
+    "PP_USERNAME": "test",
+    "PP_PASSWORD": "test"
+}.items():
+    os.environ.setdefault(variable, value)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
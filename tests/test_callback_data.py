@@ -0,0 +1,57 @@
+import uuid
+
+import pytest
+
+from tools.callback_data import ACTIONS, MAX_LENGTH, CallbackData, decode_callback, encode_callback
+
+ORDER_UUID = "0b5f4cbe-5a63-4b38-93b1-2b1b1c0d9f43"
+
+
+@pytest.mark.parametrize("action", [name for name, action in ACTIONS.items() if action.uuid_arg])
+def test_uuid_actions_round_trip(action):
+    data = encode_callback(action, ORDER_UUID)
+    assert len(data.encode()) <= MAX_LENGTH
+    assert decode_callback(data) == CallbackData(action, ORDER_UUID)
+
+
+def test_text_argument_round_trip():
+    data = encode_callback("type", "Pizza")
+    assert data == "1:t:Pizza"
+    assert decode_callback(data) == CallbackData("type", "Pizza")
+
+
+def test_uuid_packed():
+    data = encode_callback("accept", str(uuid.uuid4()))
+    assert len(data) == len("1:A:") + 22
+
+
+@pytest.mark.parametrize("data, expected", [
+    (f"paid {ORDER_UUID}", CallbackData("paid", ORDER_UUID)),
+    (f"order_closed {ORDER_UUID}", CallbackData("order_closed", ORDER_UUID)),
+    ("type Pizza place", CallbackData("type", "Pizza place")),
+])
+def test_legacy_format_decoded(data, expected):
+    assert decode_callback(data) == expected
+
+
+@pytest.mark.parametrize("data", [
+    None,
+    "",
+    "1:?:abc",
+    "1:p:not-a-uuid",
+    "paid not-a-uuid",
+    "paid",
+    "unknown argument",
+    "Cart",
+])
+def test_unknown_data_ignored(data):
+    assert decode_callback(data) is None
+
+
+def test_encode_rejects_bad_input():
+    with pytest.raises(ValueError):
+        encode_callback("unknown", ORDER_UUID)
+    with pytest.raises(ValueError):
+        encode_callback("accepted", "not-a-uuid")
+    with pytest.raises(ValueError):
+        encode_callback("type", "x" * MAX_LENGTH)
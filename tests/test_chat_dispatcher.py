@@ -0,0 +1,90 @@
+import time
+import types
+import threading
+
+import pytest
+
+from tools.chat_dispatcher import ChatDispatcher, chat_key
+
+
+def message(chat_id, text=""):
+    return types.SimpleNamespace(chat=types.SimpleNamespace(id=chat_id), text=text)
+
+
+def callback_query(user_id, chat_id=None):
+    return types.SimpleNamespace(
+        from_user=types.SimpleNamespace(id=user_id),
+        message=message(chat_id) if chat_id else None
+    )
+
+
+@pytest.fixture
+def dispatcher():
+    bot = types.SimpleNamespace(exception_handler=None)
+    dispatcher = ChatDispatcher(bot, workers=4)
+    yield dispatcher
+    dispatcher.close()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_chat_key():
+    assert chat_key(message(1)) == 1
+    assert chat_key(callback_query(2, chat_id=3)) == 3
+    assert chat_key(callback_query(2)) == 2
+    assert chat_key(object()) is None
+
+
+def test_updates_of_one_chat_run_in_order(dispatcher):
+    handled = []
+    lock = threading.Lock()
+
+    def handle(update):
+        time.sleep(0.001 * (update.text % 3))
+        with lock:
+            handled.append((update.chat.id, update.text))
+
+    for number in range(30):
+        for chat_id in (1, 2, 3):
+            dispatcher.put(handle, message(chat_id, number))
+    wait_for(lambda: dispatcher.stats()["processed"] == 90 and not dispatcher.stats()["busy"])
+    for chat_id in (1, 2, 3):
+        assert [text for chat, text in handled if chat == chat_id] == list(range(30))
+
+
+def test_chats_do_not_wait_for_each_other(dispatcher):
+    release = threading.Event()
+    handled = []
+
+    def handle(update):
+        if update.text == "slow":
+            release.wait(5)
+        handled.append(update.text)
+
+    dispatcher.put(handle, message(1, "slow"))
+    dispatcher.put(handle, message(1, "after slow"))
+    dispatcher.put(handle, message(2, "other chat"))
+    wait_for(lambda: handled == ["other chat"])
+    assert dispatcher.stats()["queued"] == 1
+    release.set()
+    wait_for(lambda: len(handled) == 3)
+    assert handled == ["other chat", "slow", "after slow"]
+
+
+def test_failed_update_does_not_block_chat(dispatcher):
+    handled = []
+
+    def handle(update):
+        if update.text == "fail":
+            raise RuntimeError("handler failed")
+        handled.append(update.text)
+
+    dispatcher.put(handle, message(1, "fail"))
+    dispatcher.put(handle, message(1, "next"))
+    wait_for(lambda: handled == ["next"])
+    assert isinstance(dispatcher.exception_info, RuntimeError)
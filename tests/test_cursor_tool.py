@@ -0,0 +1,92 @@
+import types
+
+import pytest
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from tools import cursor_tool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.info = types.SimpleNamespace(transaction_status=TRANSACTION_STATUS_IDLE)
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        self.info.transaction_status = TRANSACTION_STATUS_INTRANS
+        return object()
+
+    def commit(self):
+        self.commits += 1
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    connections = []
+
+    def connect():
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    pool = cursor_tool.ConnectionPool(0, 1, 0.1)
+    pool.connections = connections
+    monkeypatch.setattr(cursor_tool, "connect", connect)
+    monkeypatch.setattr(cursor_tool, "pool", pool)
+    return pool
+
+
+def test_connection_returned_after_error(pool):
+    calls = []
+    with pytest.raises(RuntimeError):
+        with cursor_tool.unit_of_work():
+            cursor_tool.on_commit(calls.append, "committed")
+            raise RuntimeError("handler failed")
+    conn, = pool.connections
+    assert (conn.commits, conn.rollbacks, conn.closed) == (0, 1, 0)
+    assert (pool.stats()["in_use"], pool.stats()["idle"]) == (0, 1)
+    assert not calls
+    with cursor_tool.unit_of_work():
+        cursor_tool.on_commit(calls.append, "committed")
+    assert len(pool.connections) == 1
+    assert calls == ["committed"]
+
+
+def test_nested_scopes_share_connection(pool):
+    @cursor_tool.cursor
+    def read(curs):
+        return cursor_tool._scope_connection.get()
+
+    with cursor_tool.unit_of_work():
+        assert read() is read()
+        assert pool.stats()["in_use"] == 1
+    assert pool.connections[0].commits == 1
+    assert pool.stats()["in_use"] == 0
+
+
+def test_broken_connection_discarded_after_error(pool):
+    with pytest.raises(RuntimeError):
+        with cursor_tool.unit_of_work():
+            pool.connections[0].closed = 2
+            raise RuntimeError("connection lost")
+    conn, = pool.connections
+    assert conn.rollbacks == 0
+    assert (pool.stats()["in_use"], pool.stats()["idle"]) == (0, 0)
+    with cursor_tool.unit_of_work():
+        pass
+    assert len(pool.connections) == 2
+
+
+def test_exhausted_pool_times_out(pool):
+    with cursor_tool.unit_of_work():
+        with pytest.raises(cursor_tool.PoolExhaustedError):
+            pool.getconn()
+    assert pool.stats()["timeouts"] == 1
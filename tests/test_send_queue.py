@@ -0,0 +1,135 @@
+import time
+import types
+
+import pytest
+import requests
+import urllib3
+from telebot.apihelper import ApiHTTPException, ApiTelegramException
+
+from tools import send_queue
+from tools.send_queue import RateLimits, TokenBucket, retry_policy
+
+RESPONSE = types.SimpleNamespace(status_code=502, reason="Bad Gateway", text="")
+
+
+def telegram_error(error_code, **parameters):
+    return ApiTelegramException(
+        "sendMessage",
+        RESPONSE,
+        {"error_code": error_code, "description": "error", "parameters": parameters}
+    )
+
+
+def connection_error(reason):
+    # Raised by requests the way it wraps errors of urllib3.
+    try:
+        try:
+            raise urllib3.exceptions.MaxRetryError(None, "/sendMessage", reason) from reason
+        except urllib3.exceptions.MaxRetryError as error:
+            raise requests.ConnectionError(error)
+    except requests.ConnectionError as error:
+        return error
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(send_queue.random, "uniform", lambda low, high: high)
+
+
+def test_bucket_allows_burst_then_paces():
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    now = bucket.updated
+    for _ in range(3):
+        assert bucket.delay(now) == 0
+        bucket.take()
+    assert bucket.delay(now) == pytest.approx(0.5)
+    assert bucket.delay(now + 0.5) == 0
+    bucket.take()
+    assert bucket.delay(now + 0.5) == pytest.approx(0.5)
+
+
+def test_bucket_does_not_save_up_beyond_capacity():
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    now = bucket.updated + 60
+    for _ in range(2):
+        assert bucket.delay(now) == 0
+        bucket.take()
+    assert bucket.delay(now) == pytest.approx(1.0)
+
+
+def test_limits_pace_chat_and_bot():
+    limits = RateLimits(global_rate=3.0, chat_rate=1.0, chat_burst=2)
+    now = time.monotonic() + 1
+    for _ in range(2):
+        assert limits.delay(("bot", 1), now) == 0
+        limits.take(("bot", 1))
+    assert limits.delay(("bot", 1), now) == pytest.approx(1.0)
+    assert limits.delay(("bot", 2), now) == 0
+    limits.take(("bot", 2))
+    assert limits.delay(("bot", 3), now) == pytest.approx(1 / 3)
+    assert limits.delay(("other bot", 3), now) == 0
+
+
+def test_limits_prune_idle_chats():
+    limits = RateLimits(global_rate=30.0, chat_rate=1.0, chat_burst=1)
+    now = time.monotonic() + 1
+    for chat_id in (1, 2):
+        limits.delay(("bot", chat_id), now)
+        limits.take(("bot", chat_id))
+    limits.prune(now + 1, ())
+    assert len(limits._chat_buckets) == 2
+    limits.prune(now + send_queue.PRUNE_INTERVAL + 1, {("bot", 2)})
+    assert list(limits._chat_buckets) == [("bot", 2)]
+
+
+@pytest.mark.parametrize("method_name", ["send_message", "edit_message_text"])
+def test_rate_limit_waits_retry_after(method_name):
+    error = telegram_error(429, retry_after=7)
+    assert retry_policy.is_rate_limit(error)
+    assert retry_policy.delay(error, method_name, 1) == 7
+
+
+@pytest.mark.parametrize("error, send, edit", [
+    (telegram_error(400), None, None),
+    (telegram_error(502), None, 1.0),
+    (ApiHTTPException("sendMessage", RESPONSE), None, 1.0),
+    (requests.ReadTimeout(), None, 1.0),
+    (requests.ConnectTimeout(), 1.0, 1.0),
+    (connection_error(urllib3.exceptions.NewConnectionError(None, "refused")), 1.0, 1.0),
+    (connection_error(urllib3.exceptions.ProtocolError("reset")), None, 1.0),
+    (requests.ConnectionError(), None, 1.0),
+    (ValueError(), None, None),
+])
+def test_retry_decision(error, send, edit):
+    assert not retry_policy.is_rate_limit(error)
+    assert retry_policy.delay(error, "send_message", 1) == send
+    assert retry_policy.delay(error, "edit_message_text", 1) == edit
+
+
+def test_backoff_grows_up_to_limit():
+    delays = [retry_policy.backoff(attempts) for attempts in range(1, 10)]
+    assert delays == sorted(delays)
+    assert delays[-1] == send_queue.RETRY_MAX_DELAY
+
+
+def test_chain_stops_at_first_failure():
+    class Bot:
+        token = "bot"
+
+        def __init__(self):
+            self.calls = []
+
+        def send(self, chat_id, text):
+            self.calls.append((chat_id, text))
+            if text == "fail":
+                raise ValueError(text)
+
+    bot = Bot()
+    queue = send_queue.SendQueue(100.0, 100.0, 10, workers=2)
+    failed = queue.send_chain(1, [(bot.send, (text,), {}) for text in ("a", "fail", "b", "c")])
+    sent = queue.send_chain(2, [(bot.send, (text,), {}) for text in ("x", "y")])
+    after = queue.send(bot.send, 1, "after")
+    assert isinstance(failed.exception(timeout=5), ValueError)
+    assert after.result(timeout=5) is None and sent.result(timeout=5) is None
+    assert [text for chat_id, text in bot.calls if chat_id == 1] == ["a", "fail", "after"]
+    assert [text for chat_id, text in bot.calls if chat_id == 2] == ["x", "y"]
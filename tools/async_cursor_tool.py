@@ -0,0 +1,138 @@
+import inspect
+import functools
+import contextlib
+import contextvars
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+from environs import Env
+from psycopg import AsyncConnection, AsyncCursor
+from psycopg_pool import AsyncConnectionPool
+
+from tools.logger_tool import logger
+
+env = Env()
+env.read_env()
+
+DB_USER = env.str("DB_USER")
+DB_PASSWORD = env.str("DB_PASSWORD")
+DB_POOL_MIN_SIZE = env.int("DB_POOL_MIN_SIZE", default=1)
+# Connections are held only for the length of a unit of work, never while
+# waiting for Telegram or PayPal, so a few of them serve many handlers.
+DB_POOL_MAX_SIZE = env.int("DB_POOL_MAX_SIZE", default=10)
+DB_POOL_TIMEOUT = env.float("DB_POOL_TIMEOUT", default=5.0)
+DB_POOL_MAX_IDLE = env.float("DB_POOL_MAX_IDLE", default=300.0)
+
+pool = AsyncConnectionPool(
+    kwargs={
+        "dbname": "postgres",
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+        "host": "liefer_bot_db",
+        "port": 5432
+    },
+    min_size=min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    max_idle=DB_POOL_MAX_IDLE,
+    check=AsyncConnectionPool.check_connection,
+    open=False,
+    name="async_db_pool"
+)
+
+
+_scope_connection: contextvars.ContextVar[AsyncConnection | None] = contextvars.ContextVar(
+    "async_scope_connection",
+    default=None
+)
+_scope_cache: contextvars.ContextVar[Dict[Any, Any] | None] = contextvars.ContextVar(
+    "async_scope_cache",
+    default=None
+)
+_scope_hooks: contextvars.ContextVar[List[Tuple[Callable[..., Any], Tuple, Dict]] | None] = (
+    contextvars.ContextVar("async_scope_hooks", default=None)
+)
+
+
+def scope_cache() -> Dict[Any, Any]:
+    """Get storage for data read inside the current unit of work. The
+    storage is discarded together with the scope.
+
+    Returns:
+        Storage of the current unit of work, or new empty dictionary if
+        called outside of one.
+
+    """
+    cache = _scope_cache.get()
+    return cache if cache is not None else {}
+
+
+async def on_commit(func: Callable[..., Any], *args, **kwargs) -> None:
+    """Call function, or await coroutine function, once the current
+    unit of work is committed. Calls are dropped if the unit of work
+    rolls back, and made right away if called outside of one.
+
+    Args:
+        func: Function or coroutine function to call.
+        *args: Positional arguments of the function.
+        **kwargs: Keyword arguments of the function.
+
+    """
+    if (hooks := _scope_hooks.get()) is None:
+        await _call(func, args, kwargs)
+    else:
+        hooks.append((func, args, kwargs))
+
+
+async def _call(func: Callable[..., Any], args: Tuple, kwargs: Dict) -> Any:
+    result = func(*args, **kwargs)
+    return await result if inspect.isawaitable(result) else result
+
+
+async def _run_hooks(hooks: List[Tuple[Callable[..., Any], Tuple, Dict]]) -> None:
+    for func, args, kwargs in hooks:
+        try:
+            await _call(func, args, kwargs)
+        except Exception as error:
+            logger.error(
+                f"After-commit call of {getattr(func, '__name__', func)} failed: "
+                f"{type(error).__name__}: {error}"
+            )
+
+
+@contextlib.asynccontextmanager
+async def unit_of_work() -> AsyncIterator[AsyncCursor]:
+    """Open database scope sharing one pooled connection and one
+    transaction between all cursor-decorated coroutines awaited inside
+    it, like tools.cursor_tool.unit_of_work does for threads. Nested
+    scopes join the outermost one, which commits on success and rolls
+    back on any exception. Calls registered with on_commit() are made
+    after the commit. Can be used as a decorator of coroutine functions
+    as well.
+
+    Yields:
+        Cursor object from psycopg bound to the scope's connection.
+
+    """
+    if (conn := _scope_connection.get()) is not None:
+        yield conn.cursor()
+        return
+    async with pool.connection() as conn:
+        token = _scope_connection.set(conn)
+        cache_token = _scope_cache.set({})
+        hooks_token = _scope_hooks.set(hooks := [])
+        try:
+            yield conn.cursor()
+        finally:
+            _scope_hooks.reset(hooks_token)
+            _scope_cache.reset(cache_token)
+            _scope_connection.reset(token)
+    await _run_hooks(hooks)
+
+
+def cursor(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        async with unit_of_work() as curs:
+            return await func(*args, **kwargs, curs=curs)
+
+    return wrapper
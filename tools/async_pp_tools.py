@@ -0,0 +1,349 @@
+import json
+import uuid
+import asyncio
+import dataclasses
+from typing import Any, Dict, List, Mapping, Tuple
+
+import aiohttp
+from psycopg import AsyncCursor
+
+import tools.pp_tools as paypal
+from tools import metrics
+from tools.async_cursor_tool import cursor as cursor_decorator, unit_of_work
+from tools.logger_tool import logger, logger_decorator
+
+# Errors of requests that may or may not have reached PayPal.
+NETWORK_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+class PayPalError(aiohttp.ClientError):
+    """PayPal answered request with error status."""
+
+
+@dataclasses.dataclass(slots=True)
+class PayPalResponse:
+    status_code: int
+    text: str
+    headers: Mapping[str, str]
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise PayPalError(f"PayPal answered with status {self.status_code}: {self.text}")
+
+
+class AsyncPayPalClient(paypal.PayPalApi):
+    """PayPal REST API client for the asyncio runtime. Waits for PayPal
+    without holding a thread, and shares everything else with
+    PayPalClient through tools.pp_tools.PayPalApi.
+    """
+
+    def __init__(self, mode: str, client_id: str, secret: str):
+        super().__init__(mode, client_id, secret)
+        self._session: aiohttp.ClientSession | None = None
+        self._token_lock = asyncio.Lock()
+
+    async def get_token(self, refresh: bool = False) -> str:
+        """Get OAuth2 access token, requesting new one from PayPal only
+        if cached one is about to expire. Concurrent callers wait for
+        the one request in progress instead of making their own.
+
+        Args:
+            refresh: Request new token even if cached one is valid.
+
+        Returns:
+            Access token.
+
+        Raises:
+            aiohttp.ClientError: If token request failed.
+            asyncio.TimeoutError: If PayPal did not answer in time.
+
+        """
+        stale_token = self._token if refresh else None
+        async with self._token_lock:
+            if token := self._cached_token(stale_token):
+                return token
+            self._count("token_requests")
+            async with self.session.post(
+                    f"{self.base_url}/v1/oauth2/token",
+                    data={"grant_type": "client_credentials"},
+                    auth=aiohttp.BasicAuth(self.client_id, self.secret)
+            ) as response:
+                response.raise_for_status()
+                return self._store_token(await response.json())
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created on first use, as it must belong to the running loop.
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=paypal.PP_POOL_SIZE),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=paypal.PP_CONNECT_TIMEOUT,
+                    sock_read=paypal.PP_READ_TIMEOUT
+                )
+            )
+        return self._session
+
+    async def post(
+            self,
+            path: str,
+            data: Dict[str, Any],
+            request_id: str | None = None
+    ) -> PayPalResponse:
+        """Make authorized POST request to PayPal REST API, as
+        PayPalClient.post does.
+
+        Args:
+            path: API path, e.g. "/v1/payments/payouts".
+            data: JSON body of the request.
+            request_id: PayPal-Request-Id, the same for every attempt of
+                one operation.
+
+        Returns:
+            Response of PayPal.
+
+        Raises:
+            aiohttp.ClientError: If request could not be made.
+            asyncio.TimeoutError: If PayPal did not answer in time.
+
+        """
+        return await self._request("POST", path, request_id, json=data)
+
+    async def get(self, path: str, params: Dict[str, Any] | None = None) -> PayPalResponse:
+        """Make authorized GET request to PayPal REST API, as
+        PayPalClient.get does.
+
+        Args:
+            path: API path, e.g. "/v1/payments/payouts/<batch ID>".
+            params: Query parameters.
+
+        Returns:
+            Response of PayPal.
+
+        Raises:
+            aiohttp.ClientError: If request could not be made.
+            asyncio.TimeoutError: If PayPal did not answer in time.
+
+        """
+        return await self._request("GET", path, None, params=params)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def _request(
+            self,
+            method: str,
+            path: str,
+            request_id: str | None,
+            **kwargs
+    ) -> PayPalResponse:
+        if request_id and (response := self._replay(request_id)):
+            return response
+        attempts = self._attempts(method, request_id)
+        for attempt in range(1, attempts + 1):
+            self._count("requests")
+            try:
+                token = await self.get_token()
+                response = await self._send(method, path, token, request_id, **kwargs)
+                if response.status_code == 401:
+                    response = await self._send(
+                        method,
+                        path,
+                        await self.get_token(refresh=True),
+                        request_id,
+                        **kwargs
+                    )
+            except NETWORK_ERRORS as error:
+                self._count("errors")
+                if attempt == attempts:
+                    raise
+                reason, delay = str(error) or type(error).__name__, self._backoff(attempt)
+            else:
+                if (delay := self._retry_delay(response, attempt, attempts)) is None:
+                    break
+                reason = f"status {response.status_code}"
+            self._count("retries")
+            logger.warning(f"PayPal {method} {path} failed ({reason}), retrying in {delay} s.")
+            await asyncio.sleep(delay)
+        if request_id and response.ok:
+            self._remember(request_id, response)
+        return response
+
+    async def _send(
+            self,
+            method: str,
+            path: str,
+            token: str,
+            request_id: str | None,
+            **kwargs
+    ) -> PayPalResponse:
+        async with self.session.request(
+                method,
+                f"{self.base_url}{path}",
+                headers=self._headers(token, request_id),
+                **kwargs
+        ) as response:
+            return PayPalResponse(response.status, await response.text(), response.headers)
+
+
+paypal_client = AsyncPayPalClient(paypal.pp_mode, paypal.pp_username, paypal.pp_password)
+metrics.register("paypal", paypal_client.stats)
+
+
+async def pp_couriers_payout(
+        couriers: List[Tuple[Any, ...]],
+        admin_id: int
+) -> Tuple[
+    Dict[str, List[Tuple[Any, ...]]],
+    List[Tuple[Any, ...]],
+    Dict[str, List[Tuple[Any, ...]]]
+]:
+    """Pay Couriers their balances with as few PayPal payout batches as
+    possible, as tools.pp_tools.pp_couriers_payout does.
+
+    Args:
+        couriers: Arrays containing info about couriers and payment.
+        admin_id: Telegram ID of the Admin paying the Couriers.
+
+    Returns:
+        Couriers by IDs of the payout batches accepted by PayPal,
+        Couriers not paid, and Couriers by sender batch IDs of the
+        batches PayPal may or may not have accepted.
+
+    """
+    batches = {}
+    unknown = {}
+    chunks, rejected = paypal.pp_payout_chunks(couriers)
+    while chunks:
+        status, batch_id, chunk = await pp_couriers_payout_batch(chunks.pop(), admin_id)
+        if status == "sent":
+            batches[batch_id] = chunk
+        elif status == "unknown":
+            unknown[batch_id] = chunk
+        elif len(chunk) > 1:
+            chunks.extend([courier] for courier in chunk)
+        else:
+            rejected.extend(chunk)
+    return batches, rejected, unknown
+
+
+@logger_decorator
+async def pp_couriers_payout_batch(
+        couriers: List[Tuple[Any, ...]],
+        admin_id: int
+) -> Tuple[str, str | None, List[Tuple[Any, ...]]]:
+    """Send one PayPal payout batch to the Couriers, deducting their
+    balances and recording the payroll run before, as
+    tools.pp_tools.pp_couriers_payout_batch does.
+
+    Args:
+        couriers: Arrays containing info about couriers and payment.
+        admin_id: Telegram ID of the Admin paying the Couriers.
+
+    Returns:
+        "sent" and PayPal payout batch ID if PayPal accepted the batch,
+        "rejected" and None if it refused it, "unknown" and sender batch
+        ID if it is not known whether PayPal accepted it, "skipped" and
+        None if there was nothing left to pay; Couriers of the batch.
+
+    """
+    sender_batch_id, couriers = await _start_payroll_run(couriers, admin_id)
+    if not couriers:
+        return "skipped", None, couriers
+    data = paypal.pp_couriers_payout_data(couriers, sender_batch_id)
+    try:
+        response = await paypal_client.post("/v1/payments/payouts", data, sender_batch_id)
+    except NETWORK_ERRORS as error:
+        logger.error(
+            f"Payout batch {sender_batch_id} may or may not have been accepted, check it in "
+            f"PayPal: {type(error).__name__}: {error}"
+        )
+        await _finish_payroll_run(sender_batch_id, "unknown", "")
+        return "unknown", sender_batch_id, couriers
+    status = paypal.pp_payout_batch_outcome(response)
+    if status == "sent":
+        batch_id = response.json()["batch_header"]["payout_batch_id"]
+        logger.info(f"Payout batch {batch_id} of {len(couriers)} couriers accepted.")
+        await _finish_payroll_run(sender_batch_id, "sent", batch_id)
+        return "sent", batch_id, couriers
+    if status == "unknown":
+        logger.error(
+            f"Payout batch {sender_batch_id} may or may not have been accepted, check it in "
+            f"PayPal: {response.text}"
+        )
+        await _finish_payroll_run(sender_batch_id, "unknown", "")
+        return "unknown", sender_batch_id, couriers
+    logger.error(f"Payout batch {sender_batch_id} rejected: {response.text}")
+    async with unit_of_work():
+        await pp_restore_courier_balances(couriers)
+        await _finish_payroll_run(sender_batch_id, "rejected", "")
+    return "rejected", None, couriers
+
+
+@cursor_decorator
+async def _start_payroll_run(
+        couriers: List[Tuple[Any, ...]],
+        admin_id: int,
+        curs: AsyncCursor
+) -> Tuple[str, List[Tuple[Any, ...]]]:
+    sender_batch_id = f"payroll-{uuid.uuid4()}"
+    await curs.execute(
+        paypal.DEDUCT_BALANCES_QUERY,
+        ([courier[0] for courier in couriers], [courier[3] for courier in couriers])
+    )
+    couriers = paypal.pp_deducted_couriers(
+        couriers,
+        [row[0] for row in await curs.fetchall()]
+    )
+    if couriers:
+        await curs.execute(
+            paypal.START_PAYROLL_RUN_QUERY,
+            (
+                sender_batch_id,
+                admin_id,
+                [courier[0] for courier in couriers],
+                [courier[3] for courier in couriers],
+                paypal.PAYROLL_RUN_LEASE
+            )
+        )
+    return sender_batch_id, couriers
+
+
+@cursor_decorator
+async def _finish_payroll_run(
+        sender_batch_id: str,
+        status: str,
+        batch_id: str,
+        curs: AsyncCursor
+) -> None:
+    await curs.execute(
+        paypal.FINISH_PAYROLL_RUN_QUERY,
+        (status, batch_id, paypal.PAYOUT_POLL_INTERVAL, sender_batch_id)
+    )
+
+
+@cursor_decorator
+@logger_decorator
+async def pp_restore_courier_balances(
+        couriers: List[Tuple[Any, ...]],
+        curs: AsyncCursor
+) -> None:
+    """Give amounts of failed payout items back to the Couriers.
+
+    Args:
+        couriers: Arrays containing info about couriers and payment.
+        curs: Cursor object from psycopg module.
+
+    """
+    await curs.execute(
+        paypal.RESTORE_BALANCES_QUERY,
+        ([courier[0] for courier in couriers], [courier[3] for courier in couriers])
+    )
@@ -0,0 +1,368 @@
+import hmac
+import json
+import time
+import asyncio
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set, Tuple
+
+import telebot.types as types
+from aiohttp import web
+from environs import Env
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+from tools import metrics
+from tools.async_cursor_tool import on_commit, pool
+from tools.bot_runner import (
+    BOT_MODE,
+    MAX_UPDATE_SIZE,
+    SECRET_HEADER,
+    WEBHOOK_HOST,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL
+)
+from tools.chat_dispatcher import chat_key
+from tools.logger_tool import logger
+from tools.send_queue import (
+    SEND_CHAT_BURST,
+    SEND_CHAT_RATE,
+    SEND_GLOBAL_RATE,
+    SEND_MAX_ATTEMPTS,
+    RateLimits,
+    RetryPolicy
+)
+from tools.telegram_session import TG_READ_TIMEOUT
+
+env = Env()
+env.read_env()
+
+asyncio_helper.REQUEST_TIMEOUT = TG_READ_TIMEOUT
+# The async client does not tell failed connections from lost responses.
+retry_policy = RetryPolicy(
+    asyncio_helper.ApiTelegramException,
+    (),
+    (asyncio_helper.ApiHTTPException, asyncio_helper.RequestTimeout)
+)
+
+_stop_hooks: List[Callable[[], Awaitable[None]]] = []
+
+
+def create_bot(token_variable: str) -> AsyncTeleBot:
+    """Create asyncio bot client, reading its token from environment.
+
+    Args:
+        token_variable: Name of environment variable with bot token.
+
+    Returns:
+        Bot client.
+
+    """
+    return AsyncTeleBot(token=env.str(token_variable), parse_mode="markdown")
+
+
+def on_stop(hook: Callable[[], Awaitable[None]]) -> None:
+    """Register coroutine function to be awaited once bots stop, e.g.
+    to close HTTP sessions of the bot module.
+
+    Args:
+        hook: Coroutine function taking no arguments.
+
+    """
+    if hook not in _stop_hooks:
+        _stop_hooks.append(hook)
+
+
+class AsyncChatDispatcher:
+    """Run updates of different chats concurrently and updates of one
+    chat one by one, in the order they were received, as ChatDispatcher
+    does for threads. Each update waits in a task of its own, so the
+    number of conversations handled at once is not limited by workers.
+    """
+
+    def __init__(self, bot: AsyncTeleBot):
+        self._process = bot.process_new_updates
+        self._tails: Dict[Hashable, asyncio.Event] = {}
+        self._running = 0
+        self._processed = 0
+        self._wait_time = 0.0
+        self._wait_time_max = 0.0
+
+    @classmethod
+    def install(cls, bot: AsyncTeleBot, name: str) -> "AsyncChatDispatcher":
+        """Route updates of the bot through a chat dispatcher and
+        register its metrics.
+
+        Args:
+            bot: Bot to install the dispatcher to.
+            name: Name of the bot for the metrics group.
+
+        Returns:
+            Installed dispatcher.
+
+        """
+        dispatcher = cls(bot)
+        bot.process_new_updates = dispatcher.process_new_updates
+        metrics.register(f"{name}_dispatcher", dispatcher.stats)
+        return dispatcher
+
+    async def process_new_updates(self, updates: List[types.Update]) -> None:
+        # Queued in order before anything is awaited, so later updates of
+        # a chat always wait for the earlier ones.
+        await asyncio.gather(*[self._queue(update) for update in updates])
+
+    def stats(self) -> Dict[str, Any]:
+        """Get dispatcher usage metrics.
+
+        Returns:
+            Numbers of chats with updates in progress and of running
+            updates, counter of processed updates and average and
+            maximal wait time of updates behind others of their chat.
+
+        """
+        return {
+            "chats": len(self._tails),
+            "running": self._running,
+            "processed": self._processed,
+            "wait_time_avg": round(self._wait_time / max(self._processed, 1), 4),
+            "wait_time_max": round(self._wait_time_max, 4)
+        }
+
+    def _queue(self, update: types.Update) -> Awaitable[None]:
+        key = chat_key(self._payload(update))
+        previous = self._tails.get(key)
+        self._tails[key] = done = asyncio.Event()
+        return self._run(update, key, previous, done)
+
+    async def _run(
+            self,
+            update: types.Update,
+            key: Hashable,
+            previous: asyncio.Event | None,
+            done: asyncio.Event
+    ) -> None:
+        queued = time.monotonic()
+        try:
+            if previous is not None:
+                await previous.wait()
+            wait_time = time.monotonic() - queued
+            self._running += 1
+            self._processed += 1
+            self._wait_time += wait_time
+            self._wait_time_max = max(self._wait_time_max, wait_time)
+            try:
+                await self._process([update])
+            except Exception as error:
+                logger.error(f"Update handler failed: {type(error).__name__}: {error}")
+            finally:
+                self._running -= 1
+        finally:
+            done.set()
+            if self._tails.get(key) is done:
+                del self._tails[key]
+
+    @staticmethod
+    def _payload(update: types.Update) -> Any:
+        return next(
+            (
+                value for name, value in vars(update).items()
+                if name != "update_id" and value is not None
+            ),
+            None
+        )
+
+
+class AsyncSender:
+    """Make bot API calls to chats within global and per-chat rate
+    limits of the bot, retrying them as SendQueue does, with the same
+    rate limits and retry policy. Calls to one chat are made in the
+    order they were sent, each in a task of its own, so callers do not
+    wait for rate limits.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int):
+        self._limits = RateLimits(global_rate, chat_rate, chat_burst)
+        self._chats: Dict[Tuple[str, int | str], asyncio.Event] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._sent = 0
+        self._retries = 0
+        self._failures = 0
+        self._rate_limited = 0
+
+    async def send(
+            self,
+            method: Callable[..., Awaitable[Any]],
+            chat_id: int | str,
+            *args,
+            **kwargs
+    ) -> None:
+        """Call bot API method to given chat in background. Calls sent
+        inside a unit of work are made once it commits and dropped if
+        it rolls back.
+
+        Args:
+            method: Bound async bot method, e.g. adm_bot.send_message.
+            chat_id: Telegram chat ID, first argument of the method.
+            *args: Other positional arguments of the method.
+            **kwargs: Keyword arguments of the method.
+
+        """
+        await on_commit(self._start, method, chat_id, args, kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get sender usage metrics.
+
+        Returns:
+            Numbers of calls in progress and chats waiting, counters of
+            sent, retried and failed calls and of rate limit responses.
+
+        """
+        return {
+            "queued": len(self._tasks),
+            "chats": len(self._chats),
+            "sent": self._sent,
+            "retries": self._retries,
+            "failures": self._failures,
+            "rate_limited": self._rate_limited
+        }
+
+    def _start(
+            self,
+            method: Callable[..., Awaitable[Any]],
+            chat_id: int | str,
+            args: Tuple[Any, ...],
+            kwargs: Dict[str, Any]
+    ) -> None:
+        self._limits.prune(time.monotonic(), self._chats)
+        key = (method.__self__.token, chat_id)
+        previous = self._chats.get(key)
+        self._chats[key] = done = asyncio.Event()
+        task = asyncio.create_task(self._call(key, previous, done, method, args, kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _call(
+            self,
+            key: Tuple[str, int | str],
+            previous: asyncio.Event | None,
+            done: asyncio.Event,
+            method: Callable[..., Awaitable[Any]],
+            args: Tuple[Any, ...],
+            kwargs: Dict[str, Any]
+    ) -> None:
+        try:
+            if previous is not None:
+                await previous.wait()
+            for attempt in range(1, SEND_MAX_ATTEMPTS + 1):
+                await self._wait_for_turn(key)
+                try:
+                    await method(key[1], *args, **kwargs)
+                except Exception as error:
+                    if retry_policy.is_rate_limit(error):
+                        self._rate_limited += 1
+                    retry_in = retry_policy.delay(error, method.__name__, attempt)
+                    if retry_in is None or attempt == SEND_MAX_ATTEMPTS:
+                        self._failures += 1
+                        logger.error(f"Failed to call {method.__name__} to {key[1]}: {error}")
+                        return None
+                    self._retries += 1
+                    logger.info(f"Retrying {method.__name__} to {key[1]} in {retry_in} s: {error}")
+                    await asyncio.sleep(retry_in)
+                else:
+                    self._sent += 1
+                    return None
+        finally:
+            done.set()
+            if self._chats.get(key) is done:
+                del self._chats[key]
+
+    async def _wait_for_turn(self, key: Tuple[str, int | str]) -> None:
+        while delay := self._limits.delay(key, time.monotonic()):
+            await asyncio.sleep(delay)
+        self._limits.take(key)
+
+
+sender = AsyncSender(SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST)
+metrics.register("send_queue", sender.stats)
+
+
+async def _serve_webhooks(bots: Dict[str, AsyncTeleBot]) -> None:
+    async def handle_update(request: web.Request) -> web.Response:
+        bot = bots.get(request.match_info["name"])
+        if bot is None:
+            return web.Response(status=HTTPStatus.NOT_FOUND)
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), WEBHOOK_SECRET):
+            logger.warning(f"Rejected webhook request to {request.path} with wrong secret token.")
+            return web.Response(status=HTTPStatus.FORBIDDEN)
+        try:
+            update = types.Update.de_json(json.loads(await request.read()))
+        except (ValueError, KeyError, TypeError) as error:
+            logger.error(f"Failed to parse update posted to {request.path}: {error}")
+            return web.Response(status=HTTPStatus.BAD_REQUEST)
+        task = asyncio.create_task(bot.process_new_updates([update]))
+        updates.add(task)
+        task.add_done_callback(updates.discard)
+        return web.Response(status=HTTPStatus.OK)
+
+    async def health(_: web.Request) -> web.Response:
+        return web.Response(status=HTTPStatus.OK)
+
+    updates: Set[asyncio.Task] = set()
+    app = web.Application(client_max_size=MAX_UPDATE_SIZE)
+    app.router.add_post("/{name}", handle_update)
+    app.router.add_get("/health", health)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    paths = ", ".join(f"/{name}" for name in bots)
+    logger.info(f"Serving {paths} on {WEBHOOK_HOST}:{WEBHOOK_PORT}.")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def _run_webhook(bots: Dict[str, AsyncTeleBot]) -> None:
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise ValueError("WEBHOOK_URL and WEBHOOK_SECRET must be set in webhook mode.")
+    for name, bot in bots.items():
+        await bot.remove_webhook()
+        await bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}/{name}",
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            secret_token=WEBHOOK_SECRET
+        )
+    await _serve_webhooks(bots)
+
+
+async def _run(bots: Dict[str, AsyncTeleBot]) -> None:
+    await pool.open()
+    metrics.register("db_pool", pool.get_stats)
+    try:
+        for name, bot in bots.items():
+            AsyncChatDispatcher.install(bot, name)
+        if BOT_MODE == "webhook":
+            return await _run_webhook(bots)
+        for bot in bots.values():
+            await bot.remove_webhook()
+        await asyncio.gather(*(bot.infinity_polling() for bot in bots.values()))
+    finally:
+        for hook in _stop_hooks:
+            await hook()
+        for bot in bots.values():
+            await bot.close_session()
+        await pool.close()
+
+
+def run(bots: Dict[str, AsyncTeleBot]) -> None:
+    """Receive updates of the bots on one asyncio event loop in the mode
+    set by BOT_MODE, long polling by default or webhook. Updates are
+    handled concurrently for different chats and in order within one
+    chat.
+
+    Args:
+        bots: Bots by names used as webhook paths.
+
+    """
+    asyncio.run(_run(bots))
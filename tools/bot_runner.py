@@ -0,0 +1,190 @@
+import hmac
+import json
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Mapping
+
+import telebot as tb
+import telebot.types as types
+from environs import Env
+
+from tools.chat_dispatcher import UPDATE_WORKERS, ChatDispatcher
+from tools.cursor_tool import DB_POOL_MAX_SIZE, pool
+from tools.logger_tool import logger
+
+env = Env()
+env.read_env()
+
+BOT_MODE = env.str("BOT_MODE", default="polling")
+# "async" runs bots that support it on tools.async_runtime instead.
+BOT_RUNTIME = env.str("BOT_RUNTIME", default="threads")
+WEBHOOK_URL = env.str("WEBHOOK_URL", default="")
+WEBHOOK_SECRET = env.str("WEBHOOK_SECRET", default="")
+WEBHOOK_HOST = env.str("WEBHOOK_HOST", default="0.0.0.0")
+WEBHOOK_PORT = env.int("WEBHOOK_PORT", default=8080)
+WEBHOOK_MAX_CONNECTIONS = env.int("WEBHOOK_MAX_CONNECTIONS", default=40)
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_UPDATE_SIZE = 1024 * 1024
+# DB connections for background workers, deferred callbacks and webhook
+# requests, on top of one per update worker.
+RESERVED_CONNECTIONS = 6
+
+_start_hooks: List[Callable[[], None]] = []
+_routes: Dict[str, Callable[[Mapping[str, str], bytes], HTTPStatus]] = {}
+
+
+def on_start(hook: Callable[[], None]) -> None:
+    """Register callable to be called once bots start receiving
+    updates, e.g. to start background workers of the bot module.
+
+    Args:
+        hook: Callable taking no arguments.
+
+    """
+    if hook not in _start_hooks:
+        _start_hooks.append(hook)
+
+
+def add_route(path: str, handler: Callable[[Mapping[str, str], bytes], HTTPStatus]) -> None:
+    """Serve POST requests to the path with the handler, next to bot
+    webhooks. The HTTP server is started in polling mode as well once
+    any route is added.
+
+    Args:
+        path: URL path, e.g. "/paypal".
+        handler: Callable taking request headers and body and returning
+            response status.
+
+    """
+    _routes[path] = handler
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Accept Telegram updates posted to "/<bot name>" paths and pass
+    them to the handlers of the bot. Requests to added routes are passed
+    to their handlers.
+    """
+    bots: Dict[str, tb.TeleBot] = {}
+
+    def do_POST(self) -> None:
+        if route := _routes.get(self.path):
+            return self._handle_route(route)
+        bot = self.bots.get(self.path.strip("/"))
+        if bot is None:
+            return self._reply(HTTPStatus.NOT_FOUND)
+        if not hmac.compare_digest(self.headers.get(SECRET_HEADER, ""), WEBHOOK_SECRET):
+            logger.warning(f"Rejected webhook request to {self.path} with wrong secret token.")
+            return self._reply(HTTPStatus.FORBIDDEN)
+        if (body := self._read_body()) is None:
+            return self._reply(HTTPStatus.BAD_REQUEST)
+        try:
+            update = types.Update.de_json(json.loads(body))
+        except (ValueError, KeyError, TypeError) as error:
+            logger.error(f"Failed to parse update posted to {self.path}: {error}")
+            return self._reply(HTTPStatus.BAD_REQUEST)
+        self._reply(HTTPStatus.OK)
+        bot.process_new_updates([update])
+
+    def do_GET(self) -> None:
+        self._reply(HTTPStatus.OK if self.path == "/health" else HTTPStatus.NOT_FOUND)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _handle_route(self, route: Callable[[Mapping[str, str], bytes], HTTPStatus]) -> None:
+        if (body := self._read_body()) is None:
+            return self._reply(HTTPStatus.BAD_REQUEST)
+        try:
+            status = route(self.headers, body)
+        except Exception as error:
+            logger.error(
+                f"Failed to handle request to {self.path}: {type(error).__name__}: {error}"
+            )
+            status = HTTPStatus.INTERNAL_SERVER_ERROR
+        self._reply(status)
+
+    def _read_body(self) -> bytes | None:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not 0 < length <= MAX_UPDATE_SIZE:
+            return None
+        return self.rfile.read(length)
+
+    def _reply(self, status: HTTPStatus) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        self.wfile.flush()
+
+
+def serve() -> None:
+    """Serve bot webhooks and added routes from one local HTTP server
+    until interrupted.
+    """
+    server = ThreadingHTTPServer((WEBHOOK_HOST, WEBHOOK_PORT), WebhookHandler)
+    server.daemon_threads = True
+    paths = [f"/{name}" for name in WebhookHandler.bots] + list(_routes)
+    logger.info(f"Serving {', '.join(paths)} on {WEBHOOK_HOST}:{WEBHOOK_PORT}.")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def run_webhook(bots: Dict[str, tb.TeleBot]) -> None:
+    """Register webhooks of the bots with Telegram and serve them from
+    one local HTTP server until interrupted.
+
+    Args:
+        bots: Bots by names used as webhook paths.
+
+    Raises:
+        ValueError: If WEBHOOK_URL or WEBHOOK_SECRET are not set.
+
+    """
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise ValueError("WEBHOOK_URL and WEBHOOK_SECRET must be set in webhook mode.")
+    WebhookHandler.bots = bots
+    for name, bot in bots.items():
+        bot.remove_webhook()
+        bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}/{name}",
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            secret_token=WEBHOOK_SECRET
+        )
+    serve()
+
+
+def run(bots: Dict[str, tb.TeleBot]) -> None:
+    """Receive updates of the bots in the mode set by BOT_MODE, long
+    polling by default or webhook. Updates are handled by a chat
+    dispatcher, in parallel for different chats and in order within
+    one chat.
+
+    Args:
+        bots: Bots by names used as webhook paths.
+
+    """
+    needed_connections = len(bots) * UPDATE_WORKERS + RESERVED_CONNECTIONS
+    if DB_POOL_MAX_SIZE is None:
+        pool.grow(needed_connections)
+    elif needed_connections > DB_POOL_MAX_SIZE:
+        logger.warning(
+            f"{needed_connections} update workers and background tasks share "
+            f"{DB_POOL_MAX_SIZE} DB connections, handlers may wait for a free connection. "
+            f"Raise DB_POOL_MAX_SIZE or lower UPDATE_WORKERS."
+        )
+    for name, bot in bots.items():
+        ChatDispatcher.install(bot, name)
+    for hook in _start_hooks:
+        hook()
+    if BOT_MODE == "webhook":
+        return run_webhook(bots)
+    if _routes:
+        threading.Thread(target=serve, name="http-server", daemon=True).start()
+    *other_bots, last_bot = bots.values()
+    for bot in bots.values():
+        bot.remove_webhook()
+    for bot in other_bots:
+        threading.Thread(target=bot.infinity_polling, daemon=True).start()
+    last_bot.infinity_polling()
@@ -1,15 +1,60 @@
+import threading
+from typing import Any
+
 import telebot as tb
 from environs import Env
 
+from tools import metrics, telegram_session
+from tools.send_queue import (
+    SEND_CHAT_BURST,
+    SEND_CHAT_RATE,
+    SEND_GLOBAL_RATE,
+    SEND_WORKERS,
+    SendQueue
+)
+
 env = Env()
 env.read_env()
 
-CUSTOMER_BOT_TOKEN = env.str("CUSTOMER_BOT_TOKEN")
-RESTAURANT_BOT_TOKEN = env.str("RESTAURANT_BOT_TOKEN")
-COURIER_BOT_TOKEN = env.str("COURIER_BOT_TOKEN")
-ADMIN_BOT_TOKEN = env.str("ADMIN_BOT_TOKEN")
+telegram_session.install()
+
+
+class LazyBot:
+    """TeleBot client created, and its token read, on first use. Other
+    bots of the service are only used to send notifications, so most
+    processes never need all of them.
+    """
+
+    def __init__(self, token_variable: str):
+        object.__setattr__(self, "token_variable", token_variable)
+        object.__setattr__(self, "_bot", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    @property
+    def bot(self) -> tb.TeleBot:
+        if self._bot is None:
+            with self._lock:
+                if self._bot is None:
+                    # No worker pool of its own: updates are handled by
+                    # the chat dispatcher installed by bot runner.
+                    object.__setattr__(self, "_bot", tb.TeleBot(
+                        token=env.str(self.token_variable),
+                        parse_mode="markdown",
+                        threaded=False
+                    ))
+        return self._bot
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.bot, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.bot, name, value)
+
+
+cus_bot = LazyBot("CUSTOMER_BOT_TOKEN")
+rest_bot = LazyBot("RESTAURANT_BOT_TOKEN")
+courier_bot = LazyBot("COURIER_BOT_TOKEN")
+adm_bot = LazyBot("ADMIN_BOT_TOKEN")
 
-cus_bot = tb.TeleBot(token=CUSTOMER_BOT_TOKEN, parse_mode="markdown")
-rest_bot = tb.TeleBot(token=RESTAURANT_BOT_TOKEN, parse_mode="markdown")
-courier_bot = tb.TeleBot(token=COURIER_BOT_TOKEN, parse_mode="markdown")
-adm_bot = tb.TeleBot(token=ADMIN_BOT_TOKEN, parse_mode="markdown")
+send_queue = SendQueue(SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_WORKERS)
+metrics.register("send_queue", send_queue.stats)
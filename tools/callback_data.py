@@ -0,0 +1,202 @@
+import uuid
+import base64
+import binascii
+from typing import Any, Callable, Dict, NamedTuple, Tuple
+
+import telebot as tb
+import telebot.types as types
+
+VERSION = "1"
+SEPARATOR = ":"
+MAX_LENGTH = 64
+
+
+class Action(NamedTuple):
+    code: str
+    uuid_arg: bool
+
+
+# Keys are the action words of the legacy "<action> <argument>" format,
+# so buttons sent before the codec was introduced keep working.
+ACTIONS: Dict[str, Action] = {
+    "paid": Action("p", True),
+    "cancel": Action("c", True),
+    "accepted": Action("a", True),
+    "accept": Action("A", True),
+    "ready": Action("r", True),
+    "in_delivery": Action("i", True),
+    "delivered": Action("d", True),
+    "order_closed": Action("x", True),
+    "type": Action("t", False),
+}
+ACTIONS_BY_CODE = {action.code: name for name, action in ACTIONS.items()}
+
+
+class CallbackData(NamedTuple):
+    action: str
+    arg: str
+
+
+def encode_callback(action: str, arg: str) -> str:
+    """Compose callback data of inline button.
+
+    Args:
+        action: Action name, one of ACTIONS.
+        arg: Action argument, UUID for actions taking one.
+
+    Returns:
+        Callback data in "<version>:<action code>:<argument>" format
+        with UUIDs packed in 22 characters.
+
+    Raises:
+        ValueError: If action is unknown or callback data exceeds
+            Telegram limit of 64 bytes.
+
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown callback action: {action}.")
+    if ACTIONS[action].uuid_arg:
+        arg = base64.urlsafe_b64encode(uuid.UUID(arg).bytes).decode().rstrip("=")
+    data = SEPARATOR.join((VERSION, ACTIONS[action].code, arg))
+    if len(data.encode()) > MAX_LENGTH:
+        raise ValueError(f"Callback data is longer than {MAX_LENGTH} bytes: {data}.")
+    return data
+
+
+def decode_callback(data: str | None) -> CallbackData | None:
+    """Parse callback data of inline button, in current or legacy
+    format.
+
+    Args:
+        data: Callback data.
+
+    Returns:
+        Action name and argument, or None if data does not encode any
+        known action.
+
+    """
+    if not data:
+        return None
+    if data.startswith(VERSION + SEPARATOR):
+        _, code, arg = (data.split(SEPARATOR, 2) + ["", ""])[:3]
+        if not (action := ACTIONS_BY_CODE.get(code)):
+            return None
+        if ACTIONS[action].uuid_arg:
+            try:
+                arg = str(uuid.UUID(bytes=base64.urlsafe_b64decode(arg + "==")))
+            except (binascii.Error, ValueError):
+                return None
+        return CallbackData(action, arg)
+    action, _, arg = data.partition(" ")
+    if action not in ACTIONS or not arg:
+        return None
+    if ACTIONS[action].uuid_arg:
+        try:
+            uuid.UUID(arg)
+        except ValueError:
+            return None
+    return CallbackData(action, arg)
+
+
+class CallbackRouter:
+    def __init__(self, texts: Dict[str, Dict[str, Any]]):
+        self.texts = texts
+        self._actions: Dict[str, Callable[[types.CallbackQuery], Any]] = {}
+        self._prompt_routes: Dict[str, Tuple[Callable[[types.CallbackQuery], Any], int]] = {}
+        self._data_routes: Dict[str, Tuple[Callable[[types.CallbackQuery], Any], int]] = {}
+        self._order = 0
+
+    def action(self, name: str):
+        """Route callback queries encoding given action to decorated
+        handler. The handler receives the query with action argument as
+        its data.
+
+        Args:
+            name: Action name, one of ACTIONS.
+
+        """
+        if name not in ACTIONS:
+            raise ValueError(f"Unknown callback action: {name}.")
+
+        def decorator(func):
+            self._actions[name] = func
+            return func
+
+        return decorator
+
+    def prompt(self, key: str):
+        """Route callback queries from buttons under the bot message with
+        given localized text in any language to decorated handler.
+
+        Args:
+            key: Key of the text in translations, e.g. "CHANGE_LANG_MSG".
+
+        """
+        return self._route(self._prompt_routes, key)
+
+    def data(self, key: str):
+        """Route callback queries with data equal to given localized
+        text in any language to decorated handler.
+
+        Args:
+            key: Key of the text in translations, e.g. "CART_BTN".
+
+        """
+        return self._route(self._data_routes, key)
+
+    def route(self, call: types.CallbackQuery) -> Callable[[types.CallbackQuery], Any] | None:
+        """Find handler of the callback query. Action routes win over
+        prompt and data routes; between the latter the one registered
+        first wins, same as with separately registered handlers.
+
+        Args:
+            call: Callback query from user.
+
+        Returns:
+            Handler of the query if there is one, otherwise None.
+
+        """
+        if (callback_data := decode_callback(call.data)) and callback_data.action in self._actions:
+            return self._actions[callback_data.action]
+        text = call.message.text if call.message else None
+        prompt_route = self._prompt_routes.get(text) if text else None
+        data_route = self._data_routes.get(call.data) if call.data else None
+        if prompt_route and data_route:
+            return min(prompt_route, data_route, key=lambda route: route[1])[0]
+        return (prompt_route or data_route or (None,))[0]
+
+    def dispatch(self, call: types.CallbackQuery) -> None:
+        """Pass callback query to its handler, replacing encoded data of
+        action queries with action argument.
+
+        Args:
+            call: Callback query from user.
+
+        """
+        if not (handler := self.route(call)):
+            return None
+        if (callback_data := decode_callback(call.data)) and callback_data.action in self._actions:
+            call.data = callback_data.arg
+        handler(call)
+
+    def register(self, bot: tb.TeleBot) -> None:
+        """Register the router as a single callback query handler of the
+        bot.
+
+        Args:
+            bot: Bot to register the router with.
+
+        """
+        bot.register_callback_query_handler(
+            self.dispatch,
+            func=lambda call: self.route(call) is not None
+        )
+
+    def _route(self, routes: Dict[str, Tuple[Callable[..., Any], int]], key: str):
+        def decorator(func):
+            for lang_texts in self.texts.values():
+                routes.setdefault(lang_texts[key], (func, self._order))
+            self._order += 1
+            return func
+
+        return decorator
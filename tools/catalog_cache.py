@@ -0,0 +1,149 @@
+import time
+import select
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+import psycopg2
+from environs import Env
+from psycopg2.extensions import cursor
+
+from tools import metrics
+from tools.cursor_tool import connect
+from tools.logger_tool import logger
+
+env = Env()
+env.read_env()
+
+CATALOG_CACHE_TTL = env.float("CATALOG_CACHE_TTL", default=600.0)
+CATALOG_CHANNEL = "catalog_changed"
+LISTEN_HEARTBEAT = 30.0
+RECONNECT_DELAY = 5.0
+
+
+def notify_catalog_changed(curs: cursor) -> None:
+    """Notify catalog caches of all bot processes that restaurants or
+    dishes have changed. The notification is delivered when the current
+    transaction commits and dropped if it rolls back.
+
+    Args:
+        curs: Cursor object from psycopg2 module.
+
+    """
+    curs.execute("NOTIFY " + CATALOG_CHANNEL)
+
+
+class CatalogCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, Hashable], Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._listening = threading.Event()
+        self._listener_started = False
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def clear(self) -> None:
+        """Drop all cached catalog data."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache usage metrics.
+
+        Returns:
+            Cache size, hit and miss counters, number of invalidations
+            and state of the change listener.
+
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "listening": self._listening.is_set()
+            }
+
+    def cached(self, name: str, key: Callable[..., Hashable] = lambda *args: ()):
+        """Decorate catalog reading method, so that its result is served
+        from memory until the catalog changes. The change listener is
+        started on first call and the cache is bypassed while it is not
+        connected. Must be placed above the cursor decorator.
+
+        Args:
+            name: Name of the cached catalog query.
+            key: Callable getting query parameters from the arguments
+                of decorated method.
+
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if self.ttl <= 0:
+                    return func(*args, **kwargs)
+                if not self._listening.is_set():
+                    self.start_listener()
+                    return func(*args, **kwargs)
+                entry_key = (name, key(*args, **kwargs))
+                with self._lock:
+                    entry = self._entries.get(entry_key)
+                    if entry and entry[1] > time.monotonic():
+                        self._hits += 1
+                        return entry[0]
+                    self._misses += 1
+                    generation = self._generation
+                value = func(*args, **kwargs)
+                with self._lock:
+                    if generation == self._generation:
+                        self._entries[entry_key] = (value, time.monotonic() + self.ttl)
+                return value
+
+            return wrapper
+
+        return decorator
+
+    def start_listener(self) -> None:
+        """Start background thread listening for catalog change
+        notifications and clearing the cache on each of them.
+        """
+        with self._lock:
+            if self._listener_started:
+                return None
+            self._listener_started = True
+        metrics.register("catalog_cache", self.stats)
+        threading.Thread(target=self._listen, name="catalog-listener", daemon=True).start()
+
+    def _listen(self) -> None:
+        while True:
+            conn = None
+            try:
+                conn = connect()
+                conn.autocommit = True
+                with conn.cursor() as curs:
+                    curs.execute("LISTEN " + CATALOG_CHANNEL)
+                    self.clear()
+                    self._listening.set()
+                    logger.info(f"Listening for {CATALOG_CHANNEL} notifications.")
+                    while True:
+                        if select.select([conn], [], [], LISTEN_HEARTBEAT) == ([], [], []):
+                            curs.execute("SELECT 1")
+                            continue
+                        conn.poll()
+                        if conn.notifies:
+                            conn.notifies.clear()
+                            self.clear()
+            except (psycopg2.Error, OSError) as error:
+                logger.error(f"Catalog change listener failed: {error}")
+            finally:
+                self._listening.clear()
+                if conn is not None and not conn.closed:
+                    conn.close()
+            time.sleep(RECONNECT_DELAY)
+
+
+catalog_cache = CatalogCache(CATALOG_CACHE_TTL)
@@ -0,0 +1,185 @@
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, Tuple
+
+import telebot as tb
+from environs import Env
+
+from tools import metrics
+from tools.logger_tool import logger
+
+env = Env()
+env.read_env()
+
+UPDATE_WORKERS = env.int("UPDATE_WORKERS", default=4)
+
+Task = Tuple[Callable[..., Any], Tuple[Any, ...], Dict[str, Any], float]
+
+
+def chat_key(update: Any) -> Hashable:
+    """Get ID of the chat an update belongs to.
+
+    Args:
+        update: Message, callback query or other update object passed
+            to bot handlers.
+
+    Returns:
+        Chat ID, ID of the user if update has no chat, or None if it has
+        neither.
+
+    """
+    message = getattr(update, "message", None)
+    chat = getattr(update, "chat", None) or getattr(message, "chat", None)
+    if chat:
+        return chat.id
+    user = getattr(update, "from_user", None)
+    return user.id if user else None
+
+
+class ChatDispatcher:
+    """Worker pool running updates of different chats in parallel and
+    updates of one chat one by one, in the order they were received.
+    Replaces worker pool of the bot, so it must provide the interface
+    the bot expects from it.
+    """
+
+    def __init__(self, bot: tb.TeleBot, workers: int):
+        self.bot = bot
+        self.workers = workers
+        self.exception_event = threading.Event()
+        self.exception_info = None
+        self._lock = threading.Condition()
+        self._chats: Dict[Hashable, Deque[Task]] = {}
+        self._ready: Deque[Hashable] = deque()
+        self._running = True
+        self._busy = 0
+        self._processed = 0
+        self._depth_max = 0
+        self._wait_time = 0.0
+        self._wait_time_max = 0.0
+        self._threads = [
+            threading.Thread(target=self._work, name=f"chat-dispatcher-{number}", daemon=True)
+            for number in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @classmethod
+    def install(
+            cls,
+            bot: tb.TeleBot,
+            name: str,
+            workers: int = UPDATE_WORKERS
+    ) -> "ChatDispatcher":
+        """Replace worker pool of the bot with a chat dispatcher and
+        register its metrics.
+
+        Args:
+            bot: Bot to install the dispatcher to.
+            name: Name of the bot for the metrics group.
+            workers: Number of worker threads.
+
+        Returns:
+            Installed dispatcher.
+
+        """
+        worker_pool = getattr(bot, "worker_pool", None)
+        if isinstance(worker_pool, cls):
+            return worker_pool
+        if worker_pool:
+            worker_pool.close()
+        bot.threaded = True
+        bot.worker_pool = cls(bot, workers)
+        metrics.register(f"{name}_dispatcher", bot.worker_pool.stats)
+        return bot.worker_pool
+
+    def put(self, func: Callable[..., Any], *args, **kwargs) -> None:
+        """Queue handler call for an update. Calls for one chat are made
+        in the order they were queued.
+
+        Args:
+            func: Callable to run.
+            *args: Positional arguments, first of them being the update.
+            **kwargs: Keyword arguments.
+
+        """
+        key = chat_key(args[0]) if args else None
+        with self._lock:
+            tasks = self._chats.setdefault(key, deque())
+            tasks.append((func, args, kwargs, time.monotonic()))
+            self._depth_max = max(self._depth_max, len(tasks))
+            if len(tasks) == 1:
+                self._ready.append(key)
+                self._lock.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get dispatcher usage metrics.
+
+        Returns:
+            Numbers of queued updates, chats waiting and busy workers,
+            counter of processed updates, maximal per-chat queue depth
+            and average and maximal wait time of updates in the queue.
+
+        """
+        with self._lock:
+            return {
+                "queued": sum(len(tasks) for tasks in self._chats.values()) - self._busy,
+                "chats": len(self._chats),
+                "busy": self._busy,
+                "workers": self.workers,
+                "processed": self._processed,
+                "depth_max": self._depth_max,
+                "wait_time_avg": round(self._wait_time / max(self._processed, 1), 4),
+                "wait_time_max": round(self._wait_time_max, 4)
+            }
+
+    def raise_exceptions(self) -> None:
+        if self.exception_event.is_set():
+            raise self.exception_info
+
+    def clear_exceptions(self) -> None:
+        self.exception_event.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            self._running = False
+            self._lock.notify_all()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                while self._running and not self._ready:
+                    self._lock.wait()
+                if not self._running:
+                    return None
+                key = self._ready.popleft()
+                func, args, kwargs, queued = self._chats[key][0]
+                wait_time = time.monotonic() - queued
+                self._busy += 1
+                self._processed += 1
+                self._wait_time += wait_time
+                self._wait_time_max = max(self._wait_time_max, wait_time)
+            try:
+                func(*args, **kwargs)
+            except Exception as error:
+                self._on_exception(error)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    self._chats[key].popleft()
+                    if self._chats[key]:
+                        self._ready.append(key)
+                        self._lock.notify()
+                    else:
+                        del self._chats[key]
+
+    def _on_exception(self, error: Exception) -> None:
+        logger.error(f"Update handler failed: {type(error).__name__}: {error}")
+        handler = self.bot.exception_handler
+        if not (handler and handler.handle(error)):
+            self.exception_info = error
+            self.exception_event.set()
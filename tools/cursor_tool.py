@@ -1,29 +1,320 @@
+import time
 import functools
+import threading
+import contextlib
+import contextvars
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 
 import psycopg2
+import psycopg2.pool
 from environs import Env
+from psycopg2.extensions import connection, cursor as pg_cursor, TRANSACTION_STATUS_IDLE
+
+from tools import metrics
+from tools.logger_tool import logger
 
 env = Env()
 env.read_env()
 
 DB_USER = env.str("DB_USER")
 DB_PASSWORD = env.str("DB_PASSWORD")
+DB_POOL_MIN_SIZE = env.int("DB_POOL_MIN_SIZE", default=1)
+# Sized from the bots run by the process unless set, see bot_runner.
+DB_POOL_MAX_SIZE = env.int("DB_POOL_MAX_SIZE", default=None)
+DEFAULT_POOL_MAX_SIZE = 10
+DB_POOL_TIMEOUT = env.float("DB_POOL_TIMEOUT", default=5.0)
+DB_POOL_CHECK_AFTER = env.float("DB_POOL_CHECK_AFTER", default=30.0)
+DB_POOL_MAX_IDLE = env.float("DB_POOL_MAX_IDLE", default=300.0)
+
+
+class PoolExhaustedError(psycopg2.pool.PoolError):
+    """No pooled database connection became available in time."""
+
+
+def connect() -> connection:
+    """Open new connection to the service database.
+
+    Returns:
+        Connection object from psycopg2.
+
+    """
+    return psycopg2.connect(
+        database="postgres",
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host="liefer_bot_db",
+        port=5432
+    )
+
+
+class ConnectionPool:
+    def __init__(self, min_size: int, max_size: int, timeout: float):
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle: List[Tuple[connection, float]] = []
+        self._in_use = 0
+        self._waiting = 0
+        self._warmed_up = False
+        self._condition = threading.Condition()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def getconn(self) -> connection:
+        """Check out connection from the pool, waiting up to the pool
+        timeout for one to be returned if the pool is at its maximum
+        size.
+
+        Returns:
+            Healthy connection object from psycopg2.
+
+        Raises:
+            PoolExhaustedError: If no connection became available in
+                time.
+
+        """
+        self._warm_up()
+        started = time.monotonic()
+        with self._condition:
+            self._waiting += 1
+            try:
+                while not self._idle and self._in_use + len(self._idle) >= self.max_size:
+                    remaining = started + self.timeout - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolExhaustedError(
+                            f"No database connection available within {self.timeout} s "
+                            f"({self._in_use} of {self.max_size} in use)."
+                        )
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting -= 1
+            conn, returned_at = self._idle.pop() if self._idle else (None, 0.0)
+            self._in_use += 1
+            self._checkouts += 1
+            wait_time = time.monotonic() - started
+            self._wait_time_total += wait_time
+            self._wait_time_max = max(self._wait_time_max, wait_time)
+        if conn is None or not self._is_healthy(conn, returned_at):
+            try:
+                conn = connect()
+            except Exception:
+                self._release_slot()
+                raise
+        return conn
+
+    def putconn(self, conn: connection, discard: bool = False) -> None:
+        """Return connection to the pool. Broken or discarded
+        connections are closed instead of being kept.
+
+        Args:
+            conn: Connection object from psycopg2.
+            discard: Close connection instead of keeping it.
+
+        """
+        if discard or conn.closed or conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            self._close(conn)
+            self._release_slot()
+            return None
+        now = time.monotonic()
+        with self._condition:
+            self._in_use -= 1
+            self._idle.append((conn, now))
+            stale = [
+                idle for idle in self._idle[:len(self._idle) - self.min_size]
+                if now - idle[1] > DB_POOL_MAX_IDLE
+            ]
+            for idle in stale:
+                self._idle.remove(idle)
+            self._condition.notify()
+        for idle_conn, _ in stale:
+            self._close(idle_conn)
+
+    def grow(self, max_size: int) -> None:
+        """Raise maximum number of connections of the pool. Values below
+        the current maximum are ignored.
+
+        Args:
+            max_size: New maximum number of connections.
+
+        """
+        with self._condition:
+            if max_size > self.max_size:
+                self.max_size = max_size
+                self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get pool usage metrics.
+
+        Returns:
+            Numbers of connections in use, idle and waiting callers,
+            checkout counters and wait times in seconds.
+
+        """
+        with self._condition:
+            return {
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "wait_time_total": round(self._wait_time_total, 4),
+                "wait_time_avg": round(self._wait_time_total / (self._checkouts or 1), 4),
+                "wait_time_max": round(self._wait_time_max, 4)
+            }
+
+    def _warm_up(self) -> None:
+        if self._warmed_up:
+            return None
+        with self._condition:
+            if self._warmed_up:
+                return None
+            self._warmed_up = True
+            for _ in range(self.min_size - len(self._idle)):
+                try:
+                    self._idle.append((connect(), time.monotonic()))
+                except psycopg2.Error as error:
+                    logger.error(f"Failed to open pooled database connection: {error}")
+                    break
+
+    def _release_slot(self) -> None:
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _is_healthy(conn: connection, returned_at: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < DB_POOL_CHECK_AFTER:
+            return True
+        try:
+            with conn.cursor() as curs:
+                curs.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            logger.info("Dropping broken pooled database connection.")
+            ConnectionPool._close(conn)
+            return False
+
+    @staticmethod
+    def _close(conn: connection) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+pool = ConnectionPool(
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE or DEFAULT_POOL_MAX_SIZE,
+    DB_POOL_TIMEOUT
+)
+metrics.register("db_pool", pool.stats)
+
+
+_scope_connection: contextvars.ContextVar[connection | None] = contextvars.ContextVar(
+    "scope_connection",
+    default=None
+)
+_scope_cache: contextvars.ContextVar[Dict[Any, Any] | None] = contextvars.ContextVar(
+    "scope_cache",
+    default=None
+)
+_scope_hooks: contextvars.ContextVar[List[Tuple[Callable[..., Any], Tuple, Dict]] | None] = (
+    contextvars.ContextVar("scope_hooks", default=None)
+)
+
+
+def scope_cache() -> Dict[Any, Any]:
+    """Get storage for data read inside the current unit of work. The
+    storage is discarded together with the scope, so cached values never
+    outlive the transaction they were read in.
+
+    Returns:
+        Storage of the current unit of work, or new empty dictionary if
+        called outside of one.
+
+    """
+    cache = _scope_cache.get()
+    return cache if cache is not None else {}
+
+
+def on_commit(func: Callable[..., Any], *args, **kwargs) -> None:
+    """Call function once the current unit of work is committed, e.g.
+    to notify users of the change only when it is visible to everyone.
+    Calls are dropped if the unit of work rolls back, and made right
+    away if called outside of one.
+
+    Args:
+        func: Function to call.
+        *args: Positional arguments of the function.
+        **kwargs: Keyword arguments of the function.
+
+    """
+    if (hooks := _scope_hooks.get()) is None:
+        func(*args, **kwargs)
+    else:
+        hooks.append((func, args, kwargs))
+
+
+def _run_hooks(hooks: List[Tuple[Callable[..., Any], Tuple, Dict]]) -> None:
+    for func, args, kwargs in hooks:
+        try:
+            func(*args, **kwargs)
+        except Exception as error:
+            logger.error(
+                f"After-commit call of {getattr(func, '__name__', func)} failed: "
+                f"{type(error).__name__}: {error}"
+            )
+
+
+@contextlib.contextmanager
+def unit_of_work() -> Iterator[pg_cursor]:
+    """Open database scope sharing one pooled connection and one
+    transaction between all cursor-decorated calls made inside it.
+    Nested scopes join the outermost one, which commits on success and
+    rolls back on any exception. Calls registered with on_commit() are
+    made after the commit. Can be used as a decorator as well, e.g. on
+    update handlers.
+
+    Yields:
+        Cursor object from psycopg2 bound to the scope's connection.
+
+    """
+    if (conn := _scope_connection.get()) is not None:
+        yield conn.cursor()
+        return None
+    conn = pool.getconn()
+    token = _scope_connection.set(conn)
+    cache_token = _scope_cache.set({})
+    hooks_token = _scope_hooks.set(hooks := [])
+    failed = True
+    try:
+        yield conn.cursor()
+        conn.commit()
+        failed = False
+    finally:
+        _scope_hooks.reset(hooks_token)
+        _scope_cache.reset(cache_token)
+        _scope_connection.reset(token)
+        if failed and not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        pool.putconn(conn)
+    _run_hooks(hooks)
 
 
 def cursor(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = psycopg2.connect(
-            database="postgres",
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host="liefer_bot_db",
-            port=5432
-        )
-        curs = conn.cursor()
-        result = func(*args, **kwargs, curs=curs)
-        conn.commit()
-        conn.close()
-        return result
+        with unit_of_work() as curs:
+            return func(*args, **kwargs, curs=curs)
 
     return wrapper
@@ -0,0 +1,113 @@
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Set
+
+import telebot as tb
+import telebot.types as types
+from environs import Env
+from telebot.apihelper import ApiException
+
+from tools import metrics
+from tools.chat_dispatcher import chat_key
+from tools.logger_tool import logger
+
+env = Env()
+env.read_env()
+
+CALLBACK_WORKERS = env.int("CALLBACK_WORKERS", default=4)
+
+
+class DeferredCallbacks:
+    """Run slow callback query handlers in background, answering the
+    query first so the button stops spinning, and drop repeated taps
+    while a handler of the same chat is still running. Handlers run
+    outside of the chat's order of updates, so they must only send and
+    edit messages and keep their database work in units of work, leaving
+    cart and conversation state to the handlers run in order.
+    """
+
+    def __init__(self, bot: tb.TeleBot, name: str, workers: int = CALLBACK_WORKERS):
+        self.bot = bot
+        self.name = name
+        self.workers = workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._in_flight: Set[Hashable] = set()
+        self._started = 0
+        self._dropped = 0
+        self._failed = 0
+        metrics.register(f"{name}_deferred_callbacks", self.stats)
+
+    def deferred(self):
+        """Decorate callback query handler to be run in background.
+        Handler must not answer the query itself, as it is answered
+        before the handler starts.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(call: types.CallbackQuery) -> None:
+                task_key = chat_key(call)
+                with self._lock:
+                    duplicate = task_key in self._in_flight
+                    if duplicate:
+                        self._dropped += 1
+                    else:
+                        self._in_flight.add(task_key)
+                        self._started += 1
+                self._answer(call)
+                if duplicate:
+                    logger.info(f"Dropped repeated {func.__name__} callback of chat {task_key}.")
+                    return None
+                self._get_executor().submit(self._run, func, call, task_key)
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> Dict[str, Any]:
+        """Get usage metrics.
+
+        Returns:
+            Number of handlers running, counters of started, failed and
+            dropped repeated ones.
+
+        """
+        with self._lock:
+            return {
+                "in_flight": len(self._in_flight),
+                "started": self._started,
+                "failed": self._failed,
+                "dropped": self._dropped
+            }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.workers,
+                    thread_name_prefix=f"{self.name}-deferred"
+                )
+            return self._executor
+
+    def _answer(self, call: types.CallbackQuery) -> None:
+        try:
+            self.bot.answer_callback_query(call.id)
+        except ApiException as error:
+            logger.warning(f"Failed to answer callback query {call.id}: {error}")
+
+    def _run(
+            self,
+            func: Callable[[types.CallbackQuery], Any],
+            call: types.CallbackQuery,
+            task_key: Hashable
+    ) -> None:
+        try:
+            func(call)
+        except Exception as error:
+            with self._lock:
+                self._failed += 1
+            logger.error(f"Deferred {func.__name__} failed: {type(error).__name__}: {error}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(task_key)
@@ -0,0 +1,134 @@
+import time
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+from environs import Env
+
+from tools import metrics
+from tools.cursor_tool import on_commit, scope_cache
+
+env = Env()
+env.read_env()
+
+LANG_CACHE_SIZE = env.int("LANG_CACHE_SIZE", default=10000)
+LANG_CACHE_TTL = env.float("LANG_CACHE_TTL", default=300.0)
+
+
+class LangCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[Tuple[str, int], Tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, role: str, tg_id: int) -> str | None:
+        """Get cached language code of user.
+
+        Args:
+            role: User role, e.g. "customer" or "courier".
+            tg_id: User Telegram ID.
+
+        Returns:
+            Cached language code if there is a fresh one, otherwise None.
+
+        """
+        key = (role, tg_id)
+        with self._lock:
+            if (entry := self._entries.get(key)) and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            self._entries.pop(key, None)
+            self._misses += 1
+            return None
+
+    def set(self, role: str, tg_id: int, lang: str) -> None:
+        """Cache language code of user, evicting least recently used
+        entries above the cache size.
+
+        Args:
+            role: User role.
+            tg_id: User Telegram ID.
+            lang: Language code.
+
+        """
+        if self.max_size <= 0 or self.ttl <= 0:
+            return None
+        with self._lock:
+            self._entries[(role, tg_id)] = (lang, time.monotonic() + self.ttl)
+            self._entries.move_to_end((role, tg_id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, role: str, tg_id: int) -> None:
+        """Drop cached language code of user once the current unit of
+        work commits. Until then the unit of work reads the code from
+        the database without caching it, so an uncommitted code is never
+        cached.
+
+        Args:
+            role: User role.
+            tg_id: User Telegram ID.
+
+        """
+        scope_cache()[("lang_changed", role, tg_id)] = True
+        on_commit(self._drop, role, tg_id)
+
+    def _drop(self, role: str, tg_id: int) -> None:
+        with self._lock:
+            self._entries.pop((role, tg_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache usage metrics.
+
+        Returns:
+            Cache size, hit and miss counters, hit rate and number of
+            evicted entries.
+
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / (lookups or 1), 4),
+                "evictions": self._evictions
+            }
+
+    def cached(self, role: str, tg_id: Callable[[Any], int]):
+        """Decorate Interface method getting user language code, so that
+        database is queried only on cache miss. Must be placed above
+        the cursor decorator, so cache hits do not check out database
+        connection.
+
+        Args:
+            role: User role.
+            tg_id: Callable getting user Telegram ID from Interface
+                instance.
+
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(interface, *args, **kwargs):
+                user_id = tg_id(interface)
+                if scope_cache().get(("lang_changed", role, user_id)):
+                    return func(interface, *args, **kwargs)
+                if (lang := self.get(role, user_id)) is None:
+                    lang = func(interface, *args, **kwargs)
+                    self.set(role, user_id, lang)
+                return lang
+
+            return wrapper
+
+        return decorator
+
+
+lang_cache = LangCache(LANG_CACHE_SIZE, LANG_CACHE_TTL)
+metrics.register("lang_cache", lang_cache.stats)
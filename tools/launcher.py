@@ -0,0 +1,61 @@
+import sys
+import importlib.util
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import telebot as tb
+from environs import Env
+
+from tools import bot_runner, metrics
+from tools.bots_initialization import adm_bot, courier_bot, cus_bot, rest_bot
+from tools.logger_tool import logger
+
+env = Env()
+env.read_env()
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOT_APPS: Dict[str, Tuple[str, tb.TeleBot]] = {
+    "customer": ("customer_bot", cus_bot),
+    "restaurant": ("restaurant_bot", rest_bot),
+    "courier": ("courier_bot", courier_bot),
+    "admin": ("admin_bot", adm_bot),
+}
+BOTS = env.list("BOTS", default=list(BOT_APPS))
+
+
+def load_bot(name: str) -> tb.TeleBot:
+    """Import main module of the bot, registering its handlers.
+
+    Args:
+        name: Bot name, one of BOT_APPS.
+
+    Returns:
+        Bot with handlers registered.
+
+    Raises:
+        ValueError: If bot name is unknown.
+
+    """
+    if name not in BOT_APPS:
+        raise ValueError(f"Unknown bot: {name}. Available bots: {', '.join(BOT_APPS)}.")
+    app_dir, bot = BOT_APPS[name]
+    app_path = BASE_DIR / app_dir / "app"
+    sys.path.insert(0, str(app_path))
+    spec = importlib.util.spec_from_file_location(f"{name}_main", app_path / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return bot
+
+
+def main(names: List[str]) -> None:
+    if bot_runner.BOT_RUNTIME == "async":
+        logger.warning("BOT_RUNTIME=async applies to bots run on their own, running on threads.")
+    bots = {name: load_bot(name) for name in dict.fromkeys(names)}
+    logger.info(f"Bots {', '.join(bots)} are running.")
+    metrics.start_reporter()
+    bot_runner.run(bots)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or BOTS)
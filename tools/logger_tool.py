@@ -1,3 +1,4 @@
+import inspect
 import logging
 import functools
 
@@ -12,6 +13,18 @@ logger = logging.getLogger(__name__)
 
 
 def logger_decorator_msg(func):
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(message: types.Message):
+            logger.info(
+                f"Function {func.__name__} called by user "
+                f"{message.from_user.username} by message {message.text}."
+            )
+            result = await func(message)
+            logger.info(f"Function {func.__name__} executed successfully.")
+            return result
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(message: types.Message):
         logger.info(
@@ -38,6 +51,15 @@ def logger_decorator_callback(func):
 
 
 def logger_decorator(func):
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            logger.info(f"Function {func.__name__} called.")
+            result = await func(*args, **kwargs)
+            logger.info(f"Function {func.__name__} executed successfully.")
+            return result
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         logger.info(f"Function {func.__name__} called.")
@@ -0,0 +1,178 @@
+import threading
+import contextlib
+import contextvars
+import dataclasses
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+import telebot as tb
+import telebot.types as types
+from telebot.apihelper import ApiException
+
+from tools import metrics
+from tools.logger_tool import logger
+
+# Bot API limit of message IDs per deleteMessages call.
+MAX_BULK_DELETE = 100
+
+
+@dataclasses.dataclass(slots=True)
+class Effects:
+    deletions: Dict[int | str, Dict[int, None]] = dataclasses.field(default_factory=dict)
+    edits: Dict[Tuple[int | str, int], Dict[str, Any]] = dataclasses.field(default_factory=dict)
+
+
+class MessageEffects:
+    """Deletions and edits of bot messages made during one update,
+    applied together once the update is handled: deletions with one
+    bulk call per chat, repeated edits of one message with one call.
+    """
+
+    def __init__(self, bot: tb.TeleBot, name: str):
+        self.bot = bot
+        self._effects: contextvars.ContextVar[Effects | None] = contextvars.ContextVar(
+            f"{name}_message_effects",
+            default=None
+        )
+        self._lock = threading.Lock()
+        self._requested = 0
+        self._calls = 0
+        self._failures = 0
+        metrics.register(f"{name}_message_effects", self.stats)
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[None]:
+        """Open scope collecting message deletions and edits. Nested
+        scopes join the outermost one, which applies them on exit, also
+        if the scope failed, as they would have been applied right away
+        otherwise. Can be used as a decorator as well, e.g. on update
+        handlers.
+        """
+        if self._effects.get() is not None:
+            yield None
+            return None
+        token = self._effects.set(Effects())
+        try:
+            yield None
+        finally:
+            effects = self._effects.get()
+            self._effects.reset(token)
+            self._apply(effects)
+
+    def delete(self, chat_id: int | str, message_id: int) -> None:
+        """Delete message, at the end of the current scope if there is
+        one. Messages that are already gone are skipped.
+
+        Args:
+            chat_id: Telegram chat ID.
+            message_id: ID of the message to delete.
+
+        """
+        self._count_requested()
+        if (effects := self._effects.get()) is None:
+            return self._call(chat_id, self.bot.delete_messages, chat_id, [message_id])
+        effects.deletions.setdefault(chat_id, {})[message_id] = None
+        effects.edits.pop((chat_id, message_id), None)
+
+    def edit_text(
+            self,
+            text: str,
+            chat_id: int | str,
+            message_id: int,
+            reply_markup: types.InlineKeyboardMarkup | None = None
+    ) -> None:
+        """Replace text and inline keyboard of message, at the end of the
+        current scope if there is one.
+
+        Args:
+            text: New text of the message.
+            chat_id: Telegram chat ID.
+            message_id: ID of the message to edit.
+            reply_markup: New inline keyboard, None to remove it.
+
+        """
+        self._edit(chat_id, message_id, text=text, reply_markup=reply_markup)
+
+    def edit_reply_markup(
+            self,
+            chat_id: int | str,
+            message_id: int,
+            reply_markup: types.InlineKeyboardMarkup | None = None
+    ) -> None:
+        """Replace inline keyboard of message, at the end of the current
+        scope if there is one.
+
+        Args:
+            chat_id: Telegram chat ID.
+            message_id: ID of the message to edit.
+            reply_markup: New inline keyboard, None to remove it.
+
+        """
+        self._edit(chat_id, message_id, reply_markup=reply_markup)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get usage metrics.
+
+        Returns:
+            Numbers of requested deletions and edits, of API calls made
+            for them and of failed calls.
+
+        """
+        with self._lock:
+            return {
+                "requested": self._requested,
+                "calls": self._calls,
+                "failures": self._failures
+            }
+
+    def _edit(self, chat_id: int | str, message_id: int, **changes) -> None:
+        self._count_requested()
+        if (effects := self._effects.get()) is None:
+            return self._apply_edit(chat_id, message_id, changes)
+        if message_id not in effects.deletions.get(chat_id, {}):
+            effects.edits.setdefault((chat_id, message_id), {}).update(changes)
+
+    def _apply(self, effects: Effects) -> None:
+        for (chat_id, message_id), changes in effects.edits.items():
+            self._apply_edit(chat_id, message_id, changes)
+        for chat_id, message_ids in effects.deletions.items():
+            message_ids = list(message_ids)
+            for start in range(0, len(message_ids), MAX_BULK_DELETE):
+                self._call(
+                    chat_id,
+                    self.bot.delete_messages,
+                    chat_id,
+                    message_ids[start:start + MAX_BULK_DELETE]
+                )
+
+    def _apply_edit(self, chat_id: int | str, message_id: int, changes: Dict[str, Any]) -> None:
+        if "text" in changes:
+            self._call(
+                chat_id,
+                self.bot.edit_message_text,
+                changes["text"],
+                chat_id,
+                message_id,
+                reply_markup=changes.get("reply_markup")
+            )
+        else:
+            self._call(
+                chat_id,
+                self.bot.edit_message_reply_markup,
+                chat_id,
+                message_id,
+                reply_markup=changes.get("reply_markup")
+            )
+
+    def _call(self, chat_id: int | str, method: Callable[..., Any], *args, **kwargs) -> None:
+        with self._lock:
+            self._calls += 1
+        try:
+            method(*args, **kwargs)
+        except ApiException as error:
+            with self._lock:
+                self._failures += 1
+            logger.warning(f"Failed to {method.__name__} in chat {chat_id}: {error}")
+
+    def _count_requested(self) -> None:
+        with self._lock:
+            self._requested += 1
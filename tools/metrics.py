@@ -0,0 +1,103 @@
+import json
+import time
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+from environs import Env
+
+from tools.logger_tool import logger
+
+env = Env()
+env.read_env()
+
+METRICS_LOG_INTERVAL = env.float("METRICS_LOG_INTERVAL", default=60.0)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+_reporter_started = threading.Event()
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Count value in the first bucket it fits in.
+
+        Args:
+            value: Observed value, e.g. duration in seconds.
+
+        """
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), -1)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get histogram values.
+
+        Returns:
+            Number, average and maximum of observed values and counts
+            of values per bucket upper bound, "inf" for values above
+            all bounds.
+
+        """
+        with self._lock:
+            count = sum(self._counts)
+            return {
+                "count": count,
+                "avg": round(self._sum / max(count, 1), 4),
+                "max": round(self._max, 4),
+                "buckets": {
+                    str(bound): bucket_count
+                    for bound, bucket_count in zip((*self.buckets, "inf"), self._counts)
+                    if bucket_count
+                }
+            }
+
+
+def register(name: str, source: Callable[[], Dict[str, Any]]) -> None:
+    """Register metrics source under given name.
+
+    Args:
+        name: Name of the metrics group.
+        source: Callable returning current values of the group.
+
+    """
+    _sources[name] = source
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Collect current values from all registered metrics sources.
+
+    Returns:
+        Mapping of metrics group names to their current values.
+
+    """
+    return {name: source() for name, source in list(_sources.items())}
+
+
+def start_reporter(interval: float = METRICS_LOG_INTERVAL) -> None:
+    """Start background thread writing metrics snapshot into the log
+    every given number of seconds. Does nothing if interval is not
+    positive or reporter is already running.
+
+    Args:
+        interval: Reporting interval in seconds.
+
+    """
+    if interval <= 0 or _reporter_started.is_set():
+        return None
+    _reporter_started.set()
+
+    def report() -> None:
+        while True:
+            time.sleep(interval)
+            logger.info(f"Metrics: {json.dumps(snapshot(), default=str)}")
+
+    threading.Thread(target=report, name="metrics-reporter", daemon=True).start()
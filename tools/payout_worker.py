@@ -0,0 +1,165 @@
+import time
+import random
+import threading
+from typing import Any, Dict, Tuple
+
+import psycopg2
+import requests
+from environs import Env
+from psycopg2.extensions import cursor
+
+import tools.pp_tools as paypal
+from tools import metrics
+from tools.cursor_tool import cursor as cursor_decorator
+from tools.logger_tool import logger
+
+env = Env()
+env.read_env()
+
+PAYOUT_WORKER_INTERVAL = env.float("PAYOUT_WORKER_INTERVAL", default=5.0)
+PAYOUT_MAX_ATTEMPTS = env.int("PAYOUT_MAX_ATTEMPTS", default=8)
+# Seconds a claimed job is hidden from other workers, so a job of a
+# worker that died is picked up again.
+PAYOUT_LEASE = 300.0
+RETRY_BASE_DELAY = 30.0
+RETRY_MAX_DELAY = 3600.0
+
+
+@cursor_decorator
+def enqueue_rest_payout(order_uuid: str, curs: cursor) -> None:
+    """Add payout of the order to the Restaurant to the payout queue.
+    Queueing the same order again has no effect.
+
+    Args:
+        order_uuid: Order UUID.
+        curs: Cursor object from psycopg2 module.
+
+    """
+    curs.execute(
+        "INSERT INTO payout_jobs (order_uuid) VALUES (%s) ON CONFLICT (order_uuid) DO NOTHING",
+        (order_uuid,)
+    )
+
+
+class PayoutWorker:
+    """Background worker making queued Restaurant payouts. Any number of
+    workers in any processes may run at once, each job is claimed by one
+    of them.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._started = False
+        self._lock = threading.Lock()
+        self._done = 0
+        self._retries = 0
+        self._failed = 0
+
+    def start(self) -> None:
+        """Start background thread running due payouts every interval."""
+        with self._lock:
+            if self._started:
+                return None
+            self._started = True
+        metrics.register("payout_worker", self.stats)
+        threading.Thread(target=self._loop, name="payout-worker", daemon=True).start()
+
+    def run_pending(self) -> int:
+        """Make all payouts that are due now, one by one.
+
+        Returns:
+            Number of payouts attempted.
+
+        """
+        attempted = 0
+        while job := self._claim():
+            self._execute(*job)
+            attempted += 1
+        return attempted
+
+    def stats(self) -> Dict[str, Any]:
+        """Get worker metrics.
+
+        Returns:
+            Counters of payouts done, retried and failed for good.
+
+        """
+        with self._lock:
+            return {"done": self._done, "retries": self._retries, "failed": self._failed}
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.run_pending()
+            except (psycopg2.Error, OSError) as error:
+                logger.error(f"Payout worker failed: {error}")
+            time.sleep(self.interval)
+
+    @staticmethod
+    @cursor_decorator
+    def _claim(curs: cursor) -> Tuple[str, int] | None:
+        curs.execute(
+            "UPDATE payout_jobs SET attempts = attempts + 1, "
+            "run_after = now() + make_interval(secs => %s) "
+            "WHERE order_uuid = ("
+            "SELECT order_uuid FROM payout_jobs "
+            "WHERE job_status = 'pending' AND run_after <= now() "
+            "ORDER BY run_after LIMIT 1 FOR UPDATE SKIP LOCKED"
+            ") RETURNING order_uuid, attempts",
+            (PAYOUT_LEASE,)
+        )
+        return curs.fetchone()
+
+    def _execute(self, order_uuid: str, attempts: int) -> None:
+        try:
+            response = paypal.pp_rest_payout(str(order_uuid))
+            if response.status_code == 201:
+                batch_id = response.json()["batch_header"]["payout_batch_id"]
+                logger.info(f"Payout of order {order_uuid} made, payout batch ID: {batch_id}.")
+                return self._finish(order_uuid, "done", batch_id, "")
+        except (requests.RequestException, LookupError, TypeError, ValueError) as error:
+            return self._retry(order_uuid, attempts, f"{type(error).__name__}: {error}")
+        if paypal.pp_is_duplicate_batch(response):
+            logger.info(f"Payout of order {order_uuid} was already made.")
+            return self._finish(order_uuid, "done", "", response.text)
+        self._retry(order_uuid, attempts, response.text)
+
+    def _retry(self, order_uuid: str, attempts: int, error: str) -> None:
+        if attempts >= PAYOUT_MAX_ATTEMPTS:
+            logger.error(f"Payout of order {order_uuid} failed {attempts} times: {error}")
+            return self._finish(order_uuid, "failed", "", error)
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+        delay = round(delay * random.uniform(0.5, 1), 2)
+        logger.warning(f"Payout of order {order_uuid} failed, retrying in {delay} s: {error}")
+        with self._lock:
+            self._retries += 1
+        self._reschedule(order_uuid, delay, error)
+
+    def _finish(self, order_uuid: str, status: str, batch_id: str, error: str) -> None:
+        with self._lock:
+            if status == "done":
+                self._done += 1
+            else:
+                self._failed += 1
+        self._set_result(order_uuid, status, batch_id, error)
+
+    @staticmethod
+    @cursor_decorator
+    def _reschedule(order_uuid: str, delay: float, error: str, curs: cursor) -> None:
+        curs.execute(
+            "UPDATE payout_jobs SET run_after = now() + make_interval(secs => %s), "
+            "last_error = %s WHERE order_uuid = %s",
+            (delay, error, order_uuid)
+        )
+
+    @staticmethod
+    @cursor_decorator
+    def _set_result(order_uuid: str, status: str, batch_id: str, error: str, curs: cursor) -> None:
+        curs.execute(
+            "UPDATE payout_jobs SET job_status = %s, payout_batch_id = %s, last_error = %s "
+            "WHERE order_uuid = %s",
+            (status, batch_id, error, order_uuid)
+        )
+
+
+payout_worker = PayoutWorker(PAYOUT_WORKER_INTERVAL)
@@ -0,0 +1,134 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Callable, Dict, Mapping
+
+import requests
+from environs import Env
+
+import tools.pp_tools as paypal
+from tools import bot_runner, metrics
+from tools.logger_tool import logger
+
+env = Env()
+env.read_env()
+
+PP_WEBHOOK_PATH = env.str("PP_WEBHOOK_PATH", default="/paypal")
+PP_WEBHOOK_WORKERS = env.int("PP_WEBHOOK_WORKERS", default=2)
+
+
+class PayPalWebhook:
+    """Receive PayPal webhook events, verify their signatures and pass
+    them to the handlers of their event types. Verified events are
+    answered right away and handled in background, so PayPal does not
+    wait for them. Handlers must be safe to run more than once for one
+    event, as PayPal repeats deliveries that were not answered in time.
+    """
+
+    def __init__(self, workers: int = PP_WEBHOOK_WORKERS):
+        self.workers = workers
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._received = 0
+        self._rejected = 0
+        self._failed = 0
+
+    def on(self, event_type: str):
+        """Register handler of webhook events of the type.
+
+        Args:
+            event_type: PayPal event type, e.g. "CHECKOUT.ORDER.APPROVED".
+
+        """
+        def decorator(func):
+            self._handlers[event_type] = func
+            return func
+
+        return decorator
+
+    def handle(self, headers: Mapping[str, str], body: bytes) -> HTTPStatus:
+        """Handle webhook request. Events that could not be verified are
+        answered with an error, so PayPal delivers them again later.
+        Verified ones are handed over to their handlers in background.
+
+        Args:
+            headers: HTTP headers of the request.
+            body: Body of the request.
+
+        Returns:
+            Response status for PayPal.
+
+        """
+        with self._lock:
+            self._received += 1
+        try:
+            event = json.loads(body)
+            handler = self._handlers.get(event["event_type"])
+        except (ValueError, KeyError, TypeError) as error:
+            return self._reject(f"Failed to parse PayPal webhook event: {error}")
+        try:
+            if not paypal.pp_verify_webhook_event(headers, event):
+                return self._reject(f"Rejected PayPal webhook event {event.get('id')}.")
+        except (requests.RequestException, LookupError, TypeError, ValueError) as error:
+            with self._lock:
+                self._failed += 1
+            logger.error(f"Failed to verify PayPal webhook event {event.get('id')}: {error}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR
+        if handler is not None:
+            self._get_executor().submit(self._run, handler, event)
+        return HTTPStatus.OK
+
+    def install(self) -> None:
+        """Serve webhook events on PP_WEBHOOK_PATH of the bot HTTP
+        server. Nothing is served unless PP_WEBHOOK_ID is set, as events
+        could not be verified.
+        """
+        if not paypal.PP_WEBHOOK_ID:
+            logger.info("PP_WEBHOOK_ID is not set, PayPal webhook is off.")
+            return None
+        bot_runner.add_route(PP_WEBHOOK_PATH, self.handle)
+        metrics.register("paypal_webhook", self.stats)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get usage metrics.
+
+        Returns:
+            Counters of received, rejected and failed events.
+
+        """
+        with self._lock:
+            return {
+                "received": self._received,
+                "rejected": self._rejected,
+                "failed": self._failed
+            }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.workers,
+                    thread_name_prefix="paypal-webhook"
+                )
+            return self._executor
+
+    def _run(self, handler: Callable[[Dict[str, Any]], None], event: Dict[str, Any]) -> None:
+        # The event is answered already, so a failed handling is only
+        # logged: the "paid" button settles the payment then.
+        try:
+            handler(event)
+        except Exception as error:
+            with self._lock:
+                self._failed += 1
+            logger.error(
+                f"Failed to handle PayPal webhook event {event.get('id')}: "
+                f"{type(error).__name__}: {error}"
+            )
+
+    def _reject(self, reason: str) -> HTTPStatus:
+        with self._lock:
+            self._rejected += 1
+        logger.warning(reason)
+        return HTTPStatus.BAD_REQUEST
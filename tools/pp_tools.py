@@ -1,14 +1,20 @@
 import json
-from time import sleep
-from typing import Dict, Tuple, Any
+import time
+import uuid
+import random
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Mapping, Tuple, Any
 
 
 import requests
 from environs import Env
 from psycopg2.extensions import cursor
+from requests.adapters import HTTPAdapter
 
+from tools import metrics
 from tools.logger_tool import logger, logger_decorator
-from tools.cursor_tool import cursor as cursor_decorator
+from tools.cursor_tool import cursor as cursor_decorator, unit_of_work
 
 env = Env()
 env.read_env()
@@ -18,33 +24,339 @@ pp_username = env.str("PP_USERNAME")
 pp_password = env.str("PP_PASSWORD")
 brand_name = env.str("BRAND_NAME", default="Shop")
 return_link = env.str("RETURN_LINK", default="https://google.com/")
+PP_POOL_SIZE = env.int("PP_POOL_SIZE", default=10)
+PP_CONNECT_TIMEOUT = env.float("PP_CONNECT_TIMEOUT", default=5.0)
+PP_READ_TIMEOUT = env.float("PP_READ_TIMEOUT", default=30.0)
+PP_WEBHOOK_ID = env.str("PP_WEBHOOK_ID", default="")
+PP_MAX_RETRIES = env.int("PP_MAX_RETRIES", default=3)
+PP_RESULT_CACHE_SIZE = env.int("PP_RESULT_CACHE_SIZE", default=1000)
+PAYOUT_POLL_INTERVAL = env.float("PAYOUT_POLL_INTERVAL", default=10.0)
+PAYOUT_POLL_TIMEOUT = env.float("PAYOUT_POLL_TIMEOUT", default=3600.0)
+# Token is renewed this many seconds before PayPal expires it.
+TOKEN_EXPIRY_MARGIN = 60.0
+# Retried statuses; a longer wait asked for by PayPal is not waited out.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+RESULT_CACHE_TTL = 3600.0
+# Seconds a payroll run being sent is left to the process sending it,
+# before the payroll worker of the Admin bot takes it over.
+PAYROLL_RUN_LEASE = 300.0
+# PayPal limits of items per payout batch and per page of batch details.
+PAYOUT_MAX_ITEMS = 15000
+PAYOUT_PAGE_SIZE = 1000
+PAYOUT_BATCH_FAILED_STATUSES = ("DENIED", "CANCELED")
+PAYOUT_ITEM_FAILED_STATUSES = ("FAILED", "RETURNED", "BLOCKED", "REFUNDED", "REVERSED")
+WEBHOOK_SIGNATURE_HEADERS = {
+    "auth_algo": "PAYPAL-AUTH-ALGO",
+    "cert_url": "PAYPAL-CERT-URL",
+    "transmission_id": "PAYPAL-TRANSMISSION-ID",
+    "transmission_sig": "PAYPAL-TRANSMISSION-SIG",
+    "transmission_time": "PAYPAL-TRANSMISSION-TIME"
+}
+# Payroll queries, shared with tools.async_pp_tools. Balances are only
+# deducted if still there: a payout started meanwhile by another Admin
+# holds the row locks until it commits, and the balances are checked
+# again once they are released, so each amount is paid once.
+DEDUCT_BALANCES_QUERY = (
+    "UPDATE couriers SET account_balance = couriers.account_balance - paid.amount "
+    "FROM unnest(%s::BIGINT[], %s::NUMERIC[]) AS paid(courier_id, amount) "
+    "WHERE couriers.courier_id = paid.courier_id "
+    "AND couriers.account_balance >= paid.amount "
+    "RETURNING couriers.courier_id"
+)
+RESTORE_BALANCES_QUERY = (
+    "UPDATE couriers SET account_balance = couriers.account_balance + failed.amount "
+    "FROM unnest(%s::BIGINT[], %s::NUMERIC[]) AS failed(courier_id, amount) "
+    "WHERE couriers.courier_id = failed.courier_id"
+)
+START_PAYROLL_RUN_QUERY = (
+    "INSERT INTO payroll_runs (sender_batch_id, admin_id, courier_ids, amounts, run_after) "
+    "VALUES (%s, %s, %s, %s, now() + make_interval(secs => %s))"
+)
+FINISH_PAYROLL_RUN_QUERY = (
+    "UPDATE payroll_runs SET run_status = %s, payout_batch_id = %s, "
+    "run_after = now() + make_interval(secs => %s) WHERE sender_batch_id = %s"
+)
 
 
+class PayPalApi:
+    """Part of PayPal REST API client not depending on how requests are
+    made: token cache, request headers, retry decisions, replay of
+    results and metrics. Requests are made by PayPalClient on threads
+    and by tools.async_pp_tools.AsyncPayPalClient on the event loop.
+    """
+
+    def __init__(self, mode: str, client_id: str, secret: str):
+        if mode == "deployment":
+            self.base_url = "https://api-m.paypal.com"
+        else:
+            self.base_url = "https://api-m.sandbox.paypal.com"
+        self.client_id = client_id
+        self.secret = secret
+        self._token: str | None = None
+        self._token_expires = 0.0
+        self._stats_lock = threading.Lock()
+        self._results: OrderedDict[str, Tuple[Any, float]] = OrderedDict()
+        self._counters = dict.fromkeys(
+            ("requests", "token_requests", "errors", "retries", "replays"),
+            0
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Get client usage metrics.
+
+        Returns:
+            Counters of API requests, token requests, failed requests,
+            retries and replayed results.
+
+        """
+        with self._stats_lock:
+            return dict(self._counters)
+
+    def _count(self, counter: str) -> None:
+        with self._stats_lock:
+            self._counters[counter] += 1
+
+    def _cached_token(self, stale_token: str | None) -> str | None:
+        if self._token and self._token != stale_token and time.monotonic() < self._token_expires:
+            return self._token
+        return None
+
+    def _store_token(self, token_info: Dict[str, Any]) -> str:
+        self._token = token_info["access_token"]
+        self._token_expires = time.monotonic() + token_info["expires_in"] - TOKEN_EXPIRY_MARGIN
+        return self._token
+
+    @staticmethod
+    def _attempts(method: str, request_id: str | None) -> int:
+        # POST without request ID could be applied twice, so it is sent once.
+        return 1 + PP_MAX_RETRIES if method == "GET" or request_id else 1
+
+    @staticmethod
+    def _headers(token: str, request_id: str | None) -> Dict[str, str]:
+        headers = {"Authorization": f"Bearer {token}"}
+        if request_id:
+            headers["PayPal-Request-Id"] = request_id
+        return headers
+
+    def _retry_delay(self, response: Any, attempt: int, attempts: int) -> float | None:
+        # None when the response is final, or PayPal asks to wait for
+        # longer than is worth blocking the caller for.
+        if response.status_code not in RETRY_STATUSES or attempt == attempts:
+            return None
+        try:
+            delay = float(response.headers.get("Retry-After") or 0)
+        except ValueError:
+            delay = 0.0
+        if delay > RETRY_MAX_DELAY:
+            return None
+        return delay or self._backoff(attempt)
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        return round(delay * random.uniform(0.5, 1), 2)
+
+    def _replay(self, request_id: str) -> Any:
+        with self._stats_lock:
+            if (result := self._results.get(request_id)) and result[1] > time.monotonic():
+                self._results.move_to_end(request_id)
+                self._counters["replays"] += 1
+                logger.info(f"Replayed result of PayPal request {request_id}.")
+                return result[0]
+            self._results.pop(request_id, None)
+            return None
+
+    def _remember(self, request_id: str, response: Any) -> None:
+        if PP_RESULT_CACHE_SIZE <= 0:
+            return None
+        with self._stats_lock:
+            self._results[request_id] = (response, time.monotonic() + RESULT_CACHE_TTL)
+            self._results.move_to_end(request_id)
+            while len(self._results) > PP_RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+
+
+class PayPalClient(PayPalApi):
+    def __init__(self, mode: str, client_id: str, secret: str):
+        super().__init__(mode, client_id, secret)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=PP_POOL_SIZE))
+        self._token_lock = threading.Lock()
+
+    def get_token(self, refresh: bool = False) -> str:
+        """Get OAuth2 access token, requesting new one from PayPal only
+        if cached one is about to expire. Concurrent callers wait for
+        the one request in progress instead of making their own.
+
+        Args:
+            refresh: Request new token even if cached one is valid.
+
+        Returns:
+            Access token.
+
+        Raises:
+            requests.RequestException: If token request failed.
+
+        """
+        stale_token = self._token if refresh else None
+        with self._token_lock:
+            if token := self._cached_token(stale_token):
+                return token
+            self._count("token_requests")
+            response = self.session.post(
+                f"{self.base_url}/v1/oauth2/token",
+                data={"grant_type": "client_credentials"},
+                auth=(self.client_id, self.secret),
+                timeout=(PP_CONNECT_TIMEOUT, PP_READ_TIMEOUT)
+            )
+            response.raise_for_status()
+            return self._store_token(response.json())
+
+    def post(
+            self,
+            path: str,
+            data: Dict[str, Any],
+            request_id: str | None = None
+    ) -> requests.Response:
+        """Make authorized POST request to PayPal REST API. Request is
+        repeated once with new token if PayPal rejects the cached one.
+        Request with request ID is safe to repeat, so it is retried on
+        network errors, rate limits and server errors, and its success
+        is kept to be replayed instead of sending the request again.
+
+        Args:
+            path: API path, e.g. "/v2/checkout/orders".
+            data: JSON body of the request.
+            request_id: PayPal-Request-Id, the same for every attempt of
+                one operation, e.g. derived from order UUID.
+
+        Returns:
+            Response of PayPal.
+
+        Raises:
+            requests.RequestException: If request could not be made.
+
+        """
+        return self._request("POST", path, request_id, json=data)
+
+    def get(self, path: str, params: Dict[str, Any] | None = None) -> requests.Response:
+        """Make authorized GET request to PayPal REST API. Request is
+        repeated once with new token if PayPal rejects the cached one,
+        and retried on network errors, rate limits and server errors.
+
+        Args:
+            path: API path, e.g. "/v1/payments/payouts/<batch ID>".
+            params: Query parameters.
+
+        Returns:
+            Response of PayPal.
+
+        Raises:
+            requests.RequestException: If request could not be made.
+
+        """
+        return self._request("GET", path, None, params=params)
+
+    def _request(
+            self,
+            method: str,
+            path: str,
+            request_id: str | None,
+            **kwargs
+    ) -> requests.Response:
+        if request_id and (response := self._replay(request_id)):
+            return response
+        attempts = self._attempts(method, request_id)
+        for attempt in range(1, attempts + 1):
+            self._count("requests")
+            try:
+                response = self._send(method, path, self.get_token(), request_id, **kwargs)
+                if response.status_code == 401:
+                    response = self._send(
+                        method,
+                        path,
+                        self.get_token(refresh=True),
+                        request_id,
+                        **kwargs
+                    )
+            except requests.RequestException as error:
+                self._count("errors")
+                if attempt == attempts:
+                    raise
+                reason, delay = str(error), self._backoff(attempt)
+            else:
+                if (delay := self._retry_delay(response, attempt, attempts)) is None:
+                    break
+                reason = f"status {response.status_code}"
+            self._count("retries")
+            logger.warning(f"PayPal {method} {path} failed ({reason}), retrying in {delay} s.")
+            time.sleep(delay)
+        if request_id and response.ok:
+            self._remember(request_id, response)
+        return response
+
+    def _send(
+            self,
+            method: str,
+            path: str,
+            token: str,
+            request_id: str | None,
+            **kwargs
+    ) -> requests.Response:
+        return self.session.request(
+            method,
+            f"{self.base_url}{path}",
+            headers=self._headers(token, request_id),
+            timeout=(PP_CONNECT_TIMEOUT, PP_READ_TIMEOUT),
+            **kwargs
+        )
+
+
+paypal_client = PayPalClient(pp_mode, pp_username, pp_password)
+metrics.register("paypal", paypal_client.stats)
+
+
+# PayPal is called outside of any transaction, so a slow or retried call
+# does not hold a pooled connection or row locks. Data it needs is read
+# beforehand in a transaction of its own.
 @cursor_decorator
+def _get_order_column(order_uuid: str, column: str, curs: cursor) -> Any:
+    curs.execute("SELECT " + column + " FROM orders WHERE order_uuid = %s", (order_uuid,))
+    return curs.fetchone()[0]
+
+
+@cursor_decorator
+def _get_rest_payout(order_uuid: str, curs: cursor) -> Tuple[str, Any]:
+    curs.execute(
+        "SELECT restaurants.paypal_id, orders.dishes_subtotal FROM orders "
+        "JOIN restaurants ON restaurants.restaurant_uuid = orders.restaurant_uuid "
+        "WHERE orders.order_uuid = %s",
+        (order_uuid,)
+    )
+    return curs.fetchone()
+
+
 @logger_decorator
-def pp_order_creation(order_uuid: str, curs: cursor) -> Dict[str, str]:
+def pp_order_creation(order_uuid: str) -> Dict[str, str]:
     """Create PayPal order.
 
     Args:
         order_uuid: Order UUID.
-        curs: Cursor object from psycopg2.
 
     Returns:
         PayPal payment link and PayPal order id.
 
     """
-    if pp_mode == "deployment":
-        url = "https://api-m.paypal.com/v2/checkout/orders"
-    else:
-        url = "https://api-m.sandbox.paypal.com/v2/checkout/orders"
-    curs.execute("SELECT total FROM orders WHERE order_uuid = %s", (order_uuid,))
+    total = _get_order_column(order_uuid, "total")
     data = {
         "intent": "CAPTURE",
         "purchase_units": [
             {
                 "amount": {
                     "currency_code": "EUR",
-                    "value": str(curs.fetchone()[0])
+                    "value": str(total)
                 }
             }
         ],
@@ -62,7 +374,7 @@ def pp_order_creation(order_uuid: str, curs: cursor) -> Dict[str, str]:
             }
         }
     }
-    response = requests.post(url, json=data, auth=(pp_username, pp_password))
+    response = paypal_client.post("/v2/checkout/orders", data, f"order-create-{order_uuid}")
     if (response.status_code == 200
             and json.loads(response.text)["status"] == "PAYER_ACTION_REQUIRED"):
         logger.info(f"PayPal order created. Order ID: {json.loads(response.text)["id"]}")
@@ -75,90 +387,238 @@ def pp_order_creation(order_uuid: str, curs: cursor) -> Dict[str, str]:
         return {}
 
 
-@cursor_decorator
 @logger_decorator
-def pp_capture_order(order_uuid: str, curs: cursor) -> bool:
+def pp_capture_order(order_uuid: str) -> bool:
     """Capture PayPal order.
 
     Args:
         order_uuid: Order UUID.
-        curs: Cursor object from psycopg2.
 
     Returns:
-        True if response status code is 201, False otherwise.
+        True if payment has been captured now or before, False
+        otherwise.
 
     """
-    curs.execute("SELECT paypal_order_id FROM orders WHERE order_uuid = %s", (order_uuid,))
-    if pp_mode == "deployment":
-        url = f"https://api-m.paypal.com/v2/checkout/orders/{curs.fetchone()[0]}/capture"
-    else:
-        url = f"https://api-m.sandbox.paypal.com/v2/checkout/orders/{curs.fetchone()[0]}/capture"
-    data = {}
-    response = requests.post(url, json=data, auth=(pp_username, pp_password))
-    return response.status_code == 201
+    paypal_order_id = _get_order_column(order_uuid, "paypal_order_id")
+    response = paypal_client.post(
+        f"/v2/checkout/orders/{paypal_order_id}/capture",
+        {},
+        f"order-capture-{order_uuid}"
+    )
+    if response.status_code == 422 and "ORDER_ALREADY_CAPTURED" in response.text:
+        logger.info(f"PayPal order of order {order_uuid} was already captured.")
+        return True
+    # A repeated request ID is answered with the original result and 200.
+    if response.status_code not in (200, 201):
+        return False
+    try:
+        return response.json().get("status") == "COMPLETED"
+    except ValueError:
+        logger.error(f"Failed to parse capture of order {order_uuid}: {response.text}")
+        return False
+
+
+@logger_decorator
+def pp_verify_webhook_event(headers: Mapping[str, str], event: Dict[str, Any]) -> bool:
+    """Check with PayPal that webhook event was sent by PayPal to the
+    webhook set in PP_WEBHOOK_ID.
+
+    Args:
+        headers: HTTP headers of the webhook request.
+        event: Webhook event.
+
+    Returns:
+        True if signature of the event is valid, False otherwise.
+
+    Raises:
+        requests.RequestException: If PayPal could not be reached.
+
+    """
+    data = {key: headers.get(name) for key, name in WEBHOOK_SIGNATURE_HEADERS.items()}
+    if not PP_WEBHOOK_ID or not all(data.values()):
+        return False
+    data.update(webhook_id=PP_WEBHOOK_ID, webhook_event=event)
+    response = paypal_client.post("/v1/notifications/verify-webhook-signature", data)
+    response.raise_for_status()
+    return response.json().get("verification_status") == "SUCCESS"
 
 
-@cursor_decorator
 @logger_decorator
-def pp_rest_payout(order_uuid: str, curs: cursor) -> int:
-    """Commit PayPal payout to the Restaurant.
+def pp_rest_payout(order_uuid: str) -> requests.Response:
+    """Commit PayPal payout to the Restaurant. The payout batch is
+    identified by the order, so PayPal refuses to pay an order twice.
 
     Args:
         order_uuid: Order UUID.
-        curs: Cursor object from psycopg2.
 
     Returns:
-        Response status code.
+        Response of PayPal.
+
+    Raises:
+        requests.RequestException: If PayPal could not be reached.
 
     """
-    curs.execute(
-        "SELECT restaurant_uuid, dishes_subtotal FROM orders WHERE order_uuid = %s", (order_uuid,)
-    )
-    payment_info = curs.fetchone()
-    curs.execute(
-        "SELECT paypal_id FROM restaurants WHERE restaurant_uuid = %s", (payment_info[0],)
-    )
-    if pp_mode == "deployment":
-        url = f"https://api-m.paypal.com/v1/payments/payouts"
-    else:
-        url = f"https://api-m.sandbox.paypal.com/v1/payments/payouts"
+    receiver, amount = _get_rest_payout(order_uuid)
     data = {
         "items": [
             {
-                "receiver": curs.fetchone()[0],
+                "receiver": receiver,
                 "amount": {
                     "currency": "EUR",
-                    "value": str(payment_info[1])
+                    "value": str(amount)
                 },
+                "sender_item_id": order_uuid,
                 "purpose": "GOODS"
             }
         ],
         "sender_batch_header": {
+            "sender_batch_id": f"order-{order_uuid}",
             "recipient_type": "PAYPAL_ID"
         }
     }
-    response = requests.post(url, json=data, auth=(pp_username, pp_password))
-    return response.status_code
+    return paypal_client.post("/v1/payments/payouts", data, f"order-payout-{order_uuid}")
+
+
+def pp_couriers_payout(
+        couriers: List[Tuple[Any, ...]],
+        admin_id: int
+) -> Tuple[
+    Dict[str, List[Tuple[Any, ...]]],
+    List[Tuple[Any, ...]],
+    Dict[str, List[Tuple[Any, ...]]]
+]:
+    """Pay Couriers their balances with as few PayPal payout batches as
+    possible. A rejected batch of several Couriers is sent again as
+    batches of one Courier each, so one invalid item does not hold back
+    payments of the others. Results of the batches are followed by the
+    payroll worker of the Admin bot.
+
+    Args:
+        couriers: Arrays containing info about couriers and payment.
+        admin_id: Telegram ID of the Admin paying the Couriers.
+
+    Returns:
+        Couriers by IDs of the payout batches accepted by PayPal,
+        Couriers not paid, and Couriers by sender batch IDs of the
+        batches PayPal may or may not have accepted.
+
+    """
+    batches = {}
+    unknown = {}
+    chunks, rejected = pp_payout_chunks(couriers)
+    while chunks:
+        status, batch_id, chunk = pp_couriers_payout_batch(chunks.pop(), admin_id)
+        if status == "sent":
+            batches[batch_id] = chunk
+        elif status == "unknown":
+            unknown[batch_id] = chunk
+        elif len(chunk) > 1:
+            chunks.extend([courier] for courier in chunk)
+        else:
+            rejected.extend(chunk)
+    return batches, rejected, unknown
 
 
-@cursor_decorator
 @logger_decorator
-def pp_courier_payout(courier: Tuple[Any,...], curs: cursor) -> int:
-    """Commit PayPal payment to the Courier.
+def pp_couriers_payout_batch(
+        couriers: List[Tuple[Any, ...]],
+        admin_id: int
+) -> Tuple[str, str | None, List[Tuple[Any, ...]]]:
+    """Send one PayPal payout batch to the Couriers. Before the batch is
+    sent, paid amounts are deducted from balances of the Couriers and
+    the batch is recorded as payroll run, in one transaction, so an
+    interrupted payout leaves nothing to be paid again. Couriers whose
+    balances were paid out meanwhile are left out of the batch. Amounts
+    are given back only if PayPal surely refused the batch.
 
     Args:
-        courier: Array containing info about courier and payment.
-        curs: Cursor object from psycopg2.
+        couriers: Arrays containing info about couriers and payment.
+        admin_id: Telegram ID of the Admin paying the Couriers.
 
     Returns:
-        Response status code.
+        "sent" and PayPal payout batch ID if PayPal accepted the batch,
+        "rejected" and None if it refused it, "unknown" and sender batch
+        ID if it is not known whether PayPal accepted it, "skipped" and
+        None if there was nothing left to pay; Couriers of the batch.
 
     """
-    if pp_mode == "deployment":
-        url = f"https://api-m.paypal.com/v1/payments/payouts"
-    else:
-        url = f"https://api-m.sandbox.paypal.com/v1/payments/payouts"
-    data = {
+    sender_batch_id, couriers = _start_payroll_run(couriers, admin_id)
+    if not couriers:
+        return "skipped", None, couriers
+    data = pp_couriers_payout_data(couriers, sender_batch_id)
+    try:
+        response = paypal_client.post("/v1/payments/payouts", data, sender_batch_id)
+    except requests.RequestException as error:
+        logger.error(
+            f"Payout batch {sender_batch_id} may or may not have been accepted, check it in "
+            f"PayPal: {error}"
+        )
+        _finish_payroll_run(sender_batch_id, "unknown", "")
+        return "unknown", sender_batch_id, couriers
+    status = pp_payout_batch_outcome(response)
+    if status == "sent":
+        batch_id = response.json()["batch_header"]["payout_batch_id"]
+        logger.info(f"Payout batch {batch_id} of {len(couriers)} couriers accepted.")
+        _finish_payroll_run(sender_batch_id, "sent", batch_id)
+        return "sent", batch_id, couriers
+    if status == "unknown":
+        logger.error(
+            f"Payout batch {sender_batch_id} may or may not have been accepted, check it in "
+            f"PayPal: {response.text}"
+        )
+        _finish_payroll_run(sender_batch_id, "unknown", "")
+        return "unknown", sender_batch_id, couriers
+    logger.error(f"Payout batch {sender_batch_id} rejected: {response.text}")
+    with unit_of_work():
+        pp_restore_courier_balances(couriers)
+        _finish_payroll_run(sender_batch_id, "rejected", "")
+    return "rejected", None, couriers
+
+
+def pp_payout_chunks(
+        couriers: List[Tuple[Any, ...]]
+) -> Tuple[List[List[Tuple[Any, ...]]], List[Tuple[Any, ...]]]:
+    """Split Couriers to be paid into payout batches of at most
+    PAYOUT_MAX_ITEMS. Couriers without PayPal ID or positive balance
+    can not be paid.
+
+    Args:
+        couriers: Arrays containing info about couriers and payment.
+
+    Returns:
+        Couriers of each batch and Couriers that can not be paid.
+
+    """
+    payable = []
+    rejected = []
+    for courier in couriers:
+        if courier[4] and courier[3] > 0:
+            payable.append(courier)
+        else:
+            logger.error(f"Courier {courier[0]} has no PayPal ID or nothing to be paid.")
+            rejected.append(courier)
+    chunks = [
+        payable[start:start + PAYOUT_MAX_ITEMS]
+        for start in range(0, len(payable), PAYOUT_MAX_ITEMS)
+    ]
+    return chunks, rejected
+
+
+def pp_couriers_payout_data(
+        couriers: List[Tuple[Any, ...]],
+        sender_batch_id: str
+) -> Dict[str, Any]:
+    """Build PayPal payout batch paying the Couriers their balances.
+
+    Args:
+        couriers: Arrays containing info about couriers and payment.
+        sender_batch_id: ID of the batch given by the service.
+
+    Returns:
+        JSON body of payout batch request.
+
+    """
+    return {
         "items": [
             {
                 "receiver": courier[4],
@@ -166,18 +626,158 @@ def pp_courier_payout(courier: Tuple[Any,...], curs: cursor) -> int:
                     "currency": "EUR",
                     "value": str(courier[3])
                 },
+                "sender_item_id": str(courier[0]),
                 "purpose": "SERVICES"
             }
+            for courier in couriers
         ],
         "sender_batch_header": {
+            "sender_batch_id": sender_batch_id,
             "recipient_type": "PAYPAL_ID"
         }
     }
-    response = requests.post(url, json=data, auth=(pp_username, pp_password))
+
+
+def pp_payout_batch_outcome(response: requests.Response) -> str:
+    """Tell from PayPal response to payout batch whether the batch was
+    accepted.
+
+    Args:
+        response: Response of PayPal to payout batch.
+
+    Returns:
+        "sent" if PayPal accepted the batch, "rejected" if it refused
+        it, "unknown" if it may have been accepted before.
+
+    """
     if response.status_code == 201:
+        return "sent"
+    if (response.status_code >= 500 or response.status_code == 429
+            or pp_is_duplicate_batch(response)):
+        return "unknown"
+    return "rejected"
+
+
+def pp_is_duplicate_batch(response: requests.Response) -> bool:
+    """Check if PayPal refused payout batch because a batch with its
+    sender batch ID was sent before, i.e. it has been paid already.
+
+    Args:
+        response: Response of PayPal to payout batch.
+
+    Returns:
+        True if the batch is a duplicate, False otherwise.
+
+    """
+    text = response.text.upper().replace(" ", "_")
+    return response.status_code < 500 and "SENDER_BATCH_ID" in text and "ALREADY_EXIST" in text
+
+
+def pp_deducted_couriers(
+        couriers: List[Tuple[Any, ...]],
+        deducted_ids: List[int]
+) -> List[Tuple[Any, ...]]:
+    """Keep Couriers whose balances have been deducted for the payout,
+    leaving out the ones paid out meanwhile.
+
+    Args:
+        couriers: Arrays containing info about couriers and payment.
+        deducted_ids: IDs of Couriers returned by the deduction.
+
+    Returns:
+        Couriers to be paid.
+
+    """
+    deducted_ids = set(deducted_ids)
+    for courier in couriers:
+        if courier[0] not in deducted_ids:
+            logger.warning(f"Balance of courier {courier[0]} was paid out meanwhile, skipped.")
+    return [courier for courier in couriers if courier[0] in deducted_ids]
+
+
+@cursor_decorator
+def _start_payroll_run(
+        couriers: List[Tuple[Any, ...]],
+        admin_id: int,
+        curs: cursor
+) -> Tuple[str, List[Tuple[Any, ...]]]:
+    sender_batch_id = f"payroll-{uuid.uuid4()}"
+    curs.execute(
+        DEDUCT_BALANCES_QUERY,
+        ([courier[0] for courier in couriers], [courier[3] for courier in couriers])
+    )
+    couriers = pp_deducted_couriers(couriers, [row[0] for row in curs.fetchall()])
+    if couriers:
         curs.execute(
-            "UPDATE couriers SET account_balance = 0.00 WHERE courier_id = %s",
-            (courier[0],)
+            START_PAYROLL_RUN_QUERY,
+            (
+                sender_batch_id,
+                admin_id,
+                [courier[0] for courier in couriers],
+                [courier[3] for courier in couriers],
+                PAYROLL_RUN_LEASE
+            )
         )
-    sleep(1)
-    return response.status_code
+    return sender_batch_id, couriers
+
+
+@cursor_decorator
+def _finish_payroll_run(
+        sender_batch_id: str,
+        status: str,
+        batch_id: str,
+        curs: cursor
+) -> None:
+    curs.execute(
+        FINISH_PAYROLL_RUN_QUERY,
+        (status, batch_id, PAYOUT_POLL_INTERVAL, sender_batch_id)
+    )
+
+
+@logger_decorator
+def pp_payout_batch_status(batch_id: str) -> Tuple[str, Dict[str, str]]:
+    """Get status of PayPal payout batch and of its items.
+
+    Args:
+        batch_id: PayPal payout batch ID.
+
+    Returns:
+        Batch status and item statuses by sender item IDs.
+
+    Raises:
+        requests.RequestException: If PayPal could not be reached or
+            returned an error.
+
+    """
+    batch_status = ""
+    items = {}
+    page = total_pages = 1
+    while page <= total_pages:
+        response = paypal_client.get(
+            f"/v1/payments/payouts/{batch_id}",
+            {"page": page, "page_size": PAYOUT_PAGE_SIZE, "total_required": "true"}
+        )
+        response.raise_for_status()
+        details = response.json()
+        batch_status = details["batch_header"]["batch_status"]
+        total_pages = details.get("total_page", 1)
+        for item in details.get("items", []):
+            items[item["payout_item"]["sender_item_id"]] = item["transaction_status"]
+        page += 1
+    return batch_status, items
+
+
+@cursor_decorator
+@logger_decorator
+def pp_restore_courier_balances(couriers: List[Tuple[Any, ...]], curs: cursor) -> None:
+    """Give amounts of failed payout items back to the Couriers.
+
+    Args:
+        couriers: Arrays containing info about couriers and payment.
+        curs: Cursor object from psycopg2 module.
+
+    """
+    curs.execute(
+        RESTORE_BALANCES_QUERY,
+        ([courier[0] for courier in couriers], [courier[3] for courier in couriers])
+    )
@@ -0,0 +1,425 @@
+import time
+import heapq
+import random
+import threading
+import dataclasses
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Container, Deque, Dict, List, Tuple, Type
+
+import requests
+from environs import Env
+from telebot.apihelper import ApiHTTPException, ApiTelegramException
+from urllib3.exceptions import NewConnectionError
+
+from tools.cursor_tool import on_commit
+from tools.logger_tool import logger
+
+env = Env()
+env.read_env()
+
+SEND_GLOBAL_RATE = env.float("SEND_GLOBAL_RATE", default=30.0)
+SEND_CHAT_RATE = env.float("SEND_CHAT_RATE", default=1.0)
+SEND_CHAT_BURST = env.int("SEND_CHAT_BURST", default=3)
+SEND_MAX_ATTEMPTS = env.int("SEND_MAX_ATTEMPTS", default=5)
+SEND_WORKERS = env.int("SEND_WORKERS", default=8)
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+PRUNE_INTERVAL = 60.0
+# Methods safe to repeat if Telegram may already have handled the call.
+IDEMPOTENT_PREFIXES = ("edit_", "delete_")
+
+
+@dataclasses.dataclass(slots=True)
+class Job:
+    method: Callable[..., Any]
+    args: Tuple[Any, ...]
+    kwargs: Dict[str, Any]
+    future: Future
+    attempts: int = 0
+    # Future of the call this one is made after only if it succeeded.
+    previous: Future | None = None
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """Get time until a token is available.
+
+        Args:
+            now: Current monotonic time.
+
+        Returns:
+            Seconds to wait, 0 if a token is available now.
+
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class RateLimits:
+    """Global and per-chat token buckets of the bots, keyed by pairs of
+    bot token and chat ID. Shared by SendQueue and the sender of the
+    asyncio runtime, which only differ in how they wait.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._chat_buckets: Dict[Tuple[str, int | str], TokenBucket] = {}
+        self._bot_buckets: Dict[str, TokenBucket] = {}
+        self._pruned = time.monotonic()
+
+    def delay(self, key: Tuple[str, int | str], now: float) -> float:
+        """Get time until a call to the chat is allowed by both limits.
+
+        Args:
+            key: Bot token and chat ID.
+            now: Current monotonic time.
+
+        Returns:
+            Seconds to wait, 0 if the call can be made now.
+
+        """
+        bot_bucket = self._bot_buckets.setdefault(
+            key[0],
+            TokenBucket(self.global_rate, self.global_rate)
+        )
+        chat_bucket = self._chat_buckets.setdefault(
+            key,
+            TokenBucket(self.chat_rate, self.chat_burst)
+        )
+        return max(bot_bucket.delay(now), chat_bucket.delay(now))
+
+    def take(self, key: Tuple[str, int | str]) -> None:
+        """Count a call to the chat against both limits. Must follow
+        delay() of the key.
+
+        Args:
+            key: Bot token and chat ID.
+
+        """
+        self._bot_buckets[key[0]].take()
+        self._chat_buckets[key].take()
+
+    def prune(self, now: float, active: Container[Tuple[str, int | str]]) -> None:
+        """Forget full buckets of chats without calls waiting, at most
+        once per PRUNE_INTERVAL.
+
+        Args:
+            now: Current monotonic time.
+            active: Keys of chats with calls waiting.
+
+        """
+        if now - self._pruned <= PRUNE_INTERVAL:
+            return None
+        self._pruned = now
+        for key, bucket in list(self._chat_buckets.items()):
+            bucket.delay(now)
+            if key not in active and bucket.tokens >= bucket.capacity:
+                del self._chat_buckets[key]
+
+
+class RetryPolicy:
+    """Decide whether a failed bot API call is repeated, and when. Both
+    runtimes use it with exception types of their own bot API clients:
+    the error Telegram answers with, errors of calls that never reached
+    Telegram, looked for among causes of the error as well, and errors
+    of calls whose response was lost.
+    """
+
+    def __init__(
+            self,
+            telegram_error: Type[Exception],
+            not_sent: Tuple[Type[Exception], ...],
+            maybe_sent: Tuple[Type[Exception], ...]
+    ):
+        self.telegram_error = telegram_error
+        self.not_sent = not_sent
+        self.maybe_sent = maybe_sent
+
+    def is_rate_limit(self, error: Exception) -> bool:
+        return isinstance(error, self.telegram_error) and error.error_code == 429
+
+    def delay(self, error: Exception, method_name: str, attempts: int) -> float | None:
+        """Get time to wait before repeating the call.
+
+        Args:
+            error: Error the call failed with.
+            method_name: Name of the bot method called.
+            attempts: Number of attempts made so far.
+
+        Returns:
+            Seconds to wait, or None if the call must not be repeated.
+
+        """
+        # A send whose response was lost may have been delivered, so it
+        # is only retried when the request never reached Telegram.
+        idempotent = method_name.startswith(IDEMPOTENT_PREFIXES)
+        if self.is_rate_limit(error):
+            return error.result_json.get("parameters", {}).get("retry_after", 1)
+        if isinstance(error, self.telegram_error):
+            return self.backoff(attempts) if error.error_code >= 500 and idempotent else None
+        if self._caused_by(error, self.not_sent):
+            return self.backoff(attempts)
+        if isinstance(error, self.maybe_sent) and idempotent:
+            return self.backoff(attempts)
+        return None
+
+    @staticmethod
+    def backoff(attempts: int) -> float:
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempts)
+        return round(delay * random.uniform(0.5, 1), 2)
+
+    @staticmethod
+    def _caused_by(error: BaseException, types: Tuple[Type[Exception], ...]) -> bool:
+        # Clients wrap errors of the connection, e.g. requests keeps the
+        # one of urllib3 as reason of the error it raises.
+        pending = [error]
+        seen = set()
+        while pending:
+            if (error := pending.pop()) is None or id(error) in seen:
+                continue
+            if isinstance(error, types):
+                return True
+            seen.add(id(error))
+            reason = getattr(error, "reason", None)
+            pending.extend((
+                error.__cause__,
+                error.__context__,
+                reason if isinstance(reason, BaseException) else None
+            ))
+        return False
+
+
+# Any other connection error may come after the request was sent, e.g.
+# when the connection is reset while waiting for the response.
+retry_policy = RetryPolicy(
+    ApiTelegramException,
+    (requests.ConnectTimeout, NewConnectionError),
+    (ApiHTTPException, requests.Timeout, requests.ConnectionError)
+)
+
+
+class SendQueue:
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, workers: int):
+        self.workers = workers
+        self._limits = RateLimits(global_rate, chat_rate, chat_burst)
+        self._lock = threading.Condition()
+        self._chats: Dict[Tuple[str, int | str], Deque[Job]] = {}
+        self._ready: List[Tuple[float, int, Tuple[str, int | str]]] = []
+        self._sequence = 0
+        self._executor: ThreadPoolExecutor | None = None
+        self._sent = 0
+        self._retries = 0
+        self._failures = 0
+        self._rate_limited = 0
+        self._reports = 0
+        self._report_time_max = 0.0
+
+    def send(self, method: Callable[..., Any], chat_id: int | str, *args, **kwargs) -> Future:
+        """Queue call of bot API method to given chat. Calls to one chat
+        are made in the order they were queued, within global and
+        per-chat rate limits of the bot. Calls queued inside a unit of
+        work are queued once it commits and dropped if it rolls back.
+
+        Args:
+            method: Bound bot method, e.g. rest_bot.send_message.
+            chat_id: Telegram chat ID, first argument of the method.
+            *args: Other positional arguments of the method.
+            **kwargs: Keyword arguments of the method.
+
+        Returns:
+            Future resolving to the method result.
+
+        """
+        future = Future()
+        on_commit(
+            self._enqueue,
+            (method.__self__.token, chat_id),
+            Job(method, (chat_id, *args), kwargs, future)
+        )
+        return future
+
+    def send_chain(
+            self,
+            chat_id: int | str,
+            calls: List[Tuple[Callable[..., Any], Tuple[Any, ...], Dict[str, Any]]]
+    ) -> Future:
+        """Queue calls of bot API methods of one bot to given chat, made
+        one after another as send() makes them, but each only if the
+        ones before it succeeded. Used for messages which make sense
+        only all together.
+
+        Args:
+            chat_id: Telegram chat ID, first argument of every method.
+            calls: Bound bot methods with their other positional and
+                keyword arguments, in the order to call them.
+
+        Returns:
+            Future resolving to the result of the last call, or to the
+            error of the first call that failed.
+
+        """
+        jobs = []
+        previous = None
+        for method, args, kwargs in calls:
+            jobs.append(Job(method, (chat_id, *args), kwargs, Future(), previous=previous))
+            previous = jobs[-1].future
+        on_commit(self._enqueue_chain, chat_id, jobs)
+        return previous
+
+    def stats(self) -> Dict[str, Any]:
+        """Get queue usage metrics.
+
+        Returns:
+            Numbers of queued calls and chats waiting, counters of sent,
+            retried and failed calls and of rate limit responses.
+
+        """
+        with self._lock:
+            return {
+                "queued": sum(len(jobs) for jobs in self._chats.values()),
+                "chats": len(self._chats),
+                "sent": self._sent,
+                "retries": self._retries,
+                "failures": self._failures,
+                "rate_limited": self._rate_limited,
+                "reports": self._reports,
+                "report_time_max": round(self._report_time_max, 4)
+            }
+
+    def report(self, name: str, futures: List[Future]) -> None:
+        """Log how long queued calls took and how many of them failed,
+        once all of them are done. Does not block.
+
+        Args:
+            name: Description of the calls for the log record.
+            futures: Futures of queued calls.
+
+        """
+        if not futures:
+            return None
+        started = time.monotonic()
+        pending = [len(futures)]
+        pending_lock = threading.Lock()
+
+        def done(_: Future) -> None:
+            with pending_lock:
+                pending[0] -= 1
+                if pending[0]:
+                    return None
+            elapsed = time.monotonic() - started
+            failed = sum(1 for future in futures if future.exception())
+            with self._lock:
+                self._reports += 1
+                self._report_time_max = max(self._report_time_max, elapsed)
+            logger.info(f"{name}: {len(futures)} calls, {failed} failed, done in {elapsed:.3f} s.")
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    def _enqueue(self, key: Tuple[str, int | str], job: Job) -> None:
+        with self._lock:
+            self._start()
+            self._chats.setdefault(key, deque()).append(job)
+            if len(self._chats[key]) == 1:
+                self._schedule(key, time.monotonic())
+
+    def _enqueue_chain(self, chat_id: int | str, jobs: List[Job]) -> None:
+        with self._lock:
+            for job in jobs:
+                self._enqueue((job.method.__self__.token, chat_id), job)
+
+    def _start(self) -> None:
+        if self._executor:
+            return None
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="send-queue")
+        threading.Thread(target=self._scheduler, name="send-queue-scheduler", daemon=True).start()
+
+    def _schedule(self, key: Tuple[str, int | str], at: float) -> None:
+        self._sequence += 1
+        heapq.heappush(self._ready, (at, self._sequence, key))
+        self._lock.notify()
+
+    def _scheduler(self) -> None:
+        while True:
+            with self._lock:
+                while True:
+                    now = time.monotonic()
+                    self._limits.prune(now, self._chats)
+                    if not self._ready:
+                        self._lock.wait(PRUNE_INTERVAL)
+                        continue
+                    at, _, key = self._ready[0]
+                    if at > now:
+                        self._lock.wait(at - now)
+                        continue
+                    if delay := self._limits.delay(key, now):
+                        heapq.heapreplace(self._ready, (now + delay, self._sequence, key))
+                        self._sequence += 1
+                        continue
+                    heapq.heappop(self._ready)
+                    self._limits.take(key)
+                    job = self._chats[key][0]
+                    break
+            self._executor.submit(self._call, key, job)
+
+    def _call(self, key: Tuple[str, int | str], job: Job) -> None:
+        job.attempts += 1
+        try:
+            result = job.method(*job.args, **job.kwargs)
+        except Exception as error:
+            if retry_policy.is_rate_limit(error):
+                with self._lock:
+                    self._rate_limited += 1
+            self._finish(
+                key,
+                job,
+                error,
+                retry_policy.delay(error, job.method.__name__, job.attempts)
+            )
+        else:
+            with self._lock:
+                self._sent += 1
+            job.future.set_result(result)
+            self._finish(key, job, None, None)
+
+    def _finish(
+            self,
+            key: Tuple[str, int | str],
+            job: Job,
+            error: Exception | None,
+            retry_in: float | None
+    ) -> None:
+        with self._lock:
+            if error and retry_in is not None and job.attempts < SEND_MAX_ATTEMPTS:
+                self._retries += 1
+                logger.info(f"Retrying {job.method.__name__} to {key[1]} in {retry_in} s: {error}")
+                self._schedule(key, time.monotonic() + retry_in)
+                return None
+            jobs = self._chats[key]
+            jobs.popleft()
+            skipped = []
+            while error and jobs and jobs[0].previous in (job.future, *skipped):
+                skipped.append(jobs.popleft().future)
+            if jobs:
+                self._schedule(key, time.monotonic())
+            else:
+                del self._chats[key]
+            if error:
+                self._failures += 1
+        if error:
+            logger.error(f"Failed to call {job.method.__name__} to {key[1]}: {error}")
+            for future in (job.future, *skipped):
+                future.set_exception(error)
@@ -0,0 +1,59 @@
+import sys
+import json
+import statistics
+import subprocess
+from typing import Dict, List
+
+from tools.launcher import BASE_DIR, BOT_APPS
+
+RUNS = 5
+# Runs in a fresh interpreter, so nothing is imported beforehand.
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from tools.launcher import load_bot
+from tools.chat_dispatcher import ChatDispatcher
+bot = load_bot(sys.argv[1])
+imported = time.perf_counter()
+ChatDispatcher.install(bot, sys.argv[1]).close()
+print(json.dumps({"import": imported - started, "ready": time.perf_counter() - started}))
+"""
+
+
+def measure(name: str, runs: int = RUNS) -> Dict[str, float]:
+    """Measure how long a cold start of the bot takes until it is ready
+    to poll for updates. Needs the same environment as the bot itself,
+    no connections are made.
+
+    Args:
+        name: Bot name, one of BOT_APPS.
+        runs: Number of interpreter starts to take median of.
+
+    Returns:
+        Median seconds spent on importing the bot and on getting it
+        ready to handle updates.
+
+    """
+    results: List[Dict[str, float]] = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, name],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    return {
+        key: round(statistics.median(result[key] for result in results), 4)
+        for key in ("import", "ready")
+    }
+
+
+def main(names: List[str]) -> None:
+    for name in names:
+        print(f"{name}: {measure(name)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or list(BOT_APPS))
@@ -0,0 +1,146 @@
+import time
+import threading
+from typing import Any, Dict, Tuple
+
+import requests
+from environs import Env
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+from urllib3.util.retry import Retry
+
+from tools import metrics
+
+env = Env()
+env.read_env()
+
+TG_POOL_SIZE = env.int("TG_POOL_SIZE", default=32)
+TG_CONNECT_TIMEOUT = env.float("TG_CONNECT_TIMEOUT", default=5.0)
+TG_READ_TIMEOUT = env.float("TG_READ_TIMEOUT", default=10.0)
+TG_UPLOAD_TIMEOUT = env.float("TG_UPLOAD_TIMEOUT", default=60.0)
+LONG_POLLING_METHOD = "getUpdates"
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+_latencies: Dict[str, metrics.Histogram] = {}
+_errors: Dict[str, int] = {}
+
+
+def get_session() -> requests.Session:
+    """Get HTTP session shared by all bots of the process, creating it
+    on first call. Connections to the Bot API are kept alive and reused
+    by all threads instead of one session per thread.
+
+    Returns:
+        Shared session.
+
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Only failed connection attempts are retried: a request that
+                # may have reached Telegram could send a message twice.
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=TG_POOL_SIZE,
+                    max_retries=Retry(total=1, connect=1, read=0, redirect=0, status=0, other=0)
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def get_timeout(
+        method_name: str,
+        files: Any,
+        timeout: Tuple[float, float]
+) -> Tuple[float, float]:
+    """Choose connect and read timeouts for Bot API call.
+
+    Args:
+        method_name: Bot API method name, e.g. "sendMessage".
+        files: Files sent with the call, if any.
+        timeout: Timeouts set by telebot, either its defaults, long
+            polling timeout or explicitly passed by the caller.
+
+    Returns:
+        Connect and read timeouts in seconds.
+
+    """
+    if method_name == LONG_POLLING_METHOD:
+        return TG_CONNECT_TIMEOUT, timeout[1]
+    if timeout != (apihelper.CONNECT_TIMEOUT, apihelper.READ_TIMEOUT):
+        return timeout
+    return TG_CONNECT_TIMEOUT, TG_UPLOAD_TIMEOUT if files else TG_READ_TIMEOUT
+
+
+def send_request(
+        method: str,
+        url: str,
+        params: Dict[str, Any] | None = None,
+        files: Any = None,
+        timeout: Tuple[float, float] = (TG_CONNECT_TIMEOUT, TG_READ_TIMEOUT),
+        proxies: Dict[str, str] | None = None
+) -> requests.Response:
+    """Send Bot API request through the shared session and record its
+    latency. Used by telebot as its custom request sender.
+
+    Args:
+        method: HTTP method.
+        url: Bot API method URL.
+        params: Query parameters.
+        files: Files to upload.
+        timeout: Connect and read timeouts set by telebot.
+        proxies: Proxies set in telebot.
+
+    Returns:
+        Response of the Bot API.
+
+    """
+    method_name = url.rsplit("/", 1)[-1]
+    started = time.monotonic()
+    try:
+        return get_session().request(
+            method,
+            url,
+            params=params,
+            files=files,
+            timeout=get_timeout(method_name, files, timeout),
+            proxies=proxies
+        )
+    except requests.RequestException:
+        with _session_lock:
+            _errors[method_name] = _errors.get(method_name, 0) + 1
+        raise
+    finally:
+        if method_name != LONG_POLLING_METHOD:
+            if method_name not in _latencies:
+                with _session_lock:
+                    _latencies.setdefault(method_name, metrics.Histogram())
+            _latencies[method_name].observe(time.monotonic() - started)
+
+
+def stats() -> Dict[str, Any]:
+    """Get Bot API call metrics.
+
+    Returns:
+        Latency histogram and number of failed requests per method.
+
+    """
+    with _session_lock:
+        errors = dict(_errors)
+        latencies = dict(_latencies)
+    return {
+        method_name: {**histogram.stats(), "errors": errors.get(method_name, 0)}
+        for method_name, histogram in sorted(latencies.items())
+    }
+
+
+def install() -> None:
+    """Make telebot send all Bot API requests of the process through
+    the shared session.
+    """
+    apihelper.CUSTOM_REQUEST_SENDER = send_request
+    metrics.register("telegram_api", stats)
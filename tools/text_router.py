@@ -0,0 +1,88 @@
+from typing import Any, Callable, Dict, NamedTuple
+
+import telebot as tb
+import telebot.types as types
+
+
+class Route(NamedTuple):
+    handler: Callable[[types.Message], Any]
+    order: int
+
+
+class TextRouter:
+    def __init__(self, texts: Dict[str, Dict[str, Any]]):
+        self.texts = texts
+        self._text_routes: Dict[str, Route] = {}
+        self._reply_routes: Dict[str, Route] = {}
+        self._order = 0
+
+    def text(self, key: str):
+        """Route messages equal to given localized text in any language
+        to decorated handler.
+
+        Args:
+            key: Key of the text in translations, e.g. "OPTIONS_BTN".
+
+        """
+        return self._route(self._text_routes, key)
+
+    def reply(self, key: str):
+        """Route replies to the bot message with given localized text in
+        any language to decorated handler.
+
+        Args:
+            key: Key of the text in translations, e.g. "REG_NAME_MSG".
+
+        """
+        return self._route(self._reply_routes, key)
+
+    def route(self, message: types.Message) -> Route | None:
+        """Find route of the message. If both its text and the message
+        it replies to have routes, the one registered first wins, same
+        as with separately registered message handlers.
+
+        Args:
+            message: Message from user.
+
+        Returns:
+            Route of the message if there is one, otherwise None.
+
+        """
+        text_route = self._text_routes.get(message.text) if message.text else None
+        reply_route = None
+        if message.reply_to_message and message.reply_to_message.text:
+            reply_route = self._reply_routes.get(message.reply_to_message.text)
+        if text_route and reply_route:
+            return min(text_route, reply_route, key=lambda route: route.order)
+        return text_route or reply_route
+
+    def dispatch(self, message: types.Message) -> None:
+        """Pass message to the handler of its route.
+
+        Args:
+            message: Message from user.
+
+        """
+        if route := self.route(message):
+            route.handler(message)
+
+    def register(self, bot: tb.TeleBot) -> None:
+        """Register the router as a single message handler of the bot.
+
+        Args:
+            bot: Bot to register the router with.
+
+        """
+        bot.register_message_handler(
+            self.dispatch,
+            func=lambda message: self.route(message) is not None
+        )
+
+    def _route(self, routes: Dict[str, Route], key: str):
+        def decorator(func):
+            for lang_texts in self.texts.values():
+                routes.setdefault(lang_texts[key], Route(func, self._order))
+            self._order += 1
+            return func
+
+        return decorator